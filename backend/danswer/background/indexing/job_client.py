@@ -72,8 +72,11 @@ class SimpleJob:
 class SimpleJobClient:
     """Drop in replacement for `dask.distributed.Client`"""
 
-    def __init__(self, n_workers: int = 1) -> None:
+    def __init__(self, n_workers: int = 1, daemon_workers: bool = True) -> None:
         self.n_workers = n_workers
+        # daemon processes are killed along with this process, but can't start processes
+        # of their own
+        self.daemon_workers = daemon_workers
         self.job_id_counter = 0
         self.jobs: dict[int, SimpleJob] = {}
 
@@ -95,7 +98,9 @@ class SimpleJobClient:
         job_id = self.job_id_counter
         self.job_id_counter += 1
 
-        process = multiprocessing.Process(target=func, args=args, daemon=True)
+        process = multiprocessing.Process(
+            target=func, args=args, daemon=self.daemon_workers
+        )
         job = SimpleJob(id=job_id, process=process)
         process.start()
 
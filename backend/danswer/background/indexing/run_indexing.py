@@ -1,4 +1,5 @@
 import time
+from collections.abc import Generator
 from datetime import datetime
 from datetime import timezone
 
@@ -6,10 +7,12 @@ import torch
 from sqlalchemy.orm import Session
 
 from danswer.background.indexing.checkpointing import get_time_windows_for_index_attempt
+from danswer.configs.app_configs import PIPELINED_INDEXING_ENABLED
 from danswer.connectors.factory import instantiate_connector
 from danswer.connectors.interfaces import GenerateDocumentsOutput
 from danswer.connectors.interfaces import LoadConnector
 from danswer.connectors.interfaces import PollConnector
+from danswer.connectors.models import Document
 from danswer.connectors.models import IndexAttemptMetadata
 from danswer.connectors.models import InputType
 from danswer.db.connector import disable_connector
@@ -24,7 +27,9 @@ from danswer.db.index_attempt import mark_attempt_succeeded
 from danswer.db.index_attempt import update_docs_indexed
 from danswer.db.models import IndexAttempt
 from danswer.db.models import IndexingStatus
+from danswer.indexing.chunker import get_default_chunker
 from danswer.indexing.indexing_pipeline import build_indexing_pipeline
+from danswer.indexing.indexing_pipeline import run_pipelined_indexing
 from danswer.utils.logger import IndexAttemptSingleton
 from danswer.utils.logger import setup_logger
 
@@ -83,11 +88,14 @@ def _get_document_generator(
 def _run_indexing(
     db_session: Session,
     index_attempt: IndexAttempt,
+    pipelined_indexing: bool = PIPELINED_INDEXING_ENABLED,
 ) -> None:
     """
     1. Get documents which are either new or updated from specified application
     2. Embed and index these documents into the chosen datastore (vespa)
     3. Updates Postgres to record the indexed documents + the outcome of this run
+
+    With `pipelined_indexing`, steps 1 and 2 overlap across batches, see `run_pipelined_indexing`
     """
     start_time = time.time()
 
@@ -100,7 +108,8 @@ def _run_indexing(
         attempt_status=IndexingStatus.IN_PROGRESS,
     )
 
-    indexing_pipeline = build_indexing_pipeline()
+    chunker = get_default_chunker()
+    indexing_pipeline = build_indexing_pipeline(chunker=chunker)
     db_connector = index_attempt.connector
     db_credential = index_attempt.credential
     last_successful_index_time = get_last_successful_attempt_time(
@@ -109,6 +118,34 @@ def _run_indexing(
         db_session=db_session,
     )
 
+    index_attempt_metadata = IndexAttemptMetadata(
+        connector_id=db_connector.id,
+        credential_id=db_credential.id,
+    )
+
+    def _check_connector_disabled() -> None:
+        # check if connector is disabled mid run and stop if so
+        db_session.refresh(db_connector)
+        if db_connector.disabled:
+            # let the `except` block handle this
+            raise RuntimeError("Connector was disabled mid run")
+
+    def _index_batches_sequentially(
+        doc_batch_generator: GenerateDocumentsOutput,
+    ) -> Generator[tuple[list[Document], int, int], None, None]:
+        for doc_batch in doc_batch_generator:
+            _check_connector_disabled()
+
+            logger.debug(
+                f"Indexing batch of documents: {[doc.to_short_descriptor() for doc in doc_batch]}"
+            )
+
+            new_docs, total_batch_chunks = indexing_pipeline(
+                documents=doc_batch,
+                index_attempt_metadata=index_attempt_metadata,
+            )
+            yield doc_batch, new_docs, total_batch_chunks
+
     net_doc_change = 0
     document_count = 0
     chunk_count = 0
@@ -128,25 +165,23 @@ def _run_indexing(
             end_time=window_end,
         )
 
+        indexed_batches = (
+            run_pipelined_indexing(
+                doc_batches=doc_batch_generator,
+                chunker=chunker,
+                index_attempt_metadata=index_attempt_metadata,
+            )
+            if pipelined_indexing
+            else _index_batches_sequentially(doc_batch_generator)
+        )
+
         try:
-            for doc_batch in doc_batch_generator:
-                # check if connector is disabled mid run and stop if so
-                db_session.refresh(db_connector)
-                if db_connector.disabled:
-                    # let the `except` block handle this
-                    raise RuntimeError("Connector was disabled mid run")
-
-                logger.debug(
-                    f"Indexing batch of documents: {[doc.to_short_descriptor() for doc in doc_batch]}"
-                )
+            for doc_batch, new_docs, total_batch_chunks in indexed_batches:
+                if pipelined_indexing:
+                    # later batches are already being fetched / embedded, the check
+                    # can only stop the run from here on
+                    _check_connector_disabled()
 
-                new_docs, total_batch_chunks = indexing_pipeline(
-                    documents=doc_batch,
-                    index_attempt_metadata=IndexAttemptMetadata(
-                        connector_id=db_connector.id,
-                        credential_id=db_credential.id,
-                    ),
-                )
                 net_doc_change += new_docs
                 chunk_count += total_batch_chunks
                 document_count += len(doc_batch)
@@ -176,6 +211,8 @@ def _run_indexing(
                 run_dt=run_end_dt,
             )
         except Exception as e:
+            # stops the pipeline stages which may still be working on later batches
+            indexed_batches.close()
             logger.info(
                 f"Connector run ran into exception after elapsed time: {time.time() - start_time} seconds"
             )
@@ -14,6 +14,7 @@ from danswer.background.indexing.job_client import SimpleJob
 from danswer.background.indexing.job_client import SimpleJobClient
 from danswer.background.indexing.run_indexing import run_indexing_entrypoint
 from danswer.configs.app_configs import DASK_JOB_CLIENT_ENABLED
+from danswer.configs.app_configs import INDEXING_CHUNKING_PROCESSES
 from danswer.configs.app_configs import LOG_LEVEL
 from danswer.configs.app_configs import MODEL_SERVER_HOST
 from danswer.configs.app_configs import NUM_INDEXING_WORKERS
@@ -286,6 +287,10 @@ def kickoff_indexing_jobs(
 def update_loop(delay: int = 10, num_workers: int = NUM_INDEXING_WORKERS) -> None:
     client: Client | SimpleJobClient
     if DASK_JOB_CLIENT_ENABLED:
+        if INDEXING_CHUNKING_PROCESSES > 0:
+            # Dask worker processes are daemonic by default, which does not allow the
+            # indexing jobs to start their pool of chunking processes
+            dask.config.set({"distributed.worker.daemon": False})
         cluster = LocalCluster(
             n_workers=num_workers,
             threads_per_worker=1,
@@ -299,7 +304,11 @@ def update_loop(delay: int = 10, num_workers: int = NUM_INDEXING_WORKERS) -> Non
         if LOG_LEVEL.lower() == "debug":
             client.register_worker_plugin(ResourceLogger())
     else:
-        client = SimpleJobClient(n_workers=num_workers)
+        client = SimpleJobClient(
+            n_workers=num_workers,
+            # indexing jobs need to start their own pool of chunking processes
+            daemon_workers=INDEXING_CHUNKING_PROCESSES == 0,
+        )
 
     existing_jobs: dict[int, Future | SimpleJob] = {}
     engine = get_sqlalchemy_engine()
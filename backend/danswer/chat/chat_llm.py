@@ -1,4 +1,3 @@
-import re
 from collections.abc import Callable
 from collections.abc import Iterator
 
@@ -45,8 +44,10 @@ from danswer.search.search_runner import chunks_to_search_docs
 from danswer.search.search_runner import full_chunk_search
 from danswer.server.chat.models import RetrievalDocs
 from danswer.utils.logger import setup_logger
+from danswer.utils.stream_parsing import CitationStream
+from danswer.utils.stream_parsing import JsonStringValueStream
+from danswer.utils.stream_parsing import StreamPatternMatcher
 from danswer.utils.text_processing import extract_embedded_json
-from danswer.utils.text_processing import has_unescaped_quote
 
 logger = setup_logger()
 
@@ -57,39 +58,25 @@ LLM_CHAT_FAILURE_MSG = "The large-language-model failed to generate a valid resp
 def _parse_embedded_json_streamed_response(
     tokens: Iterator[str],
 ) -> Iterator[DanswerAnswerPiece | DanswerChatModelOut]:
-    final_answer = False
-    just_start_stream = False
-    model_output = ""
-    hold = ""
-    finding_end = 0
+    final_answer_stream = JsonStringValueStream(
+        start=StreamPatternMatcher(
+            '"actioninput":"', ignored_chars=" _", case_insensitive=True
+        ),
+        conditions=[
+            StreamPatternMatcher(
+                '"action":"finalanswer",', ignored_chars=" ", case_insensitive=True
+            )
+        ],
+    )
+    model_output_tokens: list[str] = []
     for token in tokens:
-        model_output += token
-        hold += token
-
-        if (
-            final_answer is False
-            and '"action":"finalanswer",' in model_output.lower().replace(" ", "")
-        ):
-            final_answer = True
+        model_output_tokens.append(token)
 
-        if final_answer and '"actioninput":"' in model_output.lower().replace(
-            " ", ""
-        ).replace("_", ""):
-            if not just_start_stream:
-                just_start_stream = True
-                hold = ""
-
-            if has_unescaped_quote(hold):
-                finding_end += 1
-                hold = hold[: hold.find('"')]
-
-            if finding_end <= 1:
-                if finding_end == 1:
-                    finding_end += 1
-
-                yield DanswerAnswerPiece(answer_piece=hold)
-                hold = ""
+        answer_piece = final_answer_stream.feed(token)
+        if answer_piece:
+            yield DanswerAnswerPiece(answer_piece=answer_piece)
 
+    model_output = "".join(model_output_tokens)
     model_final = extract_embedded_json(model_output)
     if "action" not in model_final or "action_input" not in model_final:
         raise ValueError("Model did not provide all required action values")
@@ -200,52 +187,15 @@ def extract_citations_from_stream(
         yield from tokens
         return
 
-    max_citation_num = len(links) + 1  # LLM is prompted to 1 index these
-    curr_segment = ""
-    prepend_bracket = False
+    citation_stream = CitationStream(links)
     for token in tokens:
-        # Special case of [1][ where ][ is a single token
-        if prepend_bracket:
-            curr_segment += "[" + curr_segment
-            prepend_bracket = False
-
-        curr_segment += token
-
-        possible_citation_pattern = r"(\[\d*$)"  # [1, [, etc
-        possible_citation_found = re.search(possible_citation_pattern, curr_segment)
-
-        citation_pattern = r"\[(\d+)\]"  # [1], [2] etc
-        citation_found = re.search(citation_pattern, curr_segment)
-
-        if citation_found:
-            numerical_value = int(citation_found.group(1))
-            if 1 <= numerical_value <= max_citation_num:
-                link = links[numerical_value - 1]
-                if link:
-                    curr_segment = re.sub(r"\[", "[[", curr_segment, count=1)
-                    curr_segment = re.sub("]", f"]]({link})", curr_segment, count=1)
-
-                # In case there's another open bracket like [1][, don't want to match this
-            possible_citation_found = None
-
-        # if we see "[", but haven't seen the right side, hold back - this may be a
-        # citation that needs to be replaced with a link
-        if possible_citation_found:
-            continue
-
-        # Special case with back to back citations [1][2]
-        if curr_segment and curr_segment[-1] == "[":
-            curr_segment = curr_segment[:-1]
-            prepend_bracket = True
-
-        yield curr_segment
-        curr_segment = ""
-
-    if curr_segment:
-        if prepend_bracket:
-            yield "[" + curr_segment
-        else:
-            yield curr_segment
+        segment = citation_stream.feed(token)
+        if segment:
+            yield segment
+
+    remaining = citation_stream.flush()
+    if remaining:
+        yield remaining
 
 
 def llm_contextless_chat_answer(
@@ -2,6 +2,7 @@ import os
 
 from danswer.configs.constants import AuthType
 from danswer.configs.constants import DocumentIndexType
+from danswer.configs.constants import EmbeddingCellType
 
 
 #####
@@ -93,6 +94,51 @@ VESPA_TENANT_PORT = os.environ.get("VESPA_TENANT_PORT") or "19071"
 VESPA_DEPLOYMENT_ZIP = (
     os.environ.get("VESPA_DEPLOYMENT_ZIP") or "/app/danswer/vespa-app.zip"
 )
+# Vespa doesn't allow batching of inserts / updates / deletes, so these are sent concurrently
+# over a pool of keep-alive connections. The number of operations in flight is halved whenever
+# Vespa signals backpressure (429 / 503) and slowly grows back up to the max
+VESPA_FEED_MAX_IN_FLIGHT = int(os.environ.get("VESPA_FEED_MAX_IN_FLIGHT") or 32)
+VESPA_FEED_MIN_IN_FLIGHT = int(os.environ.get("VESPA_FEED_MIN_IN_FLIGHT") or 2)
+VESPA_FEED_MAX_RETRIES = int(os.environ.get("VESPA_FEED_MAX_RETRIES") or 5)
+# The read timeout should stay above the timeout passed to Vespa with the chunk lookups (10s)
+VESPA_FEED_CONNECT_TIMEOUT = float(os.environ.get("VESPA_FEED_CONNECT_TIMEOUT") or 5)
+VESPA_FEED_READ_TIMEOUT = float(os.environ.get("VESPA_FEED_READ_TIMEOUT") or 30)
+# Search queries go over their own pool of keep-alive connections. The read timeout should stay
+# above the timeout passed to Vespa with each query (3s) so that Vespa gets to answer first
+VESPA_QUERY_POOL_SIZE = int(os.environ.get("VESPA_QUERY_POOL_SIZE") or 16)
+VESPA_QUERY_CONNECT_TIMEOUT = float(os.environ.get("VESPA_QUERY_CONNECT_TIMEOUT") or 2)
+VESPA_QUERY_READ_TIMEOUT = float(os.environ.get("VESPA_QUERY_READ_TIMEOUT") or 10)
+# After this many failed queries in a row (connection errors, timeouts, 5xx), queries fail fast
+# without reaching Vespa for the cooldown. Then a single query is let through to check on Vespa
+VESPA_QUERY_CIRCUIT_BREAKER_FAILURES = int(
+    os.environ.get("VESPA_QUERY_CIRCUIT_BREAKER_FAILURES") or 5
+)
+VESPA_QUERY_CIRCUIT_BREAKER_COOLDOWN = float(
+    os.environ.get("VESPA_QUERY_CIRCUIT_BREAKER_COOLDOWN") or 30
+)
+# HNSW graph built over the chunk embeddings for approximate nearest neighbor search. These are
+# written into the schema when the Vespa app is deployed, changing them requires a restart of
+# the Vespa content node (the graph is rebuilt on startup), not a re-index
+VESPA_HNSW_MAX_LINKS_PER_NODE = int(
+    os.environ.get("VESPA_HNSW_MAX_LINKS_PER_NODE") or 16
+)
+VESPA_HNSW_NEIGHBORS_TO_EXPLORE_AT_INSERT = int(
+    os.environ.get("VESPA_HNSW_NEIGHBORS_TO_EXPLORE_AT_INSERT") or 200
+)
+# Storing the chunk embeddings as bfloat16 halves their memory on the Vespa content nodes, int8
+# quarters it, at a small cost in recall. Changing it on an existing index is a tensor type
+# change in Vespa, which needs a validation override and all the documents to be re-indexed
+VESPA_EMBEDDING_CELL_TYPE = EmbeddingCellType(
+    os.environ.get("VESPA_EMBEDDING_CELL_TYPE") or EmbeddingCellType.FLOAT.value
+)
+# Per query, set to false to force an exact (brute force) nearest neighbor search
+VESPA_APPROXIMATE_NEAREST_NEIGHBOR = (
+    os.environ.get("VESPA_APPROXIMATE_NEAREST_NEIGHBOR", "").lower() != "false"
+)
+# Explores this many extra candidates in the graph per query, trades latency for recall
+VESPA_HNSW_EXPLORE_ADDITIONAL_HITS = int(
+    os.environ.get("VESPA_HNSW_EXPLORE_ADDITIONAL_HITS") or 0
+)
 # Number of documents in a batch during indexing (further batching done by chunks before passing to bi-encoder)
 INDEX_BATCH_SIZE = 16
 
@@ -162,6 +208,28 @@ CONTINUE_ON_CONNECTOR_FAILURE = os.environ.get(
 # fairly large amount of memory in order to increase substantially, since
 # each worker loads the embedding models into memory.
 NUM_INDEXING_WORKERS = int(os.environ.get("NUM_INDEXING_WORKERS") or 1)
+# Overlaps connector fetching, chunking + embedding and writing to the document index for
+# background indexing runs instead of handling one batch at a time end to end.
+# Each stage hands off to the next via a queue holding at most PIPELINED_INDEXING_QUEUE_SIZE batches
+PIPELINED_INDEXING_ENABLED = (
+    os.environ.get("PIPELINED_INDEXING_ENABLED", "").lower() == "true"
+)
+PIPELINED_INDEXING_QUEUE_SIZE = int(
+    os.environ.get("PIPELINED_INDEXING_QUEUE_SIZE") or 2
+)
+# Batches written to the document index concurrently
+PIPELINED_INDEXING_NUM_WRITERS = int(
+    os.environ.get("PIPELINED_INDEXING_NUM_WRITERS") or 1
+)
+# Chunks whose content and embedding settings are unchanged since they were last indexed keep
+# their stored embeddings instead of going through the embedding model again
+REUSE_STORED_CHUNK_EMBEDDINGS = (
+    os.environ.get("REUSE_STORED_CHUNK_EMBEDDINGS", "").lower() != "false"
+)
+# Number of processes that background indexing jobs spread the chunking of a batch over,
+# 0 chunks in the indexing job process itself. Every one of these processes imports the
+# background indexing script again, on the order of 10s and 800MB each when it starts
+INDEXING_CHUNKING_PROCESSES = int(os.environ.get("INDEXING_CHUNKING_PROCESSES") or 0)
 CHUNK_SIZE = 512  # Tokens by embedding model
 CHUNK_OVERLAP = int(CHUNK_SIZE * 0.05)  # 5% overlap
 # More accurate results at the expense of indexing speed and index size (stores additional 4 MINI_CHUNK vectors)
@@ -177,6 +245,11 @@ MINI_CHUNK_SIZE = 150
 #####
 NUM_RETURNED_HITS = 50
 NUM_RERANKED_RESULTS = 15
+# Search hits come back without the chunk content, reading the content of a hit fetches it for
+# this many hits at once (the hit and the ones ranked below it), one call covers the reranking
+VESPA_CHUNK_CONTENT_FETCH_SIZE = int(
+    os.environ.get("VESPA_CHUNK_CONTENT_FETCH_SIZE") or NUM_RERANKED_RESULTS
+)
 # We feed in document chunks until we reach this token limit.
 # Default is ~5 full chunks (max chunk size is 2000 chars), although some chunks may be
 # significantly smaller which could result in passing in more total chunks.
@@ -207,6 +280,14 @@ DISABLE_LLM_FILTER_EXTRACTION = (
 DISABLE_LLM_CHUNK_FILTER = (
     os.environ.get("DISABLE_LLM_CHUNK_FILTER", "").lower() == "true"
 )
+# Number of chunks judged by a single LLM call in the chunk filter, 0 judges each chunk in its
+# own call. Batching saves repeating the prompt for every chunk and the wait on the slowest call
+LLM_CHUNK_FILTER_BATCH_SIZE = int(os.environ.get("LLM_CHUNK_FILTER_BATCH_SIZE") or 10)
+# Verdicts per (query, chunk content) pair, set the size to 0 to disable the cache
+LLM_CHUNK_FILTER_CACHE_SIZE = int(os.environ.get("LLM_CHUNK_FILTER_CACHE_SIZE") or 4096)
+LLM_CHUNK_FILTER_CACHE_TTL_SECONDS = int(
+    os.environ.get("LLM_CHUNK_FILTER_CACHE_TTL_SECONDS") or 60 * 60  # 1 hour
+)
 # 1 edit per 20 characters, currently unused due to fuzzy match being too slow
 QUOTE_ALLOWED_ERROR_PERCENT = 0.05
 QA_TIMEOUT = int(os.environ.get("QA_TIMEOUT") or "60")  # 60 seconds
@@ -224,6 +305,30 @@ HYBRID_ALPHA = max(0, min(1, float(os.environ.get("HYBRID_ALPHA") or 0.6)))
 # A list of languages passed to the LLM to rephase the query
 # For example "English,French,Spanish", be sure to use the "," separator
 MULTILINGUAL_QUERY_EXPANSION = os.environ.get("MULTILINGUAL_QUERY_EXPANSION") or None
+# Get the time filter, source filter and multilingual rephrasings of the query from a single call
+# to the fast LLM instead of a separate call for each (one per language for the rephrasings)
+COMBINED_QUERY_UNDERSTANDING = (
+    os.environ.get("COMBINED_QUERY_UNDERSTANDING", "").lower() == "true"
+)
+# Start retrieval with the user selected filters while the LLM is still extracting time / source
+# filters from the query. If the extracted filters are stricter, the hits are filtered locally and
+# retrieval only runs again if fewer than SPECULATIVE_RETRIEVAL_MIN_HITS hits are left
+SPECULATIVE_RETRIEVAL = os.environ.get("SPECULATIVE_RETRIEVAL", "").lower() == "true"
+SPECULATIVE_RETRIEVAL_MIN_HITS = int(
+    os.environ.get("SPECULATIVE_RETRIEVAL_MIN_HITS") or NUM_RERANKED_RESULTS
+)
+# Popular questions get asked many times, cache the query embeddings so that repeat queries
+# skip the bi-encoder completely. Set the size to 0 to disable the cache
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE") or 1024)
+QUERY_EMBEDDING_CACHE_TTL_SECONDS = int(
+    os.environ.get("QUERY_EMBEDDING_CACHE_TTL_SECONDS") or 60 * 60  # 1 hour
+)
+# Cross-encoder scores per (query, passage) pair, paging through results, regenerating an answer
+# or retrying a Slack bot message reranks the same passages for the same query again
+RERANK_SCORE_CACHE_SIZE = int(os.environ.get("RERANK_SCORE_CACHE_SIZE") or 8192)
+RERANK_SCORE_CACHE_TTL_SECONDS = int(
+    os.environ.get("RERANK_SCORE_CACHE_TTL_SECONDS") or 60 * 60  # 1 hour
+)
 
 #####
 # Model Server Configs
@@ -244,6 +349,36 @@ INTENT_MODEL_SERVER_HOST = (
     os.environ.get("INTENT_MODEL_SERVER_HOST") or MODEL_SERVER_HOST
 )
 
+# Requests to the model server reuse pooled keep-alive connections, these bound how long a
+# single call may take (in seconds) before it is retried / failed
+MODEL_SERVER_EMBED_TIMEOUT = float(os.environ.get("MODEL_SERVER_EMBED_TIMEOUT") or 60)
+MODEL_SERVER_RERANK_TIMEOUT = float(os.environ.get("MODEL_SERVER_RERANK_TIMEOUT") or 30)
+MODEL_SERVER_INTENT_TIMEOUT = float(os.environ.get("MODEL_SERVER_INTENT_TIMEOUT") or 10)
+MODEL_SERVER_MAX_RETRIES = int(os.environ.get("MODEL_SERVER_MAX_RETRIES") or 3)
+MODEL_SERVER_CONNECTION_POOL_SIZE = int(
+    os.environ.get("MODEL_SERVER_CONNECTION_POOL_SIZE") or 32
+)
+# Embeddings / rerank scores are sent back as base64 float32 instead of JSON float lists.
+# Older model servers ignore the request for it and keep responding with JSON
+MODEL_SERVER_BINARY_VECTORS = (
+    os.environ.get("MODEL_SERVER_BINARY_VECTORS", "").lower() != "false"
+)
+
+# Opt-in, the model server coalesces concurrent embedding / reranking requests (for example
+# from the API server, the Slack bot and the indexing workers) into shared forward passes.
+# A batch is run once it holds MAX_BATCH_SIZE texts or the oldest request waited MAX_WAIT_MS
+MODEL_SERVER_DYNAMIC_BATCHING = (
+    os.environ.get("MODEL_SERVER_DYNAMIC_BATCHING", "").lower() == "true"
+)
+MODEL_SERVER_MAX_BATCH_SIZE = int(os.environ.get("MODEL_SERVER_MAX_BATCH_SIZE") or 64)
+MODEL_SERVER_MAX_BATCH_WAIT_MS = float(
+    os.environ.get("MODEL_SERVER_MAX_BATCH_WAIT_MS") or 10
+)
+# Requests beyond this many waiting are rejected with a 503 so that clients back off
+MODEL_SERVER_MAX_BATCH_QUEUE_SIZE = int(
+    os.environ.get("MODEL_SERVER_MAX_BATCH_QUEUE_SIZE") or 256
+)
+
 # specify this env variable directly to have a different model server for the background
 # indexing job vs the api server so that background indexing does not effect query-time
 # performance
@@ -11,6 +11,8 @@ SEMANTIC_IDENTIFIER = "semantic_identifier"
 TITLE = "title"
 SECTION_CONTINUATION = "section_continuation"
 EMBEDDINGS = "embeddings"
+CONTENT_HASH = "content_hash"
+LLM_TOKEN_COUNTS = "llm_token_counts"
 ALLOWED_USERS = "allowed_users"
 ACCESS_CONTROL_LIST = "access_control_list"
 DOCUMENT_SETS = "document_sets"
@@ -64,6 +66,15 @@ class DocumentSource(str, Enum):
     ZENDESK = "zendesk"
 
 
+class EmbeddingCellType(str, Enum):
+    """Precision the embeddings are stored at in the document index (Vespa cell types)"""
+
+    FLOAT = "float"
+    BFLOAT16 = "bfloat16"
+    # each vector is scaled into [-127, 127], only valid for the angular distance metric
+    INT8 = "int8"
+
+
 class DocumentIndexType(str, Enum):
     COMBINED = "combined"  # Vespa
     SPLIT = "split"  # Typesense + Qdrant
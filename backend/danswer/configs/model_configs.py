@@ -28,6 +28,15 @@ ASYM_QUERY_PREFIX = os.environ.get("ASYM_QUERY_PREFIX", "")
 ASYM_PASSAGE_PREFIX = os.environ.get("ASYM_PASSAGE_PREFIX", "")
 # Purely an optimization, memory limitation consideration
 BATCH_SIZE_ENCODE_CHUNKS = 8
+# Texts are grouped by token length before embedding so that short mini-chunks are not padded
+# to the length of full chunks. Each batch holds at most this many tokens, counting padding.
+# Set to 0 to go back to fixed batches of BATCH_SIZE_ENCODE_CHUNKS in document order
+EMBEDDING_BATCH_TOKEN_BUDGET = int(
+    os.environ.get("EMBEDDING_BATCH_TOKEN_BUDGET")
+    or BATCH_SIZE_ENCODE_CHUNKS * DOC_EMBEDDING_CONTEXT_SIZE
+)
+# Upper bound on texts per batch regardless of how short they are
+MAX_BATCH_SIZE_ENCODE_CHUNKS = 64
 # This controls the minimum number of pytorch "threads" to allocate to the embedding
 # model. If torch finds more threads on its own, this value is not used.
 MIN_THREADS_ML_MODELS = int(os.environ.get("MIN_THREADS_ML_MODELS") or 1)
@@ -92,6 +101,12 @@ GEN_AI_API_ENDPOINT = os.environ.get("GEN_AI_API_ENDPOINT") or None
 GEN_AI_API_VERSION = os.environ.get("GEN_AI_API_VERSION") or None
 # LiteLLM custom_llm_provider
 GEN_AI_LLM_PROVIDER_TYPE = os.environ.get("GEN_AI_LLM_PROVIDER_TYPE") or None
+# Non-streamed calls to a provider beyond this many at once wait in a local queue instead of
+# being sent, otherwise parallel flows (like judging every chunk with the LLM) get rate limited
+# by the provider and time out. Streamed answers are not counted. Set to 0 to not limit the calls
+GEN_AI_MAX_CONCURRENT_REQUESTS = int(
+    os.environ.get("GEN_AI_MAX_CONCURRENT_REQUESTS") or 16
+)
 
 # Set this to be enough for an answer + quotes. Also used for Chat
 GEN_AI_MAX_OUTPUT_TOKENS = int(os.environ.get("GEN_AI_MAX_OUTPUT_TOKENS") or 1024)
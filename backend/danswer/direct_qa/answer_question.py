@@ -30,11 +30,12 @@ from danswer.search.models import QueryFlow
 from danswer.search.models import RerankMetricsContainer
 from danswer.search.models import RetrievalMetricsContainer
 from danswer.search.models import SearchType
-from danswer.search.request_preprocessing import retrieval_preprocessing
+from danswer.search.request_preprocessing import speculative_retrieval_preprocessing
 from danswer.search.search_runner import chunks_to_search_docs
 from danswer.search.search_runner import full_chunk_search
 from danswer.search.search_runner import full_chunk_search_generator
 from danswer.secondary_llm_flows.answer_validation import get_answer_validity
+from danswer.server.chat.models import DocumentReorderResponse
 from danswer.server.chat.models import LLMRelevanceFilterResponse
 from danswer.server.chat.models import NewMessageRequest
 from danswer.server.chat.models import QADocsResponse
@@ -99,10 +100,17 @@ def answer_qa_query(
             f"num_chunks: {persona_num_chunks}"
         )
 
-    retrieval_request, predicted_search_type, predicted_flow = retrieval_preprocessing(
+    document_index = get_default_document_index()
+    (
+        retrieval_request,
+        predicted_search_type,
+        predicted_flow,
+        retrieved_chunks,
+    ) = speculative_retrieval_preprocessing(
         new_message_request=new_message_request,
         user=user,
         db_session=db_session,
+        document_index=document_index,
         bypass_acl=bypass_acl,
         skip_llm_chunk_filter=persona_skip_llm_chunk_filter
         if persona_skip_llm_chunk_filter is not None
@@ -115,9 +123,10 @@ def answer_qa_query(
 
     top_chunks, llm_chunk_selection = full_chunk_search(
         query=retrieval_request,
-        document_index=get_default_document_index(),
+        document_index=document_index,
         retrieval_metrics_callback=retrieval_metrics_callback,
         rerank_metrics_callback=rerank_metrics_callback,
+        retrieved_chunks=retrieved_chunks,
     )
 
     top_docs = chunks_to_search_docs(top_chunks)
@@ -245,10 +254,17 @@ def answer_qa_query_stream(
             f"num_chunks: {persona_num_chunks}"
         )
 
-    retrieval_request, predicted_search_type, predicted_flow = retrieval_preprocessing(
+    document_index = get_default_document_index()
+    (
+        retrieval_request,
+        predicted_search_type,
+        predicted_flow,
+        retrieved_chunks,
+    ) = speculative_retrieval_preprocessing(
         new_message_request=new_message_request,
         user=user,
         db_session=db_session,
+        document_index=document_index,
         skip_llm_chunk_filter=persona_skip_llm_chunk_filter
         if persona_skip_llm_chunk_filter is not None
         else DISABLE_LLM_CHUNK_FILTER,
@@ -259,7 +275,9 @@ def answer_qa_query_stream(
 
     search_generator = full_chunk_search_generator(
         query=retrieval_request,
-        document_index=get_default_document_index(),
+        document_index=document_index,
+        retrieved_chunks=retrieved_chunks,
+        progressive=new_message_request.progressive_results,
     )
 
     # first fetch and return to the UI the top chunks so the user can
@@ -284,6 +302,16 @@ def answer_qa_query_stream(
         logger.debug("No Documents Found")
         return
 
+    # with progressive results, the chunks above were in retrieval order, send the final order
+    if new_message_request.progressive_results:
+        reordered_indices = cast(list[int], next(search_generator))
+        top_chunks = [top_chunks[i] for i in reordered_indices]
+        reorder_response = DocumentReorderResponse(
+            reordered_indices=reordered_indices,
+            scores=[chunk.score for chunk in top_chunks],
+        ).dict()
+        yield get_json_line(reorder_response)
+
     # update record for this query to include top docs
     update_query_event_retrieved_documents(
         db_session=db_session,
@@ -1,13 +1,12 @@
 import math
 import re
+import string
 from collections.abc import Generator
 from collections.abc import Iterator
 from json.decoder import JSONDecodeError
 from typing import Optional
 from typing import Tuple
 
-import regex
-
 from danswer.configs.app_configs import NUM_DOCUMENT_TOKENS_FED_TO_GENERATIVE_MODEL
 from danswer.configs.app_configs import QUOTE_ALLOWED_ERROR_PERCENT
 from danswer.configs.constants import IGNORE_FOR_QA
@@ -15,12 +14,16 @@ from danswer.direct_qa.interfaces import DanswerAnswer
 from danswer.direct_qa.interfaces import DanswerAnswerPiece
 from danswer.direct_qa.interfaces import DanswerQuote
 from danswer.direct_qa.interfaces import DanswerQuotes
+from danswer.direct_qa.quote_matching import QuoteMatcher
 from danswer.indexing.models import InferenceChunk
-from danswer.llm.utils import check_number_of_tokens
+from danswer.llm.utils import get_chunk_token_count
 from danswer.prompts.constants import ANSWER_PAT
 from danswer.prompts.constants import QUOTE_PAT
 from danswer.prompts.constants import UNCERTAINTY_PAT
 from danswer.utils.logger import setup_logger
+from danswer.utils.stream_parsing import JsonStringValueStream
+from danswer.utils.stream_parsing import SectionEndStream
+from danswer.utils.stream_parsing import StreamPatternMatcher
 from danswer.utils.text_processing import clean_model_quote
 from danswer.utils.text_processing import clean_up_code_blocks
 from danswer.utils.text_processing import extract_embedded_json
@@ -105,54 +108,33 @@ def match_quotes_to_docs(
     fuzzy_search: bool = False,
     prefix_only_length: int = 100,
 ) -> DanswerQuotes:
+    quote_matcher = QuoteMatcher(chunks)
     danswer_quotes: list[DanswerQuote] = []
     for quote in quotes:
+        if not quote.strip():
+            continue
         max_edits = math.ceil(float(len(quote)) * max_error_percent)
 
-        for chunk in chunks:
-            if not chunk.source_links:
-                continue
-
-            quote_clean = shared_precompare_cleanup(
-                clean_model_quote(quote, trim_length=prefix_only_length)
-            )
-            chunk_clean = shared_precompare_cleanup(chunk.content)
-
-            # Finding the offset of the quote in the plain text
-            if fuzzy_search:
-                re_search_str = (
-                    r"(" + re.escape(quote_clean) + r"){e<=" + str(max_edits) + r"}"
-                )
-                found = regex.search(re_search_str, chunk_clean)
-                if not found:
-                    continue
-                offset = found.span()[0]
-            else:
-                if quote_clean not in chunk_clean:
-                    continue
-                offset = chunk_clean.index(quote_clean)
-
-            # Extracting the link from the offset
-            curr_link = None
-            for link_offset, link in chunk.source_links.items():
-                # Should always find one because offset is at least 0 and there
-                # must be a 0 link_offset
-                if int(link_offset) <= offset:
-                    curr_link = link
-                else:
-                    break
-
-            danswer_quotes.append(
-                DanswerQuote(
-                    quote=quote,
-                    document_id=chunk.document_id,
-                    link=curr_link,
-                    source_type=chunk.source_type,
-                    semantic_identifier=chunk.semantic_identifier,
-                    blurb=chunk.blurb,
-                )
+        quote_clean = shared_precompare_cleanup(
+            clean_model_quote(quote, trim_length=prefix_only_length)
+        )
+        match = quote_matcher.find(
+            quote_clean, max_edits=max_edits, fuzzy_search=fuzzy_search
+        )
+        if match is None:
+            continue
+        chunk, link = match
+
+        danswer_quotes.append(
+            DanswerQuote(
+                quote=quote,
+                document_id=chunk.document_id,
+                link=link,
+                source_type=chunk.source_type,
+                semantic_identifier=chunk.semantic_identifier,
+                blurb=chunk.blurb,
             )
-            break
+        )
 
     return DanswerQuotes(quotes=danswer_quotes)
 
@@ -184,17 +166,6 @@ def process_answer(
     return DanswerAnswer(answer=answer), quotes
 
 
-def _stream_json_answer_end(answer_so_far: str, next_token: str) -> bool:
-    next_token = next_token.replace('\\"', "")
-    # If the previous character is an escape token, don't consider the first character of next_token
-    # This does not work if it's an escaped escape sign before the " but this is rare, not worth handling
-    if answer_so_far and answer_so_far[-1] == "\\":
-        next_token = next_token[1:]
-    if '"' in next_token:
-        return True
-    return False
-
-
 def _extract_quotes_from_completed_token_stream(
     model_output: str, context_chunks: list[InferenceChunk], is_json_prompt: bool = True
 ) -> DanswerQuotes:
@@ -221,45 +192,46 @@ def process_model_tokens(
     quote_pat = f"\n{QUOTE_PAT}"
     # Sometimes worse model outputs new line instead of :
     quote_loose = f"\n{quote_pat[:-1]}\n"
-    # Sometime model outputs two newlines before quote section
-    quote_pat_full = f"\n{quote_pat}"
-    model_output: str = ""
-    found_answer_start = False if is_json_prompt else True
+    json_answer_stream = JsonStringValueStream(
+        start=StreamPatternMatcher('{"answer":"', ignored_chars=string.whitespace)
+    )
+    freeform_answer_stream = SectionEndStream(end_patterns=[quote_pat, quote_loose])
+
+    model_output_tokens: list[str] = []
+    model_output_length = 0
     found_answer_end = False
-    hold_quote = ""
     for token in tokens:
-        model_previous = model_output
-        model_output += token
-
-        if not found_answer_start and '{"answer":"' in re.sub(r"\s", "", model_output):
-            # Note, if the token that completes the pattern has additional text, for example if the token is "?
-            # Then the chars after " will not be streamed, but this is ok as it prevents streaming the ? in the
-            # event that the model outputs the UNCERTAINTY_PAT
-            found_answer_start = True
-
-            # Prevent heavy cases of hallucinations where model is not even providing a json until later
-            if is_json_prompt and len(model_output) > 40:
-                logger.warning("LLM did not produce json as prompted")
-                found_answer_end = True
-
+        model_output_tokens.append(token)
+        model_output_length += len(token)
+        if found_answer_end:
             continue
 
-        if found_answer_start and not found_answer_end:
-            if is_json_prompt and _stream_json_answer_end(model_previous, token):
-                found_answer_end = True
-                yield DanswerAnswerPiece(answer_piece=None)
-                continue
-            elif not is_json_prompt:
-                if quote_pat in hold_quote + token or quote_loose in hold_quote + token:
+        if is_json_prompt:
+            was_started = json_answer_stream.started
+            answer_piece = json_answer_stream.feed(token)
+            if not was_started and json_answer_stream.started:
+                # Prevent heavy cases of hallucinations where model is not even providing a json until later
+                if model_output_length > 40:
+                    logger.warning("LLM did not produce json as prompted")
                     found_answer_end = True
-                    yield DanswerAnswerPiece(answer_piece=None)
-                    continue
-                if hold_quote + token in quote_pat_full:
-                    hold_quote += token
                     continue
-            yield DanswerAnswerPiece(answer_piece=hold_quote + token)
-            hold_quote = ""
+            finished = json_answer_stream.finished
+        else:
+            answer_piece = freeform_answer_stream.feed(token)
+            finished = freeform_answer_stream.finished
+
+        if answer_piece:
+            yield DanswerAnswerPiece(answer_piece=answer_piece)
+        if finished:
+            found_answer_end = True
+            yield DanswerAnswerPiece(answer_piece=None)
+
+    if not is_json_prompt and not found_answer_end:
+        held_back = freeform_answer_stream.flush()
+        if held_back:
+            yield DanswerAnswerPiece(answer_piece=held_back)
 
+    model_output = "".join(model_output_tokens)
     logger.debug(f"Raw Model QnA Output: {model_output}")
 
     yield _extract_quotes_from_completed_token_stream(
@@ -281,7 +253,7 @@ def _get_usable_chunks(
     total_token_count = 0
     usable_chunks = []
     for chunk in chunks:
-        chunk_token_count = check_number_of_tokens(chunk.content)
+        chunk_token_count = get_chunk_token_count(chunk)
         if total_token_count + chunk_token_count > token_limit:
             break
 
@@ -334,7 +306,7 @@ def get_chunks_for_qa(
 
     Note, the batch_offset calculation has to count the batches from the beginning each time as
     there's no way to know which chunks were included in the prior batches without recounting atm,
-    this is somewhat slow as it requires tokenizing all the chunks again
+    this is cheap as long as the chunks come with their token counts from indexing
     """
     batch_index = 0
     latest_batch_indices: list[int] = []
@@ -348,8 +320,8 @@ def get_chunks_for_qa(
             ):
                 continue
 
-            # We calculate it live in case the user uses a different LLM + tokenizer
-            chunk_token = check_number_of_tokens(chunk.content)
+            # Counted at indexing time, only tokenized live for a different tokenizer
+            chunk_token = get_chunk_token_count(chunk)
             # 50 for an approximate/slight overestimate for # tokens for metadata for the chunk
             token_count += chunk_token + 50
 
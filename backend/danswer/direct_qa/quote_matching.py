@@ -0,0 +1,137 @@
+import bisect
+import re
+from collections import defaultdict
+
+import regex
+
+from danswer.indexing.models import InferenceChunk
+from danswer.utils.text_processing import shared_precompare_cleanup
+
+# Length of the character n-grams of the cleaned up chunk texts that candidate positions for
+# the quotes are looked up by
+_NGRAM_SIZE = 8
+
+
+class _IndexedChunk:
+    def __init__(self, chunk: InferenceChunk) -> None:
+        self.chunk = chunk
+        # Offsets of the source links are into this cleaned up text, see the chunker
+        self.text = shared_precompare_cleanup(chunk.content)
+        sorted_links = sorted(
+            (int(offset), link) for offset, link in (chunk.source_links or {}).items()
+        )
+        self.link_offsets = [offset for offset, _ in sorted_links]
+        self.links = [link for _, link in sorted_links]
+
+    def link_at(self, offset: int) -> str | None:
+        """Link of the section the offset falls into"""
+        link_ind = bisect.bisect_right(self.link_offsets, offset) - 1
+        # Should always find one because offset is at least 0 and there must be a 0 offset
+        return self.links[link_ind] if link_ind >= 0 else None
+
+
+class QuoteMatcher:
+    """Finds the quotes of an LLM answer in the context chunks it was given.
+
+    Every chunk is cleaned up once, exact quotes are then searched for with `str.find` in the
+    cleaned up texts. For fuzzy matching, the n-grams of all the cleaned up texts are indexed
+    together (on the first fuzzy search) so a quote is only compared against the positions
+    that share one of its pieces instead of against every chunk.
+
+    Like a plain search through the chunks in order, a quote is matched to the first chunk that
+    contains it, at its first occurrence in that chunk. With fuzzy matching, a chunk containing
+    the quote as is wins over earlier chunks that only contain something close to it."""
+
+    def __init__(
+        self, chunks: list[InferenceChunk], ngram_size: int = _NGRAM_SIZE
+    ) -> None:
+        self.ngram_size = ngram_size
+        # Chunks without links can't be cited
+        self.indexed_chunks = [
+            _IndexedChunk(chunk) for chunk in chunks if chunk.source_links
+        ]
+
+        self._ngram_positions: dict[str, list[tuple[int, int]]] | None = None
+
+    def _get_ngram_positions(self) -> dict[str, list[tuple[int, int]]]:
+        """Only built for fuzzy matching, exact quotes are found faster by `str.find` than
+        it takes to index the chunks"""
+        if self._ngram_positions is None:
+            # Positions are added in (chunk, offset) order, so the first verified candidate for
+            # a quote is its earliest occurrence in the earliest chunk
+            ngram_positions: dict[str, list[tuple[int, int]]] = defaultdict(list)
+            for chunk_ind, indexed_chunk in enumerate(self.indexed_chunks):
+                text = indexed_chunk.text
+                for offset in range(len(text) - self.ngram_size + 1):
+                    ngram_positions[text[offset : offset + self.ngram_size]].append(
+                        (chunk_ind, offset)
+                    )
+            self._ngram_positions = ngram_positions
+        return self._ngram_positions
+
+    def _find_exact(self, quote: str) -> tuple[_IndexedChunk, int] | None:
+        for indexed_chunk in self.indexed_chunks:
+            offset = indexed_chunk.text.find(quote)
+            if offset != -1:
+                return indexed_chunk, offset
+        return None
+
+    def _find_fuzzy(
+        self, quote: str, max_edits: int
+    ) -> tuple[_IndexedChunk, int] | None:
+        exact_match = self._find_exact(quote)
+        if exact_match is not None or max_edits <= 0:
+            return exact_match
+
+        fuzzy_pattern = regex.compile(
+            r"(" + re.escape(quote) + r"){e<=" + str(max_edits) + r"}"
+        )
+
+        # With at most max_edits edits, at least one of max_edits + 1 pieces of the quote is
+        # in the text unchanged, and the quote can only start close to where that piece is
+        piece_length = len(quote) // (max_edits + 1)
+        if piece_length < self.ngram_size:
+            # Pieces too short to be looked up, search the whole chunks
+            for indexed_chunk in self.indexed_chunks:
+                found = fuzzy_pattern.search(indexed_chunk.text)
+                if found:
+                    return indexed_chunk, found.span()[0]
+            return None
+
+        # Windows of the chunk texts that may hold the quote, as (chunk, start, end)
+        windows: set[tuple[int, int, int]] = set()
+        ngram_positions = self._get_ngram_positions()
+        for piece_start in range(0, piece_length * (max_edits + 1), piece_length):
+            piece = quote[piece_start : piece_start + piece_length]
+            for chunk_ind, offset in ngram_positions.get(piece[: self.ngram_size], []):
+                if self.indexed_chunks[chunk_ind].text.startswith(piece, offset):
+                    quote_start = offset - piece_start
+                    windows.add(
+                        (
+                            chunk_ind,
+                            max(0, quote_start - max_edits),
+                            quote_start + len(quote) + max_edits,
+                        )
+                    )
+
+        for chunk_ind, window_start, window_end in sorted(windows):
+            indexed_chunk = self.indexed_chunks[chunk_ind]
+            found = fuzzy_pattern.search(indexed_chunk.text, window_start, window_end)
+            if found:
+                return indexed_chunk, found.span()[0]
+        return None
+
+    def find(
+        self, quote_clean: str, max_edits: int = 0, fuzzy_search: bool = False
+    ) -> tuple[InferenceChunk, str | None] | None:
+        """Takes a quote cleaned up with `shared_precompare_cleanup`, returns the chunk it
+        was found in along with the link of the section it starts in"""
+        match = (
+            self._find_fuzzy(quote_clean, max_edits)
+            if fuzzy_search
+            else self._find_exact(quote_clean)
+        )
+        if match is None:
+            return None
+        indexed_chunk, offset = match
+        return indexed_chunk.chunk, indexed_chunk.link_at(offset)
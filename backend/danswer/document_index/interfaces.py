@@ -1,4 +1,5 @@
 import abc
+from collections.abc import Callable
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Any
@@ -6,7 +7,9 @@ from typing import Any
 from danswer.access.models import DocumentAccess
 from danswer.indexing.models import DocMetadataAwareIndexChunk
 from danswer.indexing.models import InferenceChunk
+from danswer.indexing.models import StoredChunkEmbedding
 from danswer.search.models import IndexFilters
+from danswer.search.models import RetrievalTiming
 
 
 @dataclass(frozen=True)
@@ -62,6 +65,14 @@ class Indexable(abc.ABC):
         """Indexes document chunks into the Document Index and return the IDs of all the documents indexed"""
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def get_chunk_embeddings(
+        self, document_ids: list[str]
+    ) -> dict[tuple[str, int], StoredChunkEmbedding]:
+        """Returns the embeddings currently stored for the chunks of the given documents,
+        keyed by (document id, chunk id). Used to skip re-embedding unchanged chunks"""
+        raise NotImplementedError
+
 
 class Deletable(abc.ABC):
     @abc.abstractmethod
@@ -85,6 +96,7 @@ class KeywordCapable(abc.ABC):
         filters: IndexFilters,
         favor_recent: bool,
         num_to_retrieve: int,
+        timing_callback: Callable[[RetrievalTiming], None] | None = None,
     ) -> list[InferenceChunk]:
         raise NotImplementedError
 
@@ -97,6 +109,7 @@ class VectorCapable(abc.ABC):
         filters: IndexFilters,
         favor_recent: bool,
         num_to_retrieve: int,
+        timing_callback: Callable[[RetrievalTiming], None] | None = None,
     ) -> list[InferenceChunk]:
         raise NotImplementedError
 
@@ -110,6 +123,7 @@ class HybridCapable(abc.ABC):
         favor_recent: bool,
         num_to_retrieve: int,
         hybrid_alpha: float | None = None,
+        timing_callback: Callable[[RetrievalTiming], None] | None = None,
     ) -> list[InferenceChunk]:
         raise NotImplementedError
 
@@ -121,17 +135,40 @@ class AdminCapable(abc.ABC):
         query: str,
         filters: IndexFilters,
         num_to_retrieve: int,
+        timing_callback: Callable[[RetrievalTiming], None] | None = None,
+    ) -> list[InferenceChunk]:
+        raise NotImplementedError
+
+
+class ContentLoadable(abc.ABC):
+    @abc.abstractmethod
+    def load_chunk_contents(
+        self,
+        chunks: list[InferenceChunk],
+        timing_callback: Callable[[RetrievalTiming], None] | None = None,
     ) -> list[InferenceChunk]:
+        """Retrieved chunks may only have their content fetched when it is first read, this
+        fetches it for all of the given chunks up front instead. Returns the chunks in the
+        same order, leaving out the ones that turned out to have no content"""
         raise NotImplementedError
 
 
-class BaseIndex(Verifiable, AdminCapable, Indexable, Updatable, Deletable, abc.ABC):
+class BaseIndex(
+    Verifiable,
+    AdminCapable,
+    ContentLoadable,
+    Indexable,
+    Updatable,
+    Deletable,
+    abc.ABC,
+):
     """All basic functionalities excluding a specific retrieval approach
     Indices need to be able to
     - Check that the index exists with a schema definition
     - Can index documents
     - Can delete documents
     - Can update document metadata (such as access permissions and document specific boost)
+    - Can load the content of retrieved chunks
     """
 
 
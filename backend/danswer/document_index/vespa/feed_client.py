@@ -0,0 +1,188 @@
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import TypeVar
+
+import requests
+from requests import Response
+from requests.adapters import HTTPAdapter
+
+from danswer.configs.app_configs import VESPA_FEED_CONNECT_TIMEOUT
+from danswer.configs.app_configs import VESPA_FEED_MAX_IN_FLIGHT
+from danswer.configs.app_configs import VESPA_FEED_MAX_RETRIES
+from danswer.configs.app_configs import VESPA_FEED_MIN_IN_FLIGHT
+from danswer.configs.app_configs import VESPA_FEED_READ_TIMEOUT
+from danswer.utils.logger import setup_logger
+
+logger = setup_logger()
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Vespa signals that the content nodes cannot keep up via these
+_BACKPRESSURE_STATUS_CODES = {429, 503}
+_RETRYABLE_STATUS_CODES = _BACKPRESSURE_STATUS_CODES | {500, 502, 504}
+# Successful operations needed before allowing one more operation in flight
+_SUCCESSES_PER_WINDOW_INCREASE = 16
+
+
+class _AdaptiveThrottle:
+    """Limits the number of operations in flight. The limit is halved when Vespa pushes back
+    and grows by one again after a streak of successful operations (AIMD).
+
+    A burst of backpressure responses to operations sent with the same window only halves it
+    once: operations sent before the last decrease are ignored when they get pushed back.
+    """
+
+    def __init__(self, min_in_flight: int, max_in_flight: int) -> None:
+        self.min_in_flight = min_in_flight
+        self.max_in_flight = max_in_flight
+        self.window = max_in_flight
+        self.in_flight = 0
+
+        self._success_streak = 0
+        self._num_decreases = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> int:
+        """Returns the number of window decreases so far, to be passed to
+        `record_backpressure` if the operation gets pushed back"""
+        with self._condition:
+            while self.in_flight >= self.window:
+                self._condition.wait()
+            self.in_flight += 1
+            return self._num_decreases
+
+    def release(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def record_success(self) -> None:
+        with self._condition:
+            self._success_streak += 1
+            if (
+                self._success_streak >= _SUCCESSES_PER_WINDOW_INCREASE
+                and self.window < self.max_in_flight
+            ):
+                self.window += 1
+                self._success_streak = 0
+                self._condition.notify()
+
+    def record_backpressure(self, num_decreases_when_sent: int) -> None:
+        with self._condition:
+            self._success_streak = 0
+            if num_decreases_when_sent != self._num_decreases:
+                # Sent with a larger window which was already decreased
+                return
+
+            new_window = max(self.min_in_flight, self.window // 2)
+            if new_window != self.window:
+                logger.info(
+                    f"Vespa is throttling feed operations, reducing the operations "
+                    f"in flight from {self.window} to {new_window}"
+                )
+                self.window = new_window
+                self._num_decreases += 1
+
+
+class VespaFeedClient:
+    """Feeds document operations (puts, partial updates, deletes) to Vespa over a pool of
+    persistent keep-alive connections. Vespa's document/v1 API takes a single operation per
+    request, so throughput comes from keeping many operations in flight on reused connections.
+
+    Backpressure (429 / 503) is handled by retrying with backoff and by shrinking the number of
+    operations in flight, rather than by failing the batch after a fixed number of tries. Server
+    errors, connection errors and timeouts are retried with the same backoff.
+    """
+
+    def __init__(
+        self,
+        min_in_flight: int = VESPA_FEED_MIN_IN_FLIGHT,
+        max_in_flight: int = VESPA_FEED_MAX_IN_FLIGHT,
+        max_retries: int = VESPA_FEED_MAX_RETRIES,
+        initial_backoff: float = 0.5,
+        connect_timeout: float = VESPA_FEED_CONNECT_TIMEOUT,
+        read_timeout: float = VESPA_FEED_READ_TIMEOUT,
+    ) -> None:
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.timeout = (connect_timeout, read_timeout)
+        self.throttle = _AdaptiveThrottle(
+            min_in_flight=min_in_flight, max_in_flight=max_in_flight
+        )
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="vespa-feed"
+        )
+
+    def send(self, method: str, url: str, **kwargs: Any) -> Response:
+        """Sends a single operation, blocking until there is room for it in the current
+        window. Responses other than backpressure / server errors are returned as is, the
+        caller decides what to do with them. Uses the timeout of the client unless one is
+        passed."""
+        kwargs.setdefault("timeout", self.timeout)
+        backoff = self.initial_backoff
+        for attempt in range(self.max_retries + 1):
+            is_last_attempt = attempt == self.max_retries
+
+            num_decreases_when_sent = self.throttle.acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if is_last_attempt:
+                    raise
+                logger.warning(
+                    f"{type(e).__name__} sending {method} to {url}, retrying"
+                )
+                response = None
+            finally:
+                self.throttle.release()
+
+            if response is not None:
+                if response.status_code not in _RETRYABLE_STATUS_CODES:
+                    self.throttle.record_success()
+                    return response
+                if response.status_code in _BACKPRESSURE_STATUS_CODES:
+                    self.throttle.record_backpressure(num_decreases_when_sent)
+                if is_last_attempt:
+                    return response
+
+            time.sleep(backoff)
+            backoff *= 2
+
+        raise RuntimeError("Unreachable, the last attempt always returns or raises")
+
+    def map(self, func: Callable[[T], R], items: list[T]) -> list[R]:
+        """Runs `func` over all the items on the feed threads. Results are in the order of
+        `items`, the first exception raised by any of the calls is re-raised."""
+        futures = {
+            self.executor.submit(func, item): ind for ind, item in enumerate(items)
+        }
+        results: list[Any] = [None] * len(items)
+        for future in as_completed(futures):
+            # Will raise exception if the call raised an exception
+            results[futures[future]] = future.result()
+        return results
+
+
+_VESPA_FEED_CLIENT: VespaFeedClient | None = None
+_VESPA_FEED_CLIENT_LOCK = threading.Lock()
+
+
+def get_vespa_feed_client() -> VespaFeedClient:
+    """The client is shared by all `VespaIndex` instances of the process so that the
+    connections and the feed threads are reused across indexing batches"""
+    global _VESPA_FEED_CLIENT
+    with _VESPA_FEED_CLIENT_LOCK:
+        if _VESPA_FEED_CLIENT is None:
+            _VESPA_FEED_CLIENT = VespaFeedClient()
+    return _VESPA_FEED_CLIENT
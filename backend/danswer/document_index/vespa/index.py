@@ -1,19 +1,25 @@
-import concurrent.futures
+import io
 import json
+import re
 import string
+import threading
 import time
+import zipfile
+from collections import defaultdict
+from collections.abc import Callable
+from collections.abc import Iterable
 from collections.abc import Mapping
 from dataclasses import dataclass
 from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
+from functools import partial
 from typing import Any
 from typing import cast
 
 import requests
 from requests import HTTPError
 from requests import Response
-from retry import retry
 
 from danswer.configs.app_configs import DOC_TIME_DECAY
 from danswer.configs.app_configs import DOCUMENT_INDEX_NAME
@@ -22,7 +28,13 @@ from danswer.configs.app_configs import FAVOR_RECENT_DECAY_MULTIPLIER
 from danswer.configs.app_configs import HYBRID_ALPHA
 from danswer.configs.app_configs import LOG_VESPA_TIMING_INFORMATION
 from danswer.configs.app_configs import NUM_RETURNED_HITS
+from danswer.configs.app_configs import VESPA_APPROXIMATE_NEAREST_NEIGHBOR
+from danswer.configs.app_configs import VESPA_CHUNK_CONTENT_FETCH_SIZE
 from danswer.configs.app_configs import VESPA_DEPLOYMENT_ZIP
+from danswer.configs.app_configs import VESPA_EMBEDDING_CELL_TYPE
+from danswer.configs.app_configs import VESPA_HNSW_EXPLORE_ADDITIONAL_HITS
+from danswer.configs.app_configs import VESPA_HNSW_MAX_LINKS_PER_NODE
+from danswer.configs.app_configs import VESPA_HNSW_NEIGHBORS_TO_EXPLORE_AT_INSERT
 from danswer.configs.app_configs import VESPA_HOST
 from danswer.configs.app_configs import VESPA_PORT
 from danswer.configs.app_configs import VESPA_TENANT_PORT
@@ -31,12 +43,15 @@ from danswer.configs.constants import BLURB
 from danswer.configs.constants import BOOST
 from danswer.configs.constants import CHUNK_ID
 from danswer.configs.constants import CONTENT
+from danswer.configs.constants import CONTENT_HASH
 from danswer.configs.constants import DEFAULT_BOOST
 from danswer.configs.constants import DOC_UPDATED_AT
 from danswer.configs.constants import DOCUMENT_ID
 from danswer.configs.constants import DOCUMENT_SETS
+from danswer.configs.constants import EmbeddingCellType
 from danswer.configs.constants import EMBEDDINGS
 from danswer.configs.constants import HIDDEN
+from danswer.configs.constants import LLM_TOKEN_COUNTS
 from danswer.configs.constants import METADATA
 from danswer.configs.constants import PRIMARY_OWNERS
 from danswer.configs.constants import RECENCY_BIAS
@@ -54,15 +69,26 @@ from danswer.document_index.document_index_utils import get_uuid_from_chunk
 from danswer.document_index.interfaces import DocumentIndex
 from danswer.document_index.interfaces import DocumentInsertionRecord
 from danswer.document_index.interfaces import UpdateRequest
+from danswer.document_index.vespa.feed_client import get_vespa_feed_client
+from danswer.document_index.vespa.feed_client import VespaFeedClient
+from danswer.document_index.vespa.query_client import get_vespa_query_client
+from danswer.document_index.vespa.query_client import VespaQueryClient
+from danswer.document_index.vespa.utils import quantize_embedding
 from danswer.document_index.vespa.utils import remove_invalid_unicode_chars
+from danswer.indexing.models import ChunkEmbedding
+from danswer.indexing.models import Deferred
 from danswer.indexing.models import DocMetadataAwareIndexChunk
 from danswer.indexing.models import InferenceChunk
+from danswer.indexing.models import is_deferred
+from danswer.indexing.models import LazyInferenceChunk
+from danswer.indexing.models import StoredChunkEmbedding
 from danswer.search.models import IndexFilters
+from danswer.search.models import RetrievalTiming
+from danswer.search.query_normalization import normalize_query
 from danswer.search.search_runner import embed_query
-from danswer.search.search_runner import query_processing
-from danswer.search.search_runner import remove_stop_words_and_punctuation
 from danswer.utils.batching import batch_generator
 from danswer.utils.logger import setup_logger
+from danswer.utils.threadpool_concurrency import run_functions_tuples_in_parallel
 
 logger = setup_logger()
 
@@ -76,9 +102,17 @@ DOCUMENT_ID_ENDPOINT = (
 )
 SEARCH_ENDPOINT = f"{VESPA_APP_CONTAINER_URL}/search/"
 _BATCH_SIZE = 100  # Specific to Vespa
-_NUM_THREADS = (
-    16  # since Vespa doesn't allow batching of inserts / updates, we use threads
-)
+# Vespa's default query limits, beyond these the query is rejected
+_MAX_VESPA_HITS = 400
+_MAX_VESPA_OFFSET = 1000
+# Documents whose chunk ids are looked up by a single query
+_INVENTORY_DOCS_PER_QUERY = 20
+# Document summary with just what's needed to reuse the stored embeddings of a chunk
+_CHUNK_EMBEDDINGS_SUMMARY = "chunk_embeddings"
+# Document summaries for search hits, see the schema
+_CHUNK_LISTING_SUMMARY = "chunk_listing"
+_CHUNK_CONTENT_SUMMARY = "chunk_content"
+_SCHEMA_FILE_NAME = "danswer_chunk.sd"
 # up from 500ms for now, since we've seen quite a few timeouts
 # in the long term, we are looking to improve the performance of Vespa
 # so that we can bring this back to default
@@ -94,25 +128,6 @@ class _VespaUpdateRequest:
     update_request: dict[str, dict]
 
 
-@retry(tries=3, delay=1, backoff=2)
-def _does_document_exist(
-    doc_chunk_id: str,
-) -> bool:
-    """Returns whether the document already exists and the users/group whitelists
-    Specifically in this case, document refers to a vespa document which is equivalent to a Danswer
-    chunk. This checks for whether the chunk exists already in the index"""
-    doc_fetch_response = requests.get(f"{DOCUMENT_ID_ENDPOINT}/{doc_chunk_id}")
-    if doc_fetch_response.status_code == 404:
-        return False
-
-    if doc_fetch_response.status_code != 200:
-        raise RuntimeError(
-            f"Unexpected fetch document by ID value from Vespa "
-            f"with error {doc_fetch_response.status_code}"
-        )
-    return True
-
-
 def _vespa_get_updated_at_attribute(t: datetime | None) -> int | None:
     if not t:
         return None
@@ -123,97 +138,206 @@ def _vespa_get_updated_at_attribute(t: datetime | None) -> int | None:
     return int(t.timestamp())
 
 
-def _get_vespa_chunk_ids_by_document_id(
-    document_id: str, hits_per_page: int = _BATCH_SIZE
-) -> list[str]:
-    offset = 0
-    doc_chunk_ids = []
+def _escape_yql_string(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+
+def _document_chunks_query_params(
+    where_clause: str,
+    selected_fields: list[str],
+    summary: str | None,
+    hits_per_page: int,
+) -> dict[str, int | str]:
     params: dict[str, int | str] = {
-        "yql": f"select documentid from {DOCUMENT_INDEX_NAME} where document_id contains '{document_id}'",
+        "yql": f"select {', '.join(selected_fields)} from {DOCUMENT_INDEX_NAME} where {where_clause}",
         "timeout": "10s",
-        "offset": offset,
+        "offset": 0,
         "hits": hits_per_page,
+        # Pure filter, no need to spend time ranking the matches
+        "ranking.profile": "unranked",
     }
+    if summary:
+        params["presentation.summary"] = summary
+        params["presentation.format.tensors"] = "short-value"
+    return params
+
+
+def _query_vespa_document_chunks_by_chunk_id(
+    document_id: str,
+    feed_client: VespaFeedClient,
+    selected_fields: list[str],
+    summary: str | None = None,
+    hits_per_page: int = _MAX_VESPA_HITS,
+) -> list[dict[str, Any]]:
+    """Pages through the chunks of a single document in chunk id order, every page starts
+    after the last chunk id of the previous one. Not limited by how far Vespa lets a query
+    be paged through with an offset"""
+    if CHUNK_ID not in selected_fields:
+        selected_fields = selected_fields + [CHUNK_ID]
+    doc_id_filter = f"{DOCUMENT_ID} contains '{_escape_yql_string(document_id)}'"
+
+    chunk_fields: list[dict[str, Any]] = []
+    last_chunk_id = -1
     while True:
-        results = requests.get(SEARCH_ENDPOINT, params=params).json()
-        hits = results["root"].get("children", [])
-
-        doc_chunk_ids.extend(
-            [hit["fields"]["documentid"].split("::", 1)[-1] for hit in hits]
+        params = _document_chunks_query_params(
+            f"{doc_id_filter} and {CHUNK_ID} > {last_chunk_id} order by {CHUNK_ID} asc",
+            selected_fields,
+            summary,
+            hits_per_page,
         )
-        params["offset"] += hits_per_page  # type: ignore
+        response = feed_client.send("GET", SEARCH_ENDPOINT, params=params)
+        response.raise_for_status()
+        hits = response.json()["root"].get("children", [])
 
+        chunk_fields.extend(hit["fields"] for hit in hits)
         if len(hits) < hits_per_page:
             break
-    return doc_chunk_ids
+        last_chunk_id = hits[-1]["fields"][CHUNK_ID]
+    return chunk_fields
 
 
-@retry(tries=3, delay=1, backoff=2)
-def _delete_vespa_doc_chunks(document_id: str) -> None:
-    doc_chunk_ids = _get_vespa_chunk_ids_by_document_id(document_id)
+def _query_vespa_document_chunks(
+    document_ids: list[str],
+    feed_client: VespaFeedClient,
+    selected_fields: list[str],
+    summary: str | None = None,
+    hits_per_page: int = _MAX_VESPA_HITS,
+) -> list[dict[str, Any]]:
+    """Returns the requested fields of every chunk of the given documents"""
+    doc_id_filter = " or ".join(
+        f"{DOCUMENT_ID} contains '{_escape_yql_string(document_id)}'"
+        for document_id in document_ids
+    )
+    params = _document_chunks_query_params(
+        doc_id_filter, selected_fields, summary, hits_per_page
+    )
 
-    for chunk_id in doc_chunk_ids:
-        res = requests.delete(f"{DOCUMENT_ID_ENDPOINT}/{chunk_id}")
-        res.raise_for_status()
+    chunk_fields: list[dict[str, Any]] = []
+    while True:
+        if cast(int, params["offset"]) > _MAX_VESPA_OFFSET:
+            # Vespa refuses to page any further, ask for fewer documents at a time instead
+            if len(document_ids) == 1:
+                return _query_vespa_document_chunks_by_chunk_id(
+                    document_ids[0],
+                    feed_client,
+                    selected_fields,
+                    summary,
+                    hits_per_page,
+                )
+            mid = len(document_ids) // 2
+            return _query_vespa_document_chunks(
+                document_ids[:mid], feed_client, selected_fields, summary, hits_per_page
+            ) + _query_vespa_document_chunks(
+                document_ids[mid:], feed_client, selected_fields, summary, hits_per_page
+            )
 
+        response = feed_client.send("GET", SEARCH_ENDPOINT, params=params)
+        response.raise_for_status()
+        hits = response.json()["root"].get("children", [])
 
-def _delete_vespa_docs(
-    document_ids: list[str],
-    executor: concurrent.futures.ThreadPoolExecutor | None = None,
-) -> None:
-    external_executor = True
+        chunk_fields.extend(hit["fields"] for hit in hits)
+        params["offset"] = cast(int, params["offset"]) + hits_per_page
 
-    if not executor:
-        external_executor = False
-        executor = concurrent.futures.ThreadPoolExecutor(max_workers=_NUM_THREADS)
+        if len(hits) < hits_per_page:
+            break
+    return chunk_fields
+
+
+def _get_vespa_chunk_ids_by_document_ids(
+    document_ids: Iterable[str],
+    feed_client: VespaFeedClient,
+    docs_per_query: int = _INVENTORY_DOCS_PER_QUERY,
+) -> dict[str, list[str]]:
+    """Resolves the Vespa ids of all the chunks of the given documents with one filter
+    query per group of documents, instead of one lookup per document / chunk.
+    Documents without any chunks in the index are not included in the result."""
+    query_func = partial(
+        _query_vespa_document_chunks,
+        feed_client=feed_client,
+        selected_fields=["documentid", DOCUMENT_ID],
+    )
+    doc_chunk_ids: dict[str, list[str]] = defaultdict(list)
+    for chunk_fields_batch in feed_client.map(
+        query_func, list(batch_generator(document_ids, docs_per_query))
+    ):
+        for chunk_fields in chunk_fields_batch:
+            doc_chunk_ids[chunk_fields[DOCUMENT_ID]].append(
+                chunk_fields["documentid"].split("::", 1)[-1]
+            )
+    return doc_chunk_ids
 
-    try:
-        doc_deletion_future = {
-            executor.submit(_delete_vespa_doc_chunks, doc_id): doc_id
-            for doc_id in document_ids
-        }
-        for future in concurrent.futures.as_completed(doc_deletion_future):
-            # Will raise exception if the deletion raised an exception
-            future.result()
 
-    finally:
-        if not external_executor:
-            executor.shutdown(wait=True)
+def _parse_vespa_embeddings(tensor: dict[str, Any]) -> ChunkEmbedding:
+    # "short" tensor format wraps the cells, "short-value" is just the label to vector map
+    embeddings_name_vector_map = tensor.get("blocks", tensor)
+    mini_chunk_names = sorted(
+        (name for name in embeddings_name_vector_map if name != "full_chunk"),
+        key=lambda name: int(name.rsplit("_", 1)[-1]),
+    )
+    return ChunkEmbedding(
+        full_embedding=embeddings_name_vector_map["full_chunk"],
+        mini_chunk_embeddings=[
+            embeddings_name_vector_map[name] for name in mini_chunk_names
+        ],
+    )
 
 
-def _get_existing_documents_from_chunks(
-    chunks: list[DocMetadataAwareIndexChunk],
-    executor: concurrent.futures.ThreadPoolExecutor | None = None,
-) -> set[str]:
-    external_executor = True
+def _get_vespa_chunk_embeddings(
+    document_ids: list[str],
+    feed_client: VespaFeedClient,
+    docs_per_query: int = _INVENTORY_DOCS_PER_QUERY,
+) -> dict[tuple[str, int], StoredChunkEmbedding]:
+    query_func = partial(
+        _query_vespa_document_chunks,
+        feed_client=feed_client,
+        selected_fields=[DOCUMENT_ID, CHUNK_ID, CONTENT_HASH, EMBEDDINGS],
+        summary=_CHUNK_EMBEDDINGS_SUMMARY,
+        # Every hit carries all the vectors of the chunk, keep the responses small
+        hits_per_page=100,
+    )
+    stored_embeddings: dict[tuple[str, int], StoredChunkEmbedding] = {}
+    for chunk_fields_batch in feed_client.map(
+        query_func, list(batch_generator(document_ids, docs_per_query))
+    ):
+        for chunk_fields in chunk_fields_batch:
+            # Chunks indexed before content hashes were stored can't be verified
+            content_hash = chunk_fields.get(CONTENT_HASH)
+            if not content_hash or EMBEDDINGS not in chunk_fields:
+                continue
+            stored_embeddings[
+                (chunk_fields[DOCUMENT_ID], chunk_fields[CHUNK_ID])
+            ] = StoredChunkEmbedding(
+                content_hash=content_hash,
+                embeddings=_parse_vespa_embeddings(chunk_fields[EMBEDDINGS]),
+            )
+    return stored_embeddings
 
-    if not executor:
-        external_executor = False
-        executor = concurrent.futures.ThreadPoolExecutor(max_workers=_NUM_THREADS)
 
-    document_ids: set[str] = set()
-    try:
-        chunk_existence_future = {
-            executor.submit(
-                _does_document_exist, str(get_uuid_from_chunk(chunk))
-            ): chunk
-            for chunk in chunks
-        }
-        for future in concurrent.futures.as_completed(chunk_existence_future):
-            chunk = chunk_existence_future[future]
-            chunk_already_existed = future.result()
-            if chunk_already_existed:
-                document_ids.add(chunk.source_document.id)
+def _delete_vespa_chunk(chunk_id: str, feed_client: VespaFeedClient) -> None:
+    res = feed_client.send("DELETE", f"{DOCUMENT_ID_ENDPOINT}/{chunk_id}")
+    res.raise_for_status()
+
 
-    finally:
-        if not external_executor:
-            executor.shutdown(wait=True)
+def _delete_vespa_chunks(chunk_ids: list[str], feed_client: VespaFeedClient) -> None:
+    feed_client.map(partial(_delete_vespa_chunk, feed_client=feed_client), chunk_ids)
 
-    return document_ids
+
+def _delete_vespa_docs(
+    document_ids: list[str],
+    feed_client: VespaFeedClient,
+) -> None:
+    doc_chunk_ids = _get_vespa_chunk_ids_by_document_ids(
+        document_ids, feed_client=feed_client
+    )
+    _delete_vespa_chunks(
+        [chunk_id for chunk_ids in doc_chunk_ids.values() for chunk_id in chunk_ids],
+        feed_client=feed_client,
+    )
 
 
-@retry(tries=3, delay=1, backoff=2)
-def _index_vespa_chunk(chunk: DocMetadataAwareIndexChunk) -> None:
+def _index_vespa_chunk(
+    chunk: DocMetadataAwareIndexChunk, feed_client: VespaFeedClient
+) -> None:
     json_header = {
         "Content-Type": "application/json",
     }
@@ -222,10 +346,14 @@ def _index_vespa_chunk(chunk: DocMetadataAwareIndexChunk) -> None:
     vespa_chunk_id = str(get_uuid_from_chunk(chunk))
 
     embeddings = chunk.embeddings
-    embeddings_name_vector_map = {"full_chunk": embeddings.full_embedding}
+    embeddings_name_vector_map = {
+        "full_chunk": quantize_embedding(embeddings.full_embedding)
+    }
     if embeddings.mini_chunk_embeddings:
         for ind, m_c_embed in enumerate(embeddings.mini_chunk_embeddings):
-            embeddings_name_vector_map[f"mini_chunk_{ind}"] = m_c_embed
+            embeddings_name_vector_map[f"mini_chunk_{ind}"] = quantize_embedding(
+                m_c_embed
+            )
 
     vespa_document_fields = {
         DOCUMENT_ID: document.id,
@@ -241,6 +369,8 @@ def _index_vespa_chunk(chunk: DocMetadataAwareIndexChunk) -> None:
         SECTION_CONTINUATION: chunk.section_continuation,
         METADATA: json.dumps(document.metadata),
         EMBEDDINGS: embeddings_name_vector_map,
+        CONTENT_HASH: chunk.content_hash,
+        LLM_TOKEN_COUNTS: chunk.llm_token_counts,
         BOOST: DEFAULT_BOOST,
         DOC_UPDATED_AT: _vespa_get_updated_at_attribute(document.doc_updated_at),
         PRIMARY_OWNERS: get_experts_stores_representations(document.primary_owners),
@@ -258,7 +388,7 @@ def _index_vespa_chunk(chunk: DocMetadataAwareIndexChunk) -> None:
         log_error: bool = True,
     ) -> Response:
         logger.debug(f'Indexing to URL "{url}"')
-        res = requests.post(url, headers=headers, json={"fields": fields})
+        res = feed_client.send("POST", url, headers=headers, json={"fields": fields})
         try:
             res.raise_for_status()
             return res
@@ -306,59 +436,46 @@ def _index_vespa_chunk(chunk: DocMetadataAwareIndexChunk) -> None:
 
 def _batch_index_vespa_chunks(
     chunks: list[DocMetadataAwareIndexChunk],
-    executor: concurrent.futures.ThreadPoolExecutor | None = None,
+    feed_client: VespaFeedClient,
 ) -> None:
-    external_executor = True
-
-    if not executor:
-        external_executor = False
-        executor = concurrent.futures.ThreadPoolExecutor(max_workers=_NUM_THREADS)
-
-    try:
-        chunk_index_future = {
-            executor.submit(_index_vespa_chunk, chunk): chunk for chunk in chunks
-        }
-        for future in concurrent.futures.as_completed(chunk_index_future):
-            # Will raise exception if any indexing raised an exception
-            future.result()
-
-    finally:
-        if not external_executor:
-            executor.shutdown(wait=True)
+    # Will raise exception if any indexing raised an exception
+    feed_client.map(partial(_index_vespa_chunk, feed_client=feed_client), chunks)
 
 
 def _clear_and_index_vespa_chunks(
     chunks: list[DocMetadataAwareIndexChunk],
+    feed_client: VespaFeedClient,
 ) -> set[DocumentInsertionRecord]:
     """Receive a list of chunks from a batch of documents and index the chunks into Vespa along
     with updating the associated permissions. Assumes that a document will not be split into
     multiple chunk batches calling this function multiple times, otherwise only the last set of
     chunks will be kept"""
-    existing_docs: set[str] = set()
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=_NUM_THREADS) as executor:
-        # Check for existing documents, existing documents need to have all of their chunks deleted
-        # prior to indexing as the document size (num chunks) may have shrunk
-        first_chunks = [chunk for chunk in chunks if chunk.chunk_id == 0]
-        for chunk_batch in batch_generator(first_chunks, _BATCH_SIZE):
-            existing_docs.update(
-                _get_existing_documents_from_chunks(
-                    chunks=chunk_batch, executor=executor
-                )
-            )
+    all_doc_ids = {chunk.source_document.id for chunk in chunks}
 
-        for doc_id_batch in batch_generator(existing_docs, _BATCH_SIZE):
-            _delete_vespa_docs(document_ids=doc_id_batch, executor=executor)
+    # Chunks already in the index for these documents. Chunk ids are deterministic, so the
+    # chunks which are still part of the document are simply overwritten when re-fed. Only the
+    # ones beyond the new end of the document (it may have shrunk) need to be deleted
+    existing_chunk_ids = _get_vespa_chunk_ids_by_document_ids(
+        all_doc_ids, feed_client=feed_client
+    )
+    new_chunk_ids = {str(get_uuid_from_chunk(chunk)) for chunk in chunks}
+    stale_chunk_ids = [
+        chunk_id
+        for chunk_ids in existing_chunk_ids.values()
+        for chunk_id in chunk_ids
+        if chunk_id not in new_chunk_ids
+    ]
 
-        for chunk_batch in batch_generator(chunks, _BATCH_SIZE):
-            _batch_index_vespa_chunks(chunks=chunk_batch, executor=executor)
+    for chunk_id_batch in batch_generator(stale_chunk_ids, _BATCH_SIZE):
+        _delete_vespa_chunks(chunk_ids=chunk_id_batch, feed_client=feed_client)
 
-    all_doc_ids = {chunk.source_document.id for chunk in chunks}
+    for chunk_batch in batch_generator(chunks, _BATCH_SIZE):
+        _batch_index_vespa_chunks(chunks=chunk_batch, feed_client=feed_client)
 
     return {
         DocumentInsertionRecord(
             document_id=doc_id,
-            already_existed=doc_id in existing_docs,
+            already_existed=doc_id in existing_chunk_ids,
         )
         for doc_id in all_doc_ids
     }
@@ -417,6 +534,75 @@ def _build_vespa_filters(filters: IndexFilters, include_hidden: bool = False) ->
     return filter_str
 
 
+def _build_nearest_neighbor_clause(
+    target_hits: int,
+    approximate: bool = VESPA_APPROXIMATE_NEAREST_NEIGHBOR,
+    explore_additional_hits: int = VESPA_HNSW_EXPLORE_ADDITIONAL_HITS,
+) -> str:
+    annotations = [f"targetHits: {target_hits}"]
+    if not approximate:
+        annotations.append("approximate: false")
+    elif explore_additional_hits > 0:
+        annotations.append(f"hnsw.exploreAdditionalHits: {explore_additional_hits}")
+    return (
+        f"({{{', '.join(annotations)}}}nearestNeighbor({EMBEDDINGS}, query_embedding))"
+    )
+
+
+def _apply_schema_settings(
+    schema: str,
+    max_links_per_node: int = VESPA_HNSW_MAX_LINKS_PER_NODE,
+    neighbors_to_explore_at_insert: int = VESPA_HNSW_NEIGHBORS_TO_EXPLORE_AT_INSERT,
+    embedding_cell_type: EmbeddingCellType = VESPA_EMBEDDING_CELL_TYPE,
+) -> str:
+    # both the stored embeddings and the query embedding inputs
+    schema = re.sub(r"tensor<\w+>\(", f"tensor<{embedding_cell_type.value}>(", schema)
+    schema = re.sub(
+        r"max-links-per-node: \d+", f"max-links-per-node: {max_links_per_node}", schema
+    )
+    return re.sub(
+        r"neighbors-to-explore-at-insert: \d+",
+        f"neighbors-to-explore-at-insert: {neighbors_to_explore_at_insert}",
+        schema,
+    )
+
+
+def _build_deployment_zip(deployment_zip: str) -> bytes:
+    """The packaged app with the configured settings written into the schema"""
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(deployment_zip) as source_zip, zipfile.ZipFile(
+        zip_buffer, "w", zipfile.ZIP_DEFLATED
+    ) as target_zip:
+        for item in source_zip.infolist():
+            content = source_zip.read(item.filename)
+            if item.filename.endswith(_SCHEMA_FILE_NAME):
+                content = _apply_schema_settings(content.decode("utf-8")).encode(
+                    "utf-8"
+                )
+            target_zip.writestr(item, content)
+    return zip_buffer.getvalue()
+
+
+def _log_config_change_actions(deploy_response: dict[str, Any]) -> None:
+    """Some schema changes are only accepted by Vespa once its services restart or the
+    documents are re-fed, e.g. adding the HNSW index to the embeddings of an existing index
+    needs a restart of the content node so that the graph gets built"""
+    change_actions = deploy_response.get("configChangeActions", {})
+    for restart_action in change_actions.get("restart", []):
+        logger.warning(
+            f"Vespa needs to be restarted for the deployed changes to take effect: "
+            f"{restart_action.get('messages')}. Restart the Vespa container, "
+            f"search falls back to exact nearest neighbor search until then"
+        )
+    for refeed_action in change_actions.get("refeed", []) + change_actions.get(
+        "reindex", []
+    ):
+        logger.error(
+            f"The deployed Vespa schema requires documents to be re-indexed: "
+            f"{refeed_action.get('messages')}"
+        )
+
+
 def _process_dynamic_summary(
     dynamic_summary: str, max_summary_length: int = 400
 ) -> list[str]:
@@ -454,21 +640,138 @@ def _process_dynamic_summary(
     return processed_summary
 
 
-def _vespa_hit_to_inference_chunk(hit: dict[str, Any]) -> InferenceChunk:
+class _ChunkContentFetcher:
+    """Search hits only come with the `chunk_listing` summary, this fetches the content of the
+    chunks of one set of results the first time any of them is read.
+
+    Reading the content of a chunk fetches it for the next `fetch_size` chunks still missing
+    theirs as well, since the chunks are reranked / passed to the LLM from the top down.
+    """
+
+    def __init__(
+        self,
+        query_client: VespaQueryClient,
+        timing_callback: Callable[[RetrievalTiming], None] | None = None,
+        fetch_size: int = VESPA_CHUNK_CONTENT_FETCH_SIZE,
+    ) -> None:
+        self.query_client = query_client
+        self.timing_callback = timing_callback
+        self.fetch_size = fetch_size
+        self._chunks: list[InferenceChunk] = []
+        self._lock = threading.Lock()
+
+    def add(self, chunk: LazyInferenceChunk) -> None:
+        position = len(self._chunks)
+        self._chunks.append(chunk)
+        chunk.content = Deferred(lambda: self._load(position))
+
+    def _load(self, position: int) -> str:
+        chunk = self._chunks[position]
+        with self._lock:
+            # May have been fetched along with another chunk while waiting for the lock
+            if is_deferred(chunk, CONTENT):
+                chunks_to_fetch = [
+                    chunk
+                    for chunk in self._chunks[position:]
+                    if is_deferred(chunk, CONTENT)
+                ][: self.fetch_size]
+                _fetch_chunk_contents(
+                    chunks_to_fetch, self.query_client, self.timing_callback
+                )
+        return chunk.content
+
+
+def _fetch_chunk_contents(
+    chunks: list[InferenceChunk],
+    query_client: VespaQueryClient,
+    timing_callback: Callable[[RetrievalTiming], None] | None = None,
+) -> list[InferenceChunk]:
+    """Returns the chunks that turned out to have no content, these are left with an empty
+    content and should not be used any further"""
+    chunk_filter = " or ".join(
+        f"({DOCUMENT_ID} contains '{_escape_yql_string(chunk.document_id)}' "
+        f"and {CHUNK_ID} = {chunk.chunk_id})"
+        for chunk in chunks
+    )
+    params: dict[str, str | int] = {
+        "yql": (
+            f"select {DOCUMENT_ID}, {CHUNK_ID}, {CONTENT} from {DOCUMENT_INDEX_NAME} "
+            f"where {chunk_filter}"
+        ),
+        "hits": len(chunks),
+        "offset": 0,
+        # Pure filter, no need to spend time ranking the matches
+        "ranking.profile": "unranked",
+        "presentation.summary": _CHUNK_CONTENT_SUMMARY,
+        "timeout": _VESPA_TIMEOUT,
+    }
+    response_json, timing = query_client.search(SEARCH_ENDPOINT, params)
+    if timing_callback is not None:
+        timing_callback(timing)
+
+    fields_by_chunk = {
+        (hit["fields"][DOCUMENT_ID], hit["fields"][CHUNK_ID]): hit["fields"]
+        for hit in response_json["root"].get("children", [])
+    }
+    chunks_without_content: list[InferenceChunk] = []
+    for chunk in chunks:
+        fields = fields_by_chunk.get((chunk.document_id, chunk.chunk_id), {})
+        if fields.get(CONTENT) is None:
+            logger.error(
+                f"Chunk {chunk.chunk_id} of document {chunk.document_id} has no contents. "
+                f"This is invalid because the vector is not meaningful and keywordsearch "
+                f"cannot fetch this document"
+            )
+            chunks_without_content.append(chunk)
+        chunk.content = fields.get(CONTENT) or ""
+    return chunks_without_content
+
+
+def _parse_source_links(source_links: str | dict[str, str]) -> dict[int, str]:
+    source_links_dict_unprocessed = (
+        json.loads(source_links) if isinstance(source_links, str) else source_links
+    )
+    return {
+        int(k): v
+        for k, v in cast(dict[str, str], source_links_dict_unprocessed).items()
+    }
+
+
+def _parse_llm_token_counts(
+    llm_token_counts: list[dict[str, Any]] | dict[str, int] | None
+) -> dict[str, int] | None:
+    if llm_token_counts is None:
+        return None
+    # Maps are rendered as a list of key / value entries unless Vespa is told otherwise
+    if isinstance(llm_token_counts, list):
+        return {entry["key"]: entry["value"] for entry in llm_token_counts}
+    return llm_token_counts
+
+
+def _hit_match_highlights(fields: dict[str, Any], blurb: str) -> list[str]:
+    # Vespa leaves out the dynamic summary of chunks without content, the content itself is
+    # not part of the listing summary (and not worth fetching for this), so show the blurb
+    if CONTENT_SUMMARY not in fields:
+        logger.warning(
+            f"Chunk {fields[CHUNK_ID]} of document {fields[DOCUMENT_ID]} has no content "
+            "summary, using its blurb as the match highlight"
+        )
+        return [blurb] if blurb else []
+    return _process_dynamic_summary(dynamic_summary=fields[CONTENT_SUMMARY])
+
+
+def _vespa_hit_to_inference_chunk(
+    hit: dict[str, Any], content_fetcher: _ChunkContentFetcher
+) -> InferenceChunk:
+    """Only what is needed for ranking is read from the hit here, the rest is decoded (or
+    fetched) once it is first used"""
     fields = cast(dict[str, Any], hit["fields"])
 
-    # parse fields that are stored as strings, but are really json / datetime
-    metadata = json.loads(fields[METADATA]) if METADATA in fields else {}
     updated_at = (
         datetime.fromtimestamp(fields[DOC_UPDATED_AT], tz=timezone.utc)
         if DOC_UPDATED_AT in fields
         else None
     )
-    match_highlights = _process_dynamic_summary(
-        # fallback to regular `content` if the `content_summary` field
-        # isn't present
-        dynamic_summary=hit["fields"].get(CONTENT_SUMMARY, hit["fields"][CONTENT]),
-    )
     semantic_identifier = fields.get(SEMANTIC_IDENTIFIER, "")
     if not semantic_identifier:
         logger.error(
@@ -481,20 +784,12 @@ def _vespa_hit_to_inference_chunk(hit: dict[str, Any]) -> InferenceChunk:
         logger.error(f"Chunk with id {fields.get(semantic_identifier)} ")
         blurb = ""
 
-    source_links = fields.get(SOURCE_LINKS, {})
-    source_links_dict_unprocessed = (
-        json.loads(source_links) if isinstance(source_links, str) else source_links
-    )
-    source_links_dict = {
-        int(k): v
-        for k, v in cast(dict[str, str], source_links_dict_unprocessed).items()
-    }
-
-    return InferenceChunk(
+    chunk = LazyInferenceChunk(
         chunk_id=fields[CHUNK_ID],
         blurb=blurb,
-        content=fields[CONTENT],
-        source_links=source_links_dict,
+        # Content, source links, metadata and match highlights are deferred below
+        content="",
+        source_links=None,
         section_continuation=fields[SECTION_CONTINUATION],
         document_id=fields[DOCUMENT_ID],
         source_type=fields[SOURCE_TYPE],
@@ -505,47 +800,44 @@ def _vespa_hit_to_inference_chunk(hit: dict[str, Any]) -> InferenceChunk:
         hidden=fields.get(HIDDEN, False),
         primary_owners=fields.get(PRIMARY_OWNERS),
         secondary_owners=fields.get(SECONDARY_OWNERS),
-        metadata=metadata,
-        match_highlights=match_highlights,
+        metadata={},
+        match_highlights=[],
         updated_at=updated_at,
+        llm_token_counts=_parse_llm_token_counts(fields.get(LLM_TOKEN_COUNTS)),
+    )
+    content_fetcher.add(chunk)
+    chunk.source_links = Deferred(
+        lambda: _parse_source_links(fields.get(SOURCE_LINKS, {}))
     )
+    # stored as a string, but is really json
+    chunk.metadata = Deferred(
+        lambda: json.loads(fields[METADATA]) if METADATA in fields else {}
+    )
+    chunk.match_highlights = Deferred(lambda: _hit_match_highlights(fields, blurb))
+    return chunk
 
 
-def _query_vespa(query_params: Mapping[str, str | int | float]) -> list[InferenceChunk]:
+def _query_vespa(
+    query_params: Mapping[str, str | int | float],
+    query_client: VespaQueryClient,
+    timing_callback: Callable[[RetrievalTiming], None] | None = None,
+) -> list[InferenceChunk]:
     if "query" in query_params and not cast(str, query_params["query"]).strip():
         raise ValueError("No/empty query received")
 
-    response = requests.get(
+    response_json, timing = query_client.search(
         SEARCH_ENDPOINT,
-        params=dict(
-            **query_params,
-            **{
-                "presentation.timing": True,
-            }
-            if LOG_VESPA_TIMING_INFORMATION
-            else {},
-        ),
+        # The content of the chunks is only fetched once it is needed
+        params={**query_params, "presentation.summary": _CHUNK_LISTING_SUMMARY},
     )
-    response.raise_for_status()
-
-    response_json: dict[str, Any] = response.json()
     if LOG_VESPA_TIMING_INFORMATION:
-        logger.info("Vespa timing info: %s", response_json.get("timing"))
+        logger.info("Vespa timing info: %s", timing)
+    if timing_callback is not None:
+        timing_callback(timing)
     hits = response_json["root"].get("children", [])
 
-    for hit in hits:
-        if hit["fields"].get(CONTENT) is None:
-            identifier = hit["fields"].get("documentid") or hit["id"]
-            logger.error(
-                f"Vespa Index with Vespa ID {identifier} has no contents. "
-                f"This is invalid because the vector is not meaningful and keywordsearch cannot "
-                f"fetch this document"
-            )
-
-    filtered_hits = [hit for hit in hits if hit["fields"].get(CONTENT) is not None]
-
-    inference_chunks = [_vespa_hit_to_inference_chunk(hit) for hit in filtered_hits]
-    return inference_chunks
+    content_fetcher = _ChunkContentFetcher(query_client, timing_callback)
+    return [_vespa_hit_to_inference_chunk(hit, content_fetcher) for hit in hits]
 
 
 class VespaIndex(DocumentIndex):
@@ -555,7 +847,6 @@ class VespaIndex(DocumentIndex):
         f"{DOCUMENT_ID}, "
         f"{CHUNK_ID}, "
         f"{BLURB}, "
-        f"{CONTENT}, "
         f"{SOURCE_TYPE}, "
         f"{SOURCE_LINKS}, "
         f"{SEMANTIC_IDENTIFIER}, "
@@ -563,9 +854,8 @@ class VespaIndex(DocumentIndex):
         f"{BOOST}, "
         f"{HIDDEN}, "
         f"{DOC_UPDATED_AT}, "
-        f"{PRIMARY_OWNERS}, "
-        f"{SECONDARY_OWNERS}, "
         f"{METADATA}, "
+        f"{LLM_TOKEN_COUNTS}, "
         f"{CONTENT_SUMMARY} "
         f"from {DOCUMENT_INDEX_NAME} where "
     )
@@ -574,6 +864,8 @@ class VespaIndex(DocumentIndex):
         # Vespa index name isn't configurable via code alone because of the config .sd file that needs
         # to be updated + zipped + deployed, not supporting the option for simplicity
         self.deployment_zip = deployment_zip
+        self.feed_client = get_vespa_feed_client()
+        self.query_client = get_vespa_query_client()
 
     def ensure_indices_exist(self) -> None:
         """Verifying indices is more involved as there is no good way to
@@ -584,55 +876,56 @@ class VespaIndex(DocumentIndex):
         deploy_url = f"{VESPA_APPLICATION_ENDPOINT}/tenant/default/prepareandactivate"
         logger.debug(f"Sending Vespa zip to {deploy_url}")
         headers = {"Content-Type": "application/zip"}
-        with open(self.deployment_zip, "rb") as f:
-            response = requests.post(deploy_url, headers=headers, data=f)
-            if response.status_code != 200:
-                raise RuntimeError(
-                    f"Failed to prepare Vespa Danswer Index. Response: {response.text}"
-                )
+        response = requests.post(
+            deploy_url,
+            headers=headers,
+            data=_build_deployment_zip(self.deployment_zip),
+        )
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"Failed to prepare Vespa Danswer Index. Response: {response.text}"
+            )
+        _log_config_change_actions(response.json())
 
     def index(
         self,
         chunks: list[DocMetadataAwareIndexChunk],
     ) -> set[DocumentInsertionRecord]:
-        return _clear_and_index_vespa_chunks(chunks=chunks)
+        return _clear_and_index_vespa_chunks(
+            chunks=chunks, feed_client=self.feed_client
+        )
+
+    def get_chunk_embeddings(
+        self, document_ids: list[str]
+    ) -> dict[tuple[str, int], StoredChunkEmbedding]:
+        return _get_vespa_chunk_embeddings(document_ids, feed_client=self.feed_client)
 
-    @staticmethod
     def _apply_updates_batched(
+        self,
         updates: list[_VespaUpdateRequest],
         batch_size: int = _BATCH_SIZE,
     ) -> None:
-        """Runs a batch of updates in parallel via the ThreadPoolExecutor."""
+        """Runs a batch of updates in parallel via the Vespa feed client."""
 
-        def _update_chunk(update: _VespaUpdateRequest) -> Response:
+        def _update_chunk(update: _VespaUpdateRequest) -> None:
             update_body = json.dumps(update.update_request)
             logger.debug(
                 f"Updating with request to {update.url} with body {update_body}"
             )
-            return requests.put(
+            res = self.feed_client.send(
+                "PUT",
                 update.url,
                 headers={"Content-Type": "application/json"},
                 data=update_body,
             )
+            try:
+                res.raise_for_status()
+            except requests.HTTPError as e:
+                failure_msg = f"Failed to update document: {update.document_id}"
+                raise requests.HTTPError(failure_msg) from e
 
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=_NUM_THREADS
-        ) as executor:
-            for update_batch in batch_generator(updates, batch_size):
-                future_to_document_id = {
-                    executor.submit(
-                        _update_chunk,
-                        update,
-                    ): update.document_id
-                    for update in update_batch
-                }
-                for future in concurrent.futures.as_completed(future_to_document_id):
-                    res = future.result()
-                    try:
-                        res.raise_for_status()
-                    except requests.HTTPError as e:
-                        failure_msg = f"Failed to update document: {future_to_document_id[future]}"
-                        raise requests.HTTPError(failure_msg) from e
+        for update_batch in batch_generator(updates, batch_size):
+            self.feed_client.map(_update_chunk, update_batch)
 
     def update(self, update_requests: list[UpdateRequest]) -> None:
         logger.info(f"Updating {len(update_requests)} documents in Vespa")
@@ -662,8 +955,11 @@ class VespaIndex(DocumentIndex):
                 logger.error("Update request received but nothing to update")
                 continue
 
-            for document_id in update_request.document_ids:
-                for doc_chunk_id in _get_vespa_chunk_ids_by_document_id(document_id):
+            doc_chunk_ids = _get_vespa_chunk_ids_by_document_ids(
+                update_request.document_ids, feed_client=self.feed_client
+            )
+            for document_id, chunk_ids in doc_chunk_ids.items():
+                for doc_chunk_id in chunk_ids:
                     processed_updates_requests.append(
                         _VespaUpdateRequest(
                             document_id=document_id,
@@ -679,7 +975,7 @@ class VespaIndex(DocumentIndex):
 
     def delete(self, doc_ids: list[str]) -> None:
         logger.info(f"Deleting {len(doc_ids)} documents from Vespa")
-        _delete_vespa_docs(doc_ids)
+        _delete_vespa_docs(doc_ids, feed_client=self.feed_client)
 
     def keyword_retrieval(
         self,
@@ -687,6 +983,7 @@ class VespaIndex(DocumentIndex):
         filters: IndexFilters,
         favor_recent: bool,
         num_to_retrieve: int = NUM_RETURNED_HITS,
+        timing_callback: Callable[[RetrievalTiming], None] | None = None,
         edit_keyword_query: bool = EDIT_KEYWORD_QUERY,
     ) -> list[InferenceChunk]:
         decay_multiplier = FAVOR_RECENT_DECAY_MULTIPLIER if favor_recent else 1
@@ -701,7 +998,9 @@ class VespaIndex(DocumentIndex):
             + f'or ({{defaultIndex: "{CONTENT_SUMMARY}"}}userInput(@query)))'
         )
 
-        final_query = query_processing(query) if edit_keyword_query else query
+        final_query = (
+            " ".join(normalize_query(query).lemmas) if edit_keyword_query else query
+        )
 
         params: dict[str, str | int] = {
             "yql": yql,
@@ -713,7 +1012,7 @@ class VespaIndex(DocumentIndex):
             "timeout": _VESPA_TIMEOUT,
         }
 
-        return _query_vespa(params)
+        return _query_vespa(params, self.query_client, timing_callback)
 
     def semantic_retrieval(
         self,
@@ -721,15 +1020,18 @@ class VespaIndex(DocumentIndex):
         filters: IndexFilters,
         favor_recent: bool,
         num_to_retrieve: int = NUM_RETURNED_HITS,
+        timing_callback: Callable[[RetrievalTiming], None] | None = None,
         distance_cutoff: float | None = SEARCH_DISTANCE_CUTOFF,
         edit_keyword_query: bool = EDIT_KEYWORD_QUERY,
+        approximate: bool = VESPA_APPROXIMATE_NEAREST_NEIGHBOR,
+        explore_additional_hits: int = VESPA_HNSW_EXPLORE_ADDITIONAL_HITS,
     ) -> list[InferenceChunk]:
         decay_multiplier = FAVOR_RECENT_DECAY_MULTIPLIER if favor_recent else 1
         vespa_where_clauses = _build_vespa_filters(filters)
         yql = (
             VespaIndex.yql_base
             + vespa_where_clauses
-            + f"(({{targetHits: {10 * num_to_retrieve}}}nearestNeighbor(embeddings, query_embedding)) "
+            + f"({_build_nearest_neighbor_clause(10 * num_to_retrieve, approximate, explore_additional_hits)} "
             # `({defaultIndex: "content_summary"}userInput(@query))` section is
             # needed for highlighting while the N-gram highlighting is broken /
             # not working as desired
@@ -739,15 +1041,13 @@ class VespaIndex(DocumentIndex):
         query_embedding = embed_query(query)
 
         query_keywords = (
-            " ".join(remove_stop_words_and_punctuation(query))
-            if edit_keyword_query
-            else query
+            " ".join(normalize_query(query).keywords) if edit_keyword_query else query
         )
 
         params: dict[str, str | int] = {
             "yql": yql,
             "query": query_keywords,  # Needed for highlighting
-            "input.query(query_embedding)": str(query_embedding),
+            "input.query(query_embedding)": str(quantize_embedding(query_embedding)),
             "input.query(decay_factor)": str(DOC_TIME_DECAY * decay_multiplier),
             "hits": num_to_retrieve,
             "offset": 0,
@@ -755,7 +1055,7 @@ class VespaIndex(DocumentIndex):
             "timeout": _VESPA_TIMEOUT,
         }
 
-        return _query_vespa(params)
+        return _query_vespa(params, self.query_client, timing_callback)
 
     def hybrid_retrieval(
         self,
@@ -764,8 +1064,11 @@ class VespaIndex(DocumentIndex):
         favor_recent: bool,
         num_to_retrieve: int,
         hybrid_alpha: float | None = HYBRID_ALPHA,
+        timing_callback: Callable[[RetrievalTiming], None] | None = None,
         distance_cutoff: float | None = SEARCH_DISTANCE_CUTOFF,
         edit_keyword_query: bool = EDIT_KEYWORD_QUERY,
+        approximate: bool = VESPA_APPROXIMATE_NEAREST_NEIGHBOR,
+        explore_additional_hits: int = VESPA_HNSW_EXPLORE_ADDITIONAL_HITS,
     ) -> list[InferenceChunk]:
         decay_multiplier = FAVOR_RECENT_DECAY_MULTIPLIER if favor_recent else 1
         vespa_where_clauses = _build_vespa_filters(filters)
@@ -774,7 +1077,7 @@ class VespaIndex(DocumentIndex):
         yql = (
             VespaIndex.yql_base
             + vespa_where_clauses
-            + f"(({{targetHits: {target_hits}}}nearestNeighbor(embeddings, query_embedding)) "
+            + f"({_build_nearest_neighbor_clause(target_hits, approximate, explore_additional_hits)} "
             + 'or ({grammar: "weakAnd"}userInput(@query)) '
             + f'or ({{defaultIndex: "{CONTENT_SUMMARY}"}}userInput(@query)))'
         )
@@ -782,15 +1085,13 @@ class VespaIndex(DocumentIndex):
         query_embedding = embed_query(query)
 
         query_keywords = (
-            " ".join(remove_stop_words_and_punctuation(query))
-            if edit_keyword_query
-            else query
+            " ".join(normalize_query(query).keywords) if edit_keyword_query else query
         )
 
         params: dict[str, str | int | float] = {
             "yql": yql,
             "query": query_keywords,
-            "input.query(query_embedding)": str(query_embedding),
+            "input.query(query_embedding)": str(quantize_embedding(query_embedding)),
             "input.query(decay_factor)": str(DOC_TIME_DECAY * decay_multiplier),
             "input.query(alpha)": hybrid_alpha
             if hybrid_alpha is not None
@@ -801,13 +1102,14 @@ class VespaIndex(DocumentIndex):
             "timeout": _VESPA_TIMEOUT,
         }
 
-        return _query_vespa(params)
+        return _query_vespa(params, self.query_client, timing_callback)
 
     def admin_retrieval(
         self,
         query: str,
         filters: IndexFilters,
         num_to_retrieve: int = NUM_RETURNED_HITS,
+        timing_callback: Callable[[RetrievalTiming], None] | None = None,
     ) -> list[InferenceChunk]:
         vespa_where_clauses = _build_vespa_filters(filters, include_hidden=True)
         yql = (
@@ -829,4 +1131,25 @@ class VespaIndex(DocumentIndex):
             "timeout": _VESPA_TIMEOUT,
         }
 
-        return _query_vespa(params)
+        return _query_vespa(params, self.query_client, timing_callback)
+
+    def load_chunk_contents(
+        self,
+        chunks: list[InferenceChunk],
+        timing_callback: Callable[[RetrievalTiming], None] | None = None,
+    ) -> list[InferenceChunk]:
+        chunks_to_fetch = [chunk for chunk in chunks if is_deferred(chunk, CONTENT)]
+        if not chunks_to_fetch:
+            return chunks
+        fetch_calls: list[tuple[Callable, tuple]] = [
+            (_fetch_chunk_contents, (chunk_batch, self.query_client, timing_callback))
+            for chunk_batch in batch_generator(
+                chunks_to_fetch, VESPA_CHUNK_CONTENT_FETCH_SIZE
+            )
+        ]
+        chunks_without_content = {
+            id(chunk)
+            for batch_without_content in run_functions_tuples_in_parallel(fetch_calls)
+            for chunk in batch_without_content
+        }
+        return [chunk for chunk in chunks if id(chunk) not in chunks_without_content]
@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from danswer.configs.app_configs import VESPA_QUERY_CIRCUIT_BREAKER_COOLDOWN
+from danswer.configs.app_configs import VESPA_QUERY_CIRCUIT_BREAKER_FAILURES
+from danswer.configs.app_configs import VESPA_QUERY_CONNECT_TIMEOUT
+from danswer.configs.app_configs import VESPA_QUERY_POOL_SIZE
+from danswer.configs.app_configs import VESPA_QUERY_READ_TIMEOUT
+from danswer.search.models import RetrievalTiming
+from danswer.utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+class VespaUnavailableError(RuntimeError):
+    """Raised without reaching Vespa while the circuit breaker is open"""
+
+
+class _CircuitBreaker:
+    """Opens after `failure_threshold` failed requests in a row, requests are then rejected
+    until `cooldown` seconds have passed. After that, a single request is let through and
+    the circuit closes again if it succeeds (half-open state)."""
+
+    def __init__(self, failure_threshold: int, cooldown: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self._consecutive_failures = 0
+        self._opened_at: float | None = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if (
+                time.monotonic() - self._opened_at < self.cooldown
+                or self._trial_in_flight
+            ):
+                raise VespaUnavailableError(
+                    f"Vespa failed {self._consecutive_failures} queries in a row, "
+                    f"not sending queries to it for now"
+                )
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Vespa is answering queries again, closing the circuit")
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._trial_in_flight or (
+                self._opened_at is None
+                and self._consecutive_failures >= self.failure_threshold
+            ):
+                logger.error(
+                    f"Vespa failed {self._consecutive_failures} queries in a row, "
+                    f"failing queries for the next {self.cooldown} seconds"
+                )
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """For a request that ended without telling whether Vespa is healthy again, lets the
+        next request be the trial instead"""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class VespaQueryClient:
+    """Sends search queries to Vespa over a pool of persistent keep-alive connections, so
+    that a search does not pay for setting up new connections to the Vespa container.
+
+    Every query returns the time spent on it along with the response. Failing queries are not
+    retried, search is latency sensitive, but enough of them in a row make the client fail fast
+    for a while instead of piling up requests on a Vespa that is down or overloaded."""
+
+    def __init__(
+        self,
+        pool_size: int = VESPA_QUERY_POOL_SIZE,
+        connect_timeout: float = VESPA_QUERY_CONNECT_TIMEOUT,
+        read_timeout: float = VESPA_QUERY_READ_TIMEOUT,
+        circuit_breaker_failures: int = VESPA_QUERY_CIRCUIT_BREAKER_FAILURES,
+        circuit_breaker_cooldown: float = VESPA_QUERY_CIRCUIT_BREAKER_COOLDOWN,
+    ) -> None:
+        self.timeout = (connect_timeout, read_timeout)
+        self.circuit_breaker = _CircuitBreaker(
+            failure_threshold=circuit_breaker_failures,
+            cooldown=circuit_breaker_cooldown,
+        )
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def search(
+        self, url: str, params: dict[str, Any]
+    ) -> tuple[dict[str, Any], RetrievalTiming]:
+        """Vespa's own timing is always requested, it is what the network time is derived
+        from. Responses with an error status raise `requests.HTTPError`."""
+        self.circuit_breaker.before_request()
+
+        outcome_recorded = False
+        try:
+            start = time.monotonic()
+            try:
+                response = self.session.get(
+                    url,
+                    params={**params, "presentation.timing": True},
+                    timeout=self.timeout,
+                )
+            except requests.RequestException:
+                outcome_recorded = True
+                self.circuit_breaker.record_failure()
+                raise
+            round_trip = time.monotonic() - start
+
+            # Bad queries are not a sign of Vespa being unhealthy
+            outcome_recorded = True
+            if response.status_code >= 500:
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.record_success()
+        finally:
+            # Any other error, the trial request (if this was it) must not stay in flight
+            # forever or the circuit would never close again
+            if not outcome_recorded:
+                self.circuit_breaker.release_trial()
+        response.raise_for_status()
+
+        decode_start = time.monotonic()
+        response_json: dict[str, Any] = json.loads(response.content)
+        json_decode = time.monotonic() - decode_start
+
+        vespa_timing = response_json.get("timing", {})
+        search_time = vespa_timing.get("searchtime")
+        timing = RetrievalTiming(
+            total=round_trip + json_decode,
+            query=vespa_timing.get("querytime"),
+            summary_fetch=vespa_timing.get("summaryfetchtime"),
+            network=max(0.0, round_trip - search_time)
+            if search_time is not None
+            else round_trip,
+            json_decode=json_decode,
+        )
+        return response_json, timing
+
+
+_VESPA_QUERY_CLIENT: VespaQueryClient | None = None
+_VESPA_QUERY_CLIENT_LOCK = threading.Lock()
+
+
+def get_vespa_query_client() -> VespaQueryClient:
+    """Shared by all `VespaIndex` instances of the process, like the feed client, so that the
+    connections (and the circuit breaker state) outlive any single search"""
+    global _VESPA_QUERY_CLIENT
+    with _VESPA_QUERY_CLIENT_LOCK:
+        if _VESPA_QUERY_CLIENT is None:
+            _VESPA_QUERY_CLIENT = VespaQueryClient()
+    return _VESPA_QUERY_CLIENT
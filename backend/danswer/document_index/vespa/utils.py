@@ -1,5 +1,9 @@
 import re
 
+import numpy as np
+
+from danswer.configs.app_configs import VESPA_EMBEDDING_CELL_TYPE
+from danswer.configs.constants import EmbeddingCellType
 
 _illegal_xml_chars_RE = re.compile(
     "[\x00-\x08\x0b\x0c\x0e-\x1F\uD800-\uDFFF\uFFFE\uFFFF]"
@@ -10,3 +14,20 @@ def remove_invalid_unicode_chars(text: str) -> str:
     """Vespa does not take in unicode chars that aren't valid for XML.
     This removes them."""
     return _illegal_xml_chars_RE.sub("", text)
+
+
+def quantize_embedding(
+    embedding: list[float], cell_type: EmbeddingCellType = VESPA_EMBEDDING_CELL_TYPE
+) -> list[float] | list[int]:
+    """Vespa converts floats to bfloat16 cells itself, int8 cells need the values to already
+    be integers. Each vector gets its own scale so that its largest component maps to 127,
+    the scale is not kept since the angular distance does not depend on the vector length
+    """
+    if cell_type != EmbeddingCellType.INT8:
+        return embedding
+
+    vector = np.asarray(embedding, dtype=np.float32)
+    max_abs = float(np.abs(vector).max()) if vector.size else 0.0
+    if max_abs == 0:
+        return [0] * len(embedding)
+    return np.rint(vector * (127 / max_abs)).astype(np.int8).tolist()
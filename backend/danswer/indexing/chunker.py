@@ -1,38 +1,91 @@
 import abc
+import multiprocessing
 from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+from functools import lru_cache
+from itertools import chain
 
 from llama_index.text_splitter import SentenceSplitter
-from transformers import AutoTokenizer  # type:ignore
 
 from danswer.configs.app_configs import BLURB_SIZE
 from danswer.configs.app_configs import CHUNK_OVERLAP
 from danswer.configs.app_configs import CHUNK_SIZE
+from danswer.configs.app_configs import INDEXING_CHUNKING_PROCESSES
 from danswer.configs.app_configs import MINI_CHUNK_SIZE
 from danswer.connectors.models import Document
 from danswer.connectors.models import Section
+from danswer.indexing.models import BaseChunk
 from danswer.indexing.models import DocAwareChunk
-from danswer.search.search_nlp_models import get_default_tokenizer
+from danswer.search.tokenizer import get_default_tokenizer
 from danswer.utils.text_processing import shared_precompare_cleanup
 
 
 SECTION_SEPARATOR = "\n\n"
 ChunkFunc = Callable[[Document], list[DocAwareChunk]]
+# Tokenizers other than WordPiece can merge the characters around a section separator into
+# different tokens, this many characters on either side of it are tokenized again
+_BOUNDARY_CONTEXT_CHARS = 32
 
 
-def extract_blurb(text: str, blurb_size: int) -> str:
-    token_count_func = get_default_tokenizer().tokenize
-    blurb_splitter = SentenceSplitter(
-        tokenizer=token_count_func, chunk_size=blurb_size, chunk_overlap=0
+@lru_cache(maxsize=4096)
+def _count_tokens(text: str) -> int:
+    return len(get_default_tokenizer().tokenize(text))
+
+
+@lru_cache(maxsize=1)
+def _token_counts_add_up() -> bool:
+    """WordPiece tokenizers split the text on whitespace before anything else, so the token
+    count of sections joined by SECTION_SEPARATOR is the sum of their token counts"""
+    tokenizer = get_default_tokenizer()
+    backend_tokenizer = getattr(tokenizer, "backend_tokenizer", None)
+    if backend_tokenizer is not None:
+        return type(backend_tokenizer.model).__name__ == "WordPiece"
+    return hasattr(tokenizer, "wordpiece_tokenizer")
+
+
+def _splitter_tokenize(text: str) -> range:
+    # The splitter only ever takes the len() of what the tokenizer returns. It measures the
+    # same pieces of text repeatedly (once while splitting, again while merging)
+    return range(_count_tokens(text))
+
+
+@lru_cache(maxsize=16)
+def get_sentence_splitter(chunk_size: int, chunk_overlap: int = 0) -> SentenceSplitter:
+    """Building a splitter loads the NLTK sentence tokenizer, so instances are shared"""
+    return SentenceSplitter(
+        tokenizer=_splitter_tokenize, chunk_size=chunk_size, chunk_overlap=chunk_overlap
     )
 
-    return blurb_splitter.split_text(text)[0]
+
+def _boundary_token_correction(chunk_texts: list[str], section_text: str) -> int:
+    """Tokens the section adds when joined onto the chunk beyond the token counts of the
+    separator and the section, as counted around the boundary (may be negative)"""
+    tail_parts: list[str] = []
+    tail_len = 0
+    for chunk_text in reversed(chunk_texts):
+        tail_parts.append(chunk_text)
+        tail_len += len(chunk_text) + len(SECTION_SEPARATOR)
+        if tail_len >= _BOUNDARY_CONTEXT_CHARS:
+            break
+    tail = SECTION_SEPARATOR.join(reversed(tail_parts))[-_BOUNDARY_CONTEXT_CHARS:]
+    head = section_text[:_BOUNDARY_CONTEXT_CHARS]
+    return (
+        _count_tokens(tail + SECTION_SEPARATOR + head)
+        - _count_tokens(tail)
+        - _count_tokens(SECTION_SEPARATOR)
+        - _count_tokens(head)
+    )
+
+
+def extract_blurb(text: str, blurb_size: int) -> str:
+    return get_sentence_splitter(blurb_size).split_text(text)[0]
 
 
 def chunk_large_section(
     section: Section,
     document: Document,
     start_chunk_id: int,
-    tokenizer: AutoTokenizer,
     chunk_size: int = CHUNK_SIZE,
     chunk_overlap: int = CHUNK_OVERLAP,
     blurb_size: int = BLURB_SIZE,
@@ -41,12 +94,10 @@ def chunk_large_section(
     section_link_text = section.link or ""
     blurb = extract_blurb(section_text, blurb_size)
 
-    sentence_aware_splitter = SentenceSplitter(
-        tokenizer=tokenizer.tokenize, chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    split_texts = get_sentence_splitter(chunk_size, chunk_overlap).split_text(
+        section_text
     )
 
-    split_texts = sentence_aware_splitter.split_text(section_text)
-
     chunks = [
         DocAwareChunk(
             source_document=document,
@@ -67,39 +118,49 @@ def chunk_document(
     subsection_overlap: int = CHUNK_OVERLAP,
     blurb_size: int = BLURB_SIZE,
 ) -> list[DocAwareChunk]:
-    tokenizer = get_default_tokenizer()
+    """Each section is tokenized only once. The token length of the chunk being built is kept
+    as a running sum of its sections and separators rather than re-tokenizing the growing text,
+    which is exact for tokenizers that split on whitespace first (such as WordPiece). For other
+    tokenizers the sum is corrected by tokenizing the text around each section boundary
+    """
+    separator_tok_length = _count_tokens(SECTION_SEPARATOR)
 
     chunks: list[DocAwareChunk] = []
     link_offsets: dict[int, str] = {}
-    chunk_text = ""
+    chunk_texts: list[str] = []
+    chunk_text_len = 0
+    chunk_tok_length = 0
+    # Length of the chunk text after the cleanup used for matching quotes against it
+    chunk_offset_len = 0
+
+    def _build_chunk() -> DocAwareChunk:
+        chunk_text = SECTION_SEPARATOR.join(chunk_texts)
+        return DocAwareChunk(
+            source_document=document,
+            chunk_id=len(chunks),
+            blurb=extract_blurb(chunk_text, blurb_size),
+            content=chunk_text,
+            source_links=link_offsets,
+            section_continuation=False,
+        )
+
     for section in document.sections:
         section_link_text = section.link or ""
-        section_tok_length = len(tokenizer.tokenize(section.text))
-        current_tok_length = len(tokenizer.tokenize(chunk_text))
-        curr_offset_len = len(shared_precompare_cleanup(chunk_text))
+        section_tok_length = _count_tokens(section.text)
 
         # Large sections are considered self-contained/unique therefore they start a new chunk and are not concatenated
         # at the end by other sections
         if section_tok_length > chunk_tok_size:
-            if chunk_text:
-                chunks.append(
-                    DocAwareChunk(
-                        source_document=document,
-                        chunk_id=len(chunks),
-                        blurb=extract_blurb(chunk_text, blurb_size),
-                        content=chunk_text,
-                        source_links=link_offsets,
-                        section_continuation=False,
-                    )
-                )
+            if chunk_text_len:
+                chunks.append(_build_chunk())
                 link_offsets = {}
-                chunk_text = ""
+                chunk_texts = []
+                chunk_text_len = chunk_tok_length = chunk_offset_len = 0
 
             large_section_chunks = chunk_large_section(
                 section=section,
                 document=document,
                 start_chunk_id=len(chunks),
-                tokenizer=tokenizer,
                 chunk_size=chunk_tok_size,
                 chunk_overlap=subsection_overlap,
                 blurb_size=blurb_size,
@@ -107,55 +168,46 @@ def chunk_document(
             chunks.extend(large_section_chunks)
             continue
 
+        section_offset_len = len(shared_precompare_cleanup(section.text))
         # In the case where the whole section is shorter than a chunk, either adding to chunk or start a new one
         if (
-            current_tok_length
-            + len(tokenizer.tokenize(SECTION_SEPARATOR))
-            + section_tok_length
+            chunk_tok_length + separator_tok_length + section_tok_length
             <= chunk_tok_size
         ):
-            chunk_text += (
-                SECTION_SEPARATOR + section.text if chunk_text else section.text
-            )
-            link_offsets[curr_offset_len] = section_link_text
+            link_offsets[chunk_offset_len] = section_link_text
+            if chunk_text_len:
+                if not _token_counts_add_up():
+                    chunk_tok_length += _boundary_token_correction(
+                        chunk_texts, section.text
+                    )
+                chunk_texts.append(section.text)
+                chunk_text_len += len(SECTION_SEPARATOR) + len(section.text)
+                chunk_tok_length += separator_tok_length + section_tok_length
+            else:
+                # An empty chunk may still hold empty sections, they don't show up in the text
+                chunk_texts = [section.text]
+                chunk_text_len = len(section.text)
+                chunk_tok_length = section_tok_length
+            # the separator is whitespace, which the cleanup strips
+            chunk_offset_len += section_offset_len
         else:
-            chunks.append(
-                DocAwareChunk(
-                    source_document=document,
-                    chunk_id=len(chunks),
-                    blurb=extract_blurb(chunk_text, blurb_size),
-                    content=chunk_text,
-                    source_links=link_offsets,
-                    section_continuation=False,
-                )
-            )
+            chunks.append(_build_chunk())
             link_offsets = {0: section_link_text}
-            chunk_text = section.text
+            chunk_texts = [section.text]
+            chunk_text_len = len(section.text)
+            chunk_tok_length = section_tok_length
+            chunk_offset_len = section_offset_len
 
     # Once we hit the end, if we're still in the process of building a chunk, add what we have
-    if chunk_text:
-        chunks.append(
-            DocAwareChunk(
-                source_document=document,
-                chunk_id=len(chunks),
-                blurb=extract_blurb(chunk_text, blurb_size),
-                content=chunk_text,
-                source_links=link_offsets,
-                section_continuation=False,
-            )
-        )
+    if chunk_text_len:
+        chunks.append(_build_chunk())
     return chunks
 
 
 def split_chunk_text_into_mini_chunks(
     chunk_text: str, mini_chunk_size: int = MINI_CHUNK_SIZE
 ) -> list[str]:
-    token_count_func = get_default_tokenizer().tokenize
-    sentence_aware_splitter = SentenceSplitter(
-        tokenizer=token_count_func, chunk_size=mini_chunk_size, chunk_overlap=0
-    )
-
-    return sentence_aware_splitter.split_text(chunk_text)
+    return get_sentence_splitter(mini_chunk_size).split_text(chunk_text)
 
 
 class Chunker:
@@ -163,7 +215,87 @@ class Chunker:
     def chunk(self, document: Document) -> list[DocAwareChunk]:
         raise NotImplementedError
 
+    def chunk_batch(self, documents: list[Document]) -> list[DocAwareChunk]:
+        return list(chain(*[self.chunk(document=document) for document in documents]))
+
 
 class DefaultChunker(Chunker):
     def chunk(self, document: Document) -> list[DocAwareChunk]:
         return chunk_document(document)
+
+
+def _init_chunking_worker() -> None:
+    # Load the tokenizer when the worker starts rather than on the first document it gets
+    get_default_tokenizer()
+
+
+def _chunk_document_in_worker(document: Document) -> list[BaseChunk]:
+    # The document is not sent back along with every chunk, the caller re-attaches it
+    return [
+        BaseChunk(
+            **{field.name: getattr(chunk, field.name) for field in fields(BaseChunk)}
+        )
+        for chunk in chunk_document(document)
+    ]
+
+
+_CHUNKING_EXECUTOR: ProcessPoolExecutor | None = None
+
+
+def get_chunking_executor(
+    num_processes: int = INDEXING_CHUNKING_PROCESSES,
+) -> ProcessPoolExecutor:
+    """The pool lives as long as the process so that the workers and their tokenizers are
+    reused across batches and indexing attempts"""
+    global _CHUNKING_EXECUTOR
+    if _CHUNKING_EXECUTOR is None:
+        _CHUNKING_EXECUTOR = ProcessPoolExecutor(
+            max_workers=num_processes,
+            # Forking a process which already runs torch / tokenizer threads is not safe. A
+            # spawned worker runs the main script of the process again though, for the indexing
+            # jobs that's background/update.py which imports torch, TensorFlow and the whole
+            # indexing stack. That's on the order of 10s and 800MB per worker, paid once since
+            # the pool is kept for the life of the process
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_chunking_worker,
+        )
+    return _CHUNKING_EXECUTOR
+
+
+class ProcessPoolChunker(DefaultChunker):
+    """Chunks the documents of a batch in parallel across a pool of processes, chunking is
+    CPU bound (tokenization + sentence splitting) so threads would not help.
+
+    The indexing job must be allowed to have child processes, see `update_loop` for how the
+    job workers are configured when this is enabled"""
+
+    def __init__(self, num_processes: int = INDEXING_CHUNKING_PROCESSES) -> None:
+        self.num_processes = num_processes
+
+    def chunk_batch(self, documents: list[Document]) -> list[DocAwareChunk]:
+        if len(documents) <= 1:
+            return super().chunk_batch(documents)
+
+        executor = get_chunking_executor(self.num_processes)
+        chunks: list[DocAwareChunk] = []
+        # map keeps the order of the documents, chunk ids are assigned per document
+        for document, base_chunks in zip(
+            documents, executor.map(_chunk_document_in_worker, documents)
+        ):
+            chunks.extend(
+                DocAwareChunk(
+                    **{
+                        field.name: getattr(base_chunk, field.name)
+                        for field in fields(BaseChunk)
+                    },
+                    source_document=document,
+                )
+                for base_chunk in base_chunks
+            )
+        return chunks
+
+
+def get_default_chunker() -> Chunker:
+    if INDEXING_CHUNKING_PROCESSES > 0:
+        return ProcessPoolChunker()
+    return DefaultChunker()
@@ -1,16 +1,87 @@
+import hashlib
+
 from sentence_transformers import SentenceTransformer  # type: ignore
 
 from danswer.configs.app_configs import ENABLE_MINI_CHUNK
+from danswer.configs.app_configs import MINI_CHUNK_SIZE
+from danswer.configs.app_configs import VESPA_EMBEDDING_CELL_TYPE
+from danswer.configs.constants import EmbeddingCellType
 from danswer.configs.model_configs import ASYM_PASSAGE_PREFIX
 from danswer.configs.model_configs import BATCH_SIZE_ENCODE_CHUNKS
+from danswer.configs.model_configs import DOC_EMBEDDING_CONTEXT_SIZE
+from danswer.configs.model_configs import DOCUMENT_ENCODER_MODEL
+from danswer.configs.model_configs import EMBEDDING_BATCH_TOKEN_BUDGET
+from danswer.configs.model_configs import MAX_BATCH_SIZE_ENCODE_CHUNKS
+from danswer.configs.model_configs import NORMALIZE_EMBEDDINGS
 from danswer.indexing.chunker import split_chunk_text_into_mini_chunks
 from danswer.indexing.models import ChunkEmbedding
 from danswer.indexing.models import DocAwareChunk
 from danswer.indexing.models import IndexChunk
+from danswer.indexing.models import StoredChunkEmbedding
+from danswer.llm.utils import get_llm_token_counts
 from danswer.search.models import Embedder
 from danswer.search.search_nlp_models import EmbeddingModel
+from danswer.search.tokenizer import get_default_tokenizer
+from danswer.utils.logger import setup_logger
 from danswer.utils.timing import log_function_time
 
+logger = setup_logger()
+
+
+def build_token_budget_batches(
+    token_counts: list[int],
+    token_budget: int = EMBEDDING_BATCH_TOKEN_BUDGET,
+    max_batch_size: int = MAX_BATCH_SIZE_ENCODE_CHUNKS,
+) -> list[list[int]]:
+    """Groups the indices of texts of similar length together. Each batch is padded to its
+    longest text, so a batch is closed once (number of texts * longest text) would exceed the
+    token budget. Every batch holds at least one text."""
+    batches: list[list[int]] = []
+    current_batch: list[int] = []
+    for ind in sorted(range(len(token_counts)), key=lambda i: token_counts[i]):
+        # sorted ascending, so the newest text is always the longest of the batch
+        padded_batch_tokens = (len(current_batch) + 1) * token_counts[ind]
+        if current_batch and (
+            padded_batch_tokens > token_budget or len(current_batch) >= max_batch_size
+        ):
+            batches.append(current_batch)
+            current_batch = []
+        current_batch.append(ind)
+
+    if current_batch:
+        batches.append(current_batch)
+    return batches
+
+
+def _get_token_counts(
+    texts: list[str], max_seq_length: int = DOC_EMBEDDING_CONTEXT_SIZE
+) -> list[int]:
+    tokenizer = get_default_tokenizer()
+    token_ids = tokenizer(texts, add_special_tokens=True, truncation=False)["input_ids"]
+    # The model truncates anything longer, so it never costs more than max_seq_length
+    return [min(len(ids), max_seq_length) for ids in token_ids]
+
+
+def compute_chunk_content_hash(
+    chunk: DocAwareChunk,
+    passage_prefix: str = ASYM_PASSAGE_PREFIX,
+    enable_mini_chunk: bool = ENABLE_MINI_CHUNK,
+    model_name: str = DOCUMENT_ENCODER_MODEL,
+    embedding_cell_type: EmbeddingCellType = VESPA_EMBEDDING_CELL_TYPE,
+) -> str:
+    """Fingerprint of everything that goes into the embeddings of a chunk, changing the
+    model or any of the embedding settings invalidates all the previously stored embeddings
+    """
+    # The cell type is included since the stored embeddings are read back at the precision
+    # they were stored with, going back to a more precise type should re-encode the chunks
+    embedding_settings = (
+        f"{model_name}|{NORMALIZE_EMBEDDINGS}|{passage_prefix}|"
+        f"{MINI_CHUNK_SIZE if enable_mini_chunk else 0}|{embedding_cell_type.value}|"
+    )
+    return hashlib.sha256(
+        (embedding_settings + chunk.content).encode("utf-8")
+    ).hexdigest()
+
 
 @log_function_time()
 def embed_chunks(
@@ -19,14 +90,37 @@ def embed_chunks(
     batch_size: int = BATCH_SIZE_ENCODE_CHUNKS,
     enable_mini_chunk: bool = ENABLE_MINI_CHUNK,
     passage_prefix: str = ASYM_PASSAGE_PREFIX,
+    token_budget: int = EMBEDDING_BATCH_TOKEN_BUDGET,
+    stored_embeddings: dict[tuple[str, int], StoredChunkEmbedding] | None = None,
 ) -> list[IndexChunk]:
+    """Chunks whose content hash matches the one of their `stored_embeddings` entry keep the
+    stored embeddings, only the new or changed chunks are passed through the model"""
     embedded_chunks: list[IndexChunk] = []
     if embedding_model is None:
         embedding_model = EmbeddingModel()
 
+    content_hashes = [
+        compute_chunk_content_hash(
+            chunk, passage_prefix=passage_prefix, enable_mini_chunk=enable_mini_chunk
+        )
+        for chunk in chunks
+    ]
+    reused_embeddings: dict[int, ChunkEmbedding] = {}
+    if stored_embeddings:
+        for chunk_ind, chunk in enumerate(chunks):
+            stored = stored_embeddings.get((chunk.source_document.id, chunk.chunk_id))
+            if stored is not None and stored.content_hash == content_hashes[chunk_ind]:
+                reused_embeddings[chunk_ind] = stored.embeddings
+        if reused_embeddings:
+            logger.debug(
+                f"Reusing stored embeddings for {len(reused_embeddings)} out of {len(chunks)} chunks"
+            )
+
     chunk_texts = []
     chunk_mini_chunks_count = {}
     for chunk_ind, chunk in enumerate(chunks):
+        if chunk_ind in reused_embeddings:
+            continue
         chunk_texts.append(passage_prefix + chunk.content)
         mini_chunk_texts = (
             split_chunk_text_into_mini_chunks(chunk.content)
@@ -37,37 +131,61 @@ def embed_chunks(
         chunk_texts.extend(prefixed_mini_chunk_texts)
         chunk_mini_chunks_count[chunk_ind] = 1 + len(prefixed_mini_chunk_texts)
 
-    text_batches = [
-        chunk_texts[i : i + batch_size] for i in range(0, len(chunk_texts), batch_size)
-    ]
+    if token_budget > 0 and chunk_texts:
+        index_batches = build_token_budget_batches(
+            _get_token_counts(chunk_texts), token_budget=token_budget
+        )
+    else:
+        index_batches = [
+            list(range(i, min(i + batch_size, len(chunk_texts))))
+            for i in range(0, len(chunk_texts), batch_size)
+        ]
 
-    embeddings: list[list[float]] = []
-    for text_batch in text_batches:
+    # Batches are not in document order, embeddings are scattered back to their text's position
+    embeddings: list[list[float]] = [[] for _ in chunk_texts]
+    for index_batch in index_batches:
+        text_batch = [chunk_texts[ind] for ind in index_batch]
         # Normalize embeddings is only configured via model_configs.py, be sure to use right value for the set loss
-        embeddings.extend(embedding_model.encode(text_batch))
+        batch_embeddings = embedding_model.encode(text_batch)
 
         # Replace line above with the line below for easy debugging of indexing flow, skipping the actual model
-        # embeddings.extend([[0.0] * 384 for _ in range(len(text_batch))])
+        # batch_embeddings = [[0.0] * 384 for _ in range(len(text_batch))]
+
+        for ind, embedding in zip(index_batch, batch_embeddings):
+            embeddings[ind] = embedding
+
+    # Counted here once so that packing the chunks into prompts doesn't have to tokenize them
+    llm_token_counts = get_llm_token_counts([chunk.content for chunk in chunks])
 
     embedding_ind_start = 0
     for chunk_ind, chunk in enumerate(chunks):
-        num_embeddings = chunk_mini_chunks_count[chunk_ind]
-        chunk_embeddings = embeddings[
-            embedding_ind_start : embedding_ind_start + num_embeddings
-        ]
-        new_embedded_chunk = IndexChunk(
-            **{k: getattr(chunk, k) for k in chunk.__dataclass_fields__},
-            embeddings=ChunkEmbedding(
+        chunk_embedding = reused_embeddings.get(chunk_ind)
+        if chunk_embedding is None:
+            num_embeddings = chunk_mini_chunks_count[chunk_ind]
+            chunk_embeddings = embeddings[
+                embedding_ind_start : embedding_ind_start + num_embeddings
+            ]
+            chunk_embedding = ChunkEmbedding(
                 full_embedding=chunk_embeddings[0],
                 mini_chunk_embeddings=chunk_embeddings[1:],
-            ),
+            )
+            embedding_ind_start += num_embeddings
+
+        new_embedded_chunk = IndexChunk(
+            **{k: getattr(chunk, k) for k in chunk.__dataclass_fields__},
+            embeddings=chunk_embedding,
+            content_hash=content_hashes[chunk_ind],
+            llm_token_counts=llm_token_counts[chunk_ind],
         )
         embedded_chunks.append(new_embedded_chunk)
-        embedding_ind_start += num_embeddings
 
     return embedded_chunks
 
 
 class DefaultEmbedder(Embedder):
-    def embed(self, chunks: list[DocAwareChunk]) -> list[IndexChunk]:
-        return embed_chunks(chunks)
+    def embed(
+        self,
+        chunks: list[DocAwareChunk],
+        stored_embeddings: dict[tuple[str, int], StoredChunkEmbedding] | None = None,
+    ) -> list[IndexChunk]:
+        return embed_chunks(chunks, stored_embeddings=stored_embeddings)
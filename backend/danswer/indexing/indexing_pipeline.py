@@ -1,10 +1,22 @@
+import queue
+import threading
+from collections import deque
+from collections.abc import Generator
+from collections.abc import Iterable
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from dataclasses import dataclass
 from functools import partial
-from itertools import chain
+from typing import Any
 from typing import Protocol
 
 from sqlalchemy.orm import Session
 
 from danswer.access.access import get_access_for_documents
+from danswer.configs.app_configs import PIPELINED_INDEXING_NUM_WRITERS
+from danswer.configs.app_configs import PIPELINED_INDEXING_QUEUE_SIZE
+from danswer.configs.app_configs import REUSE_STORED_CHUNK_EMBEDDINGS
 from danswer.connectors.cross_connector_utils.miscellaneous_utils import (
     get_experts_stores_representations,
 )
@@ -24,6 +36,7 @@ from danswer.indexing.chunker import DefaultChunker
 from danswer.indexing.embedder import DefaultEmbedder
 from danswer.indexing.models import DocAwareChunk
 from danswer.indexing.models import DocMetadataAwareIndexChunk
+from danswer.indexing.models import IndexChunk
 from danswer.search.models import Embedder
 from danswer.utils.logger import setup_logger
 
@@ -65,44 +78,86 @@ def upsert_documents_in_db(
     )
 
 
-def _indexing_pipeline(
+@dataclass
+class EmbeddedDocumentBatch:
+    # the full batch as received from the connector, used for progress tracking
+    documents: list[Document]
+    # the subset of the batch which has changed since it was last indexed
+    updatable_docs: list[Document]
+    chunks_with_embeddings: list[IndexChunk]
+
+
+def _chunk_and_embed_documents(
     *,
     chunker: Chunker,
     embedder: Embedder,
     document_index: DocumentIndex,
     documents: list[Document],
-    index_attempt_metadata: IndexAttemptMetadata,
     ignore_time_skip: bool = False,
-) -> tuple[int, int]:
-    """Takes different pieces of the indexing pipeline and applies it to a batch of documents
-    Note that the documents should already be batched at this point so that it does not inflate the
-    memory requirements"""
-    with Session(get_sqlalchemy_engine()) as db_session:
-        document_ids = [document.id for document in documents]
+    reuse_stored_embeddings: bool = REUSE_STORED_CHUNK_EMBEDDINGS,
+) -> EmbeddedDocumentBatch:
+    """First half of the pipeline, does not modify anything so it does not need to hold the
+    document locks"""
+    if ignore_time_skip:
+        updatable_docs = documents
+    else:
+        with Session(get_sqlalchemy_engine()) as db_session:
+            # Skip indexing docs that don't have a newer updated at
+            # Shortcuts the time-consuming flow on connector index retries
+            db_docs = get_documents_by_ids(
+                document_ids=[document.id for document in documents],
+                db_session=db_session,
+            )
+            id_update_time_map = {
+                doc.id: doc.doc_updated_at for doc in db_docs if doc.doc_updated_at
+            }
 
-        # Skip indexing docs that don't have a newer updated at
-        # Shortcuts the time-consuming flow on connector index retries
-        db_docs = get_documents_by_ids(
-            document_ids=document_ids,
-            db_session=db_session,
+        updatable_docs = []
+        for doc in documents:
+            if (
+                doc.id in id_update_time_map
+                and doc.doc_updated_at
+                and doc.doc_updated_at <= id_update_time_map[doc.id]
+            ):
+                continue
+            updatable_docs.append(doc)
+
+    logger.debug("Starting chunking")
+    chunks: list[DocAwareChunk] = chunker.chunk_batch(updatable_docs)
+
+    # Chunks which have not changed since they were last indexed (e.g. all but the last
+    # chunk of a thread that got a new reply) can keep their embeddings from the index
+    stored_embeddings = (
+        document_index.get_chunk_embeddings(
+            document_ids=[doc.id for doc in updatable_docs]
         )
-        id_update_time_map = {
-            doc.id: doc.doc_updated_at for doc in db_docs if doc.doc_updated_at
-        }
+        if reuse_stored_embeddings and updatable_docs
+        else None
+    )
+
+    logger.debug("Starting embedding")
+    chunks_with_embeddings = embedder.embed(
+        chunks=chunks, stored_embeddings=stored_embeddings
+    )
+
+    return EmbeddedDocumentBatch(
+        documents=documents,
+        updatable_docs=updatable_docs,
+        chunks_with_embeddings=chunks_with_embeddings,
+    )
 
-        updatable_docs: list[Document] = []
-        if ignore_time_skip:
-            updatable_docs = documents
-        else:
-            for doc in documents:
-                if (
-                    doc.id in id_update_time_map
-                    and doc.doc_updated_at
-                    and doc.doc_updated_at <= id_update_time_map[doc.id]
-                ):
-                    continue
-                updatable_docs.append(doc)
 
+def _index_embedded_documents(
+    *,
+    document_index: DocumentIndex,
+    embedded_batch: EmbeddedDocumentBatch,
+    index_attempt_metadata: IndexAttemptMetadata,
+) -> tuple[int, int]:
+    """Second half of the pipeline, writes the chunks of the batch to the document index
+    while holding the locks on the documents"""
+    updatable_docs = embedded_batch.updatable_docs
+    chunks_with_embeddings = embedded_batch.chunks_with_embeddings
+    with Session(get_sqlalchemy_engine()) as db_session:
         updatable_ids = [doc.id for doc in updatable_docs]
 
         # Acquires a lock on the documents so that no other process can modify them
@@ -116,14 +171,6 @@ def _indexing_pipeline(
             db_session=db_session,
         )
 
-        logger.debug("Starting chunking")
-        chunks: list[DocAwareChunk] = list(
-            chain(*[chunker.chunk(document=document) for document in updatable_docs])
-        )
-
-        logger.debug("Starting embedding")
-        chunks_with_embeddings = embedder.embed(chunks=chunks)
-
         # Attach the latest status from Postgres (source of truth for access) to each
         # chunk. This access status will be attached to each chunk in the document index
         # TODO: attach document sets to the chunk based on the status of Postgres as well
@@ -148,7 +195,7 @@ def _indexing_pipeline(
         ]
 
         logger.debug(
-            f"Indexing the following chunks: {[chunk.to_short_descriptor() for chunk in chunks]}"
+            f"Indexing the following chunks: {[chunk.to_short_descriptor() for chunk in chunks_with_embeddings]}"
         )
         # A document will not be spread across different batches, so all the
         # documents with chunks in this set, are fully represented by the chunks
@@ -174,7 +221,33 @@ def _indexing_pipeline(
         )
 
     return len([r for r in insertion_records if r.already_existed is False]), len(
-        chunks
+        chunks_with_embeddings
+    )
+
+
+def _indexing_pipeline(
+    *,
+    chunker: Chunker,
+    embedder: Embedder,
+    document_index: DocumentIndex,
+    documents: list[Document],
+    index_attempt_metadata: IndexAttemptMetadata,
+    ignore_time_skip: bool = False,
+) -> tuple[int, int]:
+    """Takes different pieces of the indexing pipeline and applies it to a batch of documents
+    Note that the documents should already be batched at this point so that it does not inflate the
+    memory requirements"""
+    embedded_batch = _chunk_and_embed_documents(
+        chunker=chunker,
+        embedder=embedder,
+        document_index=document_index,
+        documents=documents,
+        ignore_time_skip=ignore_time_skip,
+    )
+    return _index_embedded_documents(
+        document_index=document_index,
+        embedded_batch=embedded_batch,
+        index_attempt_metadata=index_attempt_metadata,
     )
 
 
@@ -199,3 +272,154 @@ def build_indexing_pipeline(
         document_index=document_index,
         ignore_time_skip=ignore_time_skip,
     )
+
+
+class _StageFailure:
+    def __init__(self, error: Exception) -> None:
+        self.error = error
+
+
+_END_OF_STAGE = object()
+
+
+def _put_unless_stopped(
+    stage_queue: queue.Queue, item: Any, stop_event: threading.Event
+) -> bool:
+    while not stop_event.is_set():
+        try:
+            stage_queue.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get_unless_stopped(stage_queue: queue.Queue, stop_event: threading.Event) -> Any:
+    while not stop_event.is_set():
+        try:
+            return stage_queue.get(timeout=1)
+        except queue.Empty:
+            continue
+    return _END_OF_STAGE
+
+
+def run_pipelined_indexing(
+    *,
+    doc_batches: Iterable[list[Document]],
+    index_attempt_metadata: IndexAttemptMetadata,
+    chunker: Chunker | None = None,
+    embedder: Embedder | None = None,
+    document_index: DocumentIndex | None = None,
+    ignore_time_skip: bool = False,
+    queue_size: int = PIPELINED_INDEXING_QUEUE_SIZE,
+    num_index_writers: int = PIPELINED_INDEXING_NUM_WRITERS,
+) -> Generator[tuple[list[Document], int, int], None, None]:
+    """Same work as the pipeline from `build_indexing_pipeline` applied to every batch, but
+    fetching from the connector, chunking + embedding and writing to the document index run
+    concurrently, connected by bounded queues. Overall throughput is then limited by the
+    slowest stage rather than the sum of all of them.
+
+    Yields (doc batch, new docs, chunks indexed) for each batch in connector order, once the
+    batch is fully written. The document locks are still acquired per batch right before
+    writing, see `_index_embedded_documents`. With more than one writer, a batch sharing
+    documents with batches still being written is only submitted once those are done so that
+    the last version of a document is the one that ends up in the index.
+
+    Closing the generator early (e.g. the consumer raising) stops all the stages."""
+    pipeline_chunker = chunker or DefaultChunker()
+    pipeline_embedder = embedder or DefaultEmbedder()
+    pipeline_document_index = document_index or get_default_document_index()
+
+    stop_event = threading.Event()
+    fetched_batches: queue.Queue = queue.Queue(maxsize=queue_size)
+    embedded_batches: queue.Queue = queue.Queue(maxsize=queue_size)
+
+    def _fetch() -> None:
+        try:
+            for doc_batch in doc_batches:
+                if not _put_unless_stopped(fetched_batches, doc_batch, stop_event):
+                    return
+        except Exception as e:
+            logger.exception("Fetching documents from the connector failed")
+            _put_unless_stopped(fetched_batches, _StageFailure(e), stop_event)
+            return
+        _put_unless_stopped(fetched_batches, _END_OF_STAGE, stop_event)
+
+    def _chunk_and_embed() -> None:
+        while True:
+            doc_batch = _get_unless_stopped(fetched_batches, stop_event)
+            if doc_batch is _END_OF_STAGE or isinstance(doc_batch, _StageFailure):
+                _put_unless_stopped(embedded_batches, doc_batch, stop_event)
+                return
+
+            try:
+                embedded_batch = _chunk_and_embed_documents(
+                    chunker=pipeline_chunker,
+                    embedder=pipeline_embedder,
+                    document_index=pipeline_document_index,
+                    documents=doc_batch,
+                    ignore_time_skip=ignore_time_skip,
+                )
+            except Exception as e:
+                logger.exception("Chunking / embedding documents failed")
+                _put_unless_stopped(embedded_batches, _StageFailure(e), stop_event)
+                return
+
+            if not _put_unless_stopped(embedded_batches, embedded_batch, stop_event):
+                return
+
+    stage_threads = [
+        threading.Thread(target=_fetch, name="indexing-fetch", daemon=True),
+        threading.Thread(
+            target=_chunk_and_embed, name="indexing-chunk-embed", daemon=True
+        ),
+    ]
+    for stage_thread in stage_threads:
+        stage_thread.start()
+
+    # Futures are kept in connector order so that progress is reported in order, along with
+    # the ids of the documents they write
+    in_flight_writes: deque[
+        tuple[list[Document], set[str], Future[tuple[int, int]]]
+    ] = deque()
+    writer_pool = ThreadPoolExecutor(
+        max_workers=num_index_writers, thread_name_prefix="indexing-write"
+    )
+    try:
+        while True:
+            embedded_batch = _get_unless_stopped(embedded_batches, stop_event)
+            if isinstance(embedded_batch, _StageFailure):
+                raise embedded_batch.error
+            if embedded_batch is _END_OF_STAGE:
+                break
+
+            updatable_ids = {doc.id for doc in embedded_batch.updatable_docs}
+            wait(
+                [
+                    write_future
+                    for _, write_ids, write_future in in_flight_writes
+                    if not write_ids.isdisjoint(updatable_ids)
+                ]
+            )
+            in_flight_writes.append(
+                (
+                    embedded_batch.documents,
+                    updatable_ids,
+                    writer_pool.submit(
+                        _index_embedded_documents,
+                        document_index=pipeline_document_index,
+                        embedded_batch=embedded_batch,
+                        index_attempt_metadata=index_attempt_metadata,
+                    ),
+                )
+            )
+            while len(in_flight_writes) >= num_index_writers:
+                doc_batch, _, write_future = in_flight_writes.popleft()
+                yield doc_batch, *write_future.result()
+
+        while in_flight_writes:
+            doc_batch, _, write_future = in_flight_writes.popleft()
+            yield doc_batch, *write_future.result()
+    finally:
+        stop_event.set()
+        writer_pool.shutdown(wait=True, cancel_futures=True)
@@ -1,7 +1,13 @@
+import inspect
+from collections.abc import Callable
 from dataclasses import dataclass
 from dataclasses import fields
 from datetime import datetime
 from typing import Any
+from typing import cast
+from typing import Generic
+from typing import overload
+from typing import TypeVar
 
 from danswer.access.models import DocumentAccess
 from danswer.connectors.models import Document
@@ -13,6 +19,63 @@ logger = setup_logger()
 
 Embedding = list[float]
 
+T = TypeVar("T")
+
+
+class Deferred(Generic[T]):
+    """Stands in for the value of a `DeferrableField` until it is first read, at which point
+    `load` is called to produce the actual value. The value is kept, copies of an object
+    share its `Deferred`s and the first read through any of them loads it for all"""
+
+    def __init__(self, load: Callable[[], T]) -> None:
+        self.load = load
+        self._loaded = False
+        self._value: T | None = None
+
+    def get(self) -> T:
+        if not self._loaded:
+            self._value = self.load()
+            self._loaded = True
+        return cast(T, self._value)
+
+
+class DeferrableField(Generic[T]):
+    """Attribute which can be assigned a `Deferred` instead of its value, reading it gives
+    the value (loading it if needed)"""
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+        self.storage_name = f"_deferred_{name}"
+
+    @overload
+    def __get__(self, obj: None, objtype: type | None = None) -> "DeferrableField[T]":
+        ...
+
+    @overload
+    def __get__(self, obj: object, objtype: type | None = None) -> T:
+        ...
+
+    def __get__(self, obj: Any, objtype: type | None = None) -> Any:
+        if obj is None:
+            return self
+
+        value = obj.__dict__[self.storage_name]
+        if isinstance(value, Deferred):
+            value = value.get()
+            obj.__dict__[self.storage_name] = value
+        return value
+
+    def __set__(self, obj: Any, value: T | Deferred[T]) -> None:
+        obj.__dict__[self.storage_name] = value
+
+
+def is_deferred(obj: Any, field_name: str) -> bool:
+    """Whether the field has not been read (and loaded) yet"""
+    deferrable_field = inspect.getattr_static(type(obj), field_name, None)
+    return isinstance(deferrable_field, DeferrableField) and isinstance(
+        obj.__dict__.get(deferrable_field.storage_name), Deferred
+    )
+
 
 @dataclass
 class ChunkEmbedding:
@@ -20,6 +83,14 @@ class ChunkEmbedding:
     mini_chunk_embeddings: list[Embedding]
 
 
+@dataclass(frozen=True)
+class StoredChunkEmbedding:
+    """Embeddings of a chunk as currently stored in the document index"""
+
+    content_hash: str
+    embeddings: ChunkEmbedding
+
+
 @dataclass
 class BaseChunk:
     chunk_id: int
@@ -47,6 +118,11 @@ class DocAwareChunk(BaseChunk):
 @dataclass
 class IndexChunk(DocAwareChunk):
     embeddings: ChunkEmbedding
+    # Fingerprint of everything the embeddings were computed from, if it has not changed the
+    # next time the chunk is indexed, the stored embeddings are reused instead of re-encoding
+    content_hash: str
+    # Number of tokens in the content, keyed by the name of the LLM tokenizer
+    llm_token_counts: dict[str, int]
 
 
 @dataclass
@@ -77,7 +153,10 @@ class DocMetadataAwareIndexChunk(IndexChunk):
         )
 
 
-@dataclass
+# Compared by identity, comparing the fields of a `LazyInferenceChunk` would load the deferred
+# ones (possibly a network fetch each), use `unique_id` to tell whether two chunks are the same
+# chunk of the index
+@dataclass(eq=False)
 class InferenceChunk(BaseChunk):
     document_id: str
     source_type: str  # This is the string value of the enum already like "web"
@@ -95,6 +174,12 @@ class InferenceChunk(BaseChunk):
     updated_at: datetime | None
     primary_owners: list[str] | None = None
     secondary_owners: list[str] | None = None
+    # As counted at indexing time, chunks indexed before these were stored don't have them
+    llm_token_counts: dict[str, int] | None = None
+
+    # Not the field by field comparison inherited from BaseChunk
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
 
     @property
     def unique_id(self) -> str:
@@ -111,3 +196,14 @@ class InferenceChunk(BaseChunk):
                 break
             short_blurb += " " + word
         return f"Inference Chunk: {self.document_id} - {short_blurb}..."
+
+
+class LazyInferenceChunk(InferenceChunk):
+    """`InferenceChunk` of a search result, the fields below can be assigned a `Deferred`
+    once it is built and are only decoded / have their content fetched when first read
+    """
+
+    content = DeferrableField[str]()
+    source_links = DeferrableField[dict[int, str] | None]()
+    metadata = DeferrableField[dict[str, Any]]()
+    match_highlights = DeferrableField[list[str]]()
@@ -1,6 +1,7 @@
 import abc
 from collections.abc import Iterator
 
+import httpx
 import litellm  # type:ignore
 from langchain.chat_models import ChatLiteLLM
 from langchain.chat_models.base import BaseChatModel
@@ -10,6 +11,7 @@ from danswer.configs.app_configs import LOG_ALL_MODEL_INTERACTIONS
 from danswer.configs.model_configs import GEN_AI_API_ENDPOINT
 from danswer.configs.model_configs import GEN_AI_API_VERSION
 from danswer.configs.model_configs import GEN_AI_LLM_PROVIDER_TYPE
+from danswer.configs.model_configs import GEN_AI_MAX_CONCURRENT_REQUESTS
 from danswer.configs.model_configs import GEN_AI_MAX_OUTPUT_TOKENS
 from danswer.configs.model_configs import GEN_AI_MODEL_PROVIDER
 from danswer.configs.model_configs import GEN_AI_MODEL_VERSION
@@ -26,6 +28,15 @@ logger = setup_logger()
 # parameters like frequency and presence, just ignore them
 litellm.drop_params = True
 litellm.telemetry = False
+# Passed to the OpenAI clients litellm builds for every call, so that calls to OpenAI
+# compatible providers reuse the connections of earlier ones. The number of connections is not
+# capped here, streamed answers don't count against GEN_AI_MAX_CONCURRENT_REQUESTS
+litellm.client_session = httpx.Client(
+    limits=httpx.Limits(
+        max_connections=None,
+        max_keepalive_connections=GEN_AI_MAX_CONCURRENT_REQUESTS or None,
+    )
+)
 
 
 class LangChainChatLLM(LLM, abc.ABC):
@@ -45,6 +56,10 @@ class LangChainChatLLM(LLM, abc.ABC):
     def log_model_configs(self) -> None:
         llm_dict = {k: v for k, v in self.llm.__dict__.items() if v}
         llm_dict.pop("client")
+        if "model_kwargs" in llm_dict:
+            llm_dict["model_kwargs"] = {
+                k: v for k, v in llm_dict["model_kwargs"].items() if k != "api_key"
+            }
         logger.info(
             f"LLM Model Class: {self.llm.__class__.__name__}, Model Config: {llm_dict}"
         )
@@ -116,9 +131,9 @@ class DefaultMultiLLM(LangChainChatLLM):
         max_output_tokens: int = GEN_AI_MAX_OUTPUT_TOKENS,
         temperature: float = GEN_AI_TEMPERATURE,
     ):
-        # Litellm Langchain integration currently doesn't take in the api key param
-        # Can place this in the call below once integration is in
-        litellm.api_key = api_key or "dummy-key"
+        # Litellm Langchain integration currently doesn't take in the api key param, it is
+        # passed through to litellm with every call instead of being set on litellm globally,
+        # clients with different keys may be in use at the same time
         litellm.api_version = api_version
 
         self._llm = ChatLiteLLM(  # type: ignore
@@ -130,7 +145,10 @@ class DefaultMultiLLM(LangChainChatLLM):
             max_tokens=max_output_tokens,
             temperature=temperature,
             request_timeout=timeout,
-            model_kwargs=DefaultMultiLLM.DEFAULT_MODEL_PARAMS,
+            model_kwargs={
+                **DefaultMultiLLM.DEFAULT_MODEL_PARAMS,
+                "api_key": api_key or "dummy-key",
+            },
             verbose=should_be_verbose(),
             max_retries=0,  # retries are handled outside of langchain
         )
@@ -0,0 +1,148 @@
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from langchain.schema.language_model import LanguageModelInput
+
+from danswer.configs.model_configs import GEN_AI_MAX_CONCURRENT_REQUESTS
+from danswer.llm.interfaces import LLM
+from danswer.utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+@dataclass(frozen=True)
+class ProviderConcurrencyStats:
+    provider: str
+    max_concurrent_requests: int
+    in_flight: int
+    # Calls currently waiting for one of the in flight calls to finish
+    queue_depth: int
+    total_requests: int
+    total_wait_seconds: float
+    max_wait_seconds: float
+
+
+class ProviderConcurrencyLimiter:
+    """Caps the number of calls in flight to one LLM provider. Calls past the cap wait for
+    one of the others to finish, for at most `timeout` seconds. A `max_concurrent_requests`
+    of 0 or less lets every call through right away (the stats are still kept)."""
+
+    def __init__(self, provider: str, max_concurrent_requests: int) -> None:
+        self.provider = provider
+        self.max_concurrent_requests = max_concurrent_requests
+
+        self._in_flight = 0
+        self._queue_depth = 0
+        self._total_requests = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._condition = threading.Condition()
+
+    def _has_room(self) -> bool:
+        return (
+            self.max_concurrent_requests <= 0
+            or self._in_flight < self.max_concurrent_requests
+        )
+
+    @contextmanager
+    def slot(self, timeout: float | None = None) -> Iterator[None]:
+        start = time.monotonic()
+        with self._condition:
+            self._queue_depth += 1
+            try:
+                if not self._condition.wait_for(self._has_room, timeout=timeout):
+                    raise TimeoutError(
+                        f"Waited more than {timeout} seconds for one of the "
+                        f"{self.max_concurrent_requests} calls in flight to "
+                        f"'{self.provider}' to finish"
+                    )
+            finally:
+                self._queue_depth -= 1
+
+            wait = time.monotonic() - start
+            self._in_flight += 1
+            self._total_requests += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify()
+
+    def stats(self) -> ProviderConcurrencyStats:
+        with self._condition:
+            return ProviderConcurrencyStats(
+                provider=self.provider,
+                max_concurrent_requests=self.max_concurrent_requests,
+                in_flight=self._in_flight,
+                queue_depth=self._queue_depth,
+                total_requests=self._total_requests,
+                total_wait_seconds=self._total_wait,
+                max_wait_seconds=self._max_wait,
+            )
+
+
+_PROVIDER_LIMITERS: dict[str, ProviderConcurrencyLimiter] = {}
+_PROVIDER_LIMITERS_LOCK = threading.Lock()
+
+
+def get_provider_limiter(
+    provider: str, max_concurrent_requests: int = GEN_AI_MAX_CONCURRENT_REQUESTS
+) -> ProviderConcurrencyLimiter:
+    """One limiter per provider for the whole process, shared by all its models / clients
+    since the rate limits of providers usually apply to the whole account"""
+    provider = provider.lower()
+    with _PROVIDER_LIMITERS_LOCK:
+        if provider not in _PROVIDER_LIMITERS:
+            _PROVIDER_LIMITERS[provider] = ProviderConcurrencyLimiter(
+                provider=provider, max_concurrent_requests=max_concurrent_requests
+            )
+        return _PROVIDER_LIMITERS[provider]
+
+
+def get_llm_concurrency_stats() -> list[ProviderConcurrencyStats]:
+    with _PROVIDER_LIMITERS_LOCK:
+        limiters = list(_PROVIDER_LIMITERS.values())
+    return [limiter.stats() for limiter in limiters]
+
+
+class ConcurrencyLimitedLLM(LLM):
+    """Wraps an LLM so that its calls count against the limit of its provider. Only the
+    `invoke` calls of the secondary flows (chunk filter, filter extraction, ...) are limited,
+    these are the ones fired off many at a time. Streamed answers are not, a stream would hold
+    on to its slot for the whole answer and a handful of concurrent chats would leave the
+    short calls waiting until they time out."""
+
+    def __init__(
+        self,
+        llm: LLM,
+        limiter: ProviderConcurrencyLimiter,
+        queue_timeout: float | None = None,
+    ) -> None:
+        self.wrapped_llm = llm
+        self.limiter = limiter
+        self.queue_timeout = queue_timeout
+
+    @property
+    def requires_warm_up(self) -> bool:
+        return self.wrapped_llm.requires_warm_up
+
+    @property
+    def requires_api_key(self) -> bool:
+        return self.wrapped_llm.requires_api_key
+
+    def log_model_configs(self) -> None:
+        self.wrapped_llm.log_model_configs()
+
+    def invoke(self, prompt: LanguageModelInput) -> str:
+        with self.limiter.slot(timeout=self.queue_timeout):
+            return self.wrapped_llm.invoke(prompt)
+
+    def stream(self, prompt: LanguageModelInput) -> Iterator[str]:
+        yield from self.wrapped_llm.stream(prompt)
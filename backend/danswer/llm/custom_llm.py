@@ -46,6 +46,8 @@ class CustomModelServer(LLM):
         self._endpoint = endpoint
         self._max_output_tokens = max_output_tokens
         self._timeout = timeout
+        # Instances are reused across calls, keep the connection to the model server alive
+        self._session = requests.Session()
 
     def _execute(self, input: LanguageModelInput) -> str:
         headers = {
@@ -60,7 +62,7 @@ class CustomModelServer(LLM):
             },
         }
         try:
-            response = requests.post(
+            response = self._session.post(
                 self._endpoint, headers=headers, json=data, timeout=self._timeout
             )
         except Timeout as error:
@@ -3,10 +3,44 @@ from danswer.configs.model_configs import FAST_GEN_AI_MODEL_VERSION
 from danswer.configs.model_configs import GEN_AI_MODEL_PROVIDER
 from danswer.configs.model_configs import GEN_AI_MODEL_VERSION
 from danswer.llm.chat_llm import DefaultMultiLLM
+from danswer.llm.concurrency import ConcurrencyLimitedLLM
+from danswer.llm.concurrency import get_provider_limiter
 from danswer.llm.custom_llm import CustomModelServer
 from danswer.llm.gpt_4_all import DanswerGPT4All
 from danswer.llm.interfaces import LLM
 from danswer.llm.utils import get_gen_ai_api_key
+from danswer.utils.cache import TTLLRUCache
+
+# Configured clients, keyed on (provider, model version, timeout, api key). Building a client
+# is not free and the secondary flows fetch one per call, often from many threads at once.
+# The api key is part of the key so that a key updated by the admin is picked up right away
+_LLM_CLIENTS: TTLLRUCache[tuple[str, str, int, str | None], LLM] = TTLLRUCache(
+    max_size=16, ttl_seconds=24 * 60 * 60
+)
+
+
+def _build_llm(
+    gen_ai_model_provider: str,
+    model_version: str,
+    api_key: str | None,
+    timeout: int,
+) -> LLM:
+    if gen_ai_model_provider.lower() == "custom":
+        llm: LLM = CustomModelServer(api_key=api_key, timeout=timeout)
+    elif gen_ai_model_provider.lower() == "gpt4all":
+        llm = DanswerGPT4All(model_version=model_version, timeout=timeout)
+    else:
+        llm = DefaultMultiLLM(
+            model_version=model_version, api_key=api_key, timeout=timeout
+        )
+
+    # The wait for a slot is capped at the timeout of the call, on top of the call itself, so a
+    # call that had to wait may take up to twice the timeout in total
+    return ConcurrencyLimitedLLM(
+        llm=llm,
+        limiter=get_provider_limiter(gen_ai_model_provider),
+        queue_timeout=timeout,
+    )
 
 
 def get_default_llm(
@@ -27,12 +61,14 @@ def get_default_llm(
     if api_key is None:
         api_key = get_gen_ai_api_key()
 
-    if gen_ai_model_provider.lower() == "custom":
-        return CustomModelServer(api_key=api_key, timeout=timeout)
-
-    if gen_ai_model_provider.lower() == "gpt4all":
-        return DanswerGPT4All(model_version=model_version, timeout=timeout)
-
-    return DefaultMultiLLM(
-        model_version=model_version, api_key=api_key, timeout=timeout
-    )
+    client_key = (gen_ai_model_provider.lower(), model_version, timeout, api_key)
+    llm = _LLM_CLIENTS.get(client_key)
+    if llm is None:
+        llm = _build_llm(
+            gen_ai_model_provider=gen_ai_model_provider,
+            model_version=model_version,
+            api_key=api_key,
+            timeout=timeout,
+        )
+        _LLM_CLIENTS.set(client_key, llm)
+    return llm
@@ -55,12 +55,35 @@ def get_default_llm_token_encode() -> Callable[[str], Any]:
     return _LLM_TOKENIZER_ENCODE
 
 
+def get_llm_token_counts(texts: list[str]) -> list[dict[str, int]]:
+    """Number of tokens of each text, keyed by the name of the tokenizer. Stored with the
+    chunks at indexing time so that fitting chunks into a prompt needs no tokenization
+    """
+    tokenizer = get_default_llm_tokenizer()
+    return [
+        {tokenizer.name: len(tokens)}
+        for tokens in tokenizer.encode_ordinary_batch(texts)
+    ]
+
+
+def get_chunk_token_count(chunk: InferenceChunk) -> int:
+    """Uses the count stored at indexing time if there is one for the current tokenizer,
+    only tokenizes the content of the chunk otherwise"""
+    tokenizer = get_default_llm_tokenizer()
+    token_count = (chunk.llm_token_counts or {}).get(tokenizer.name)
+    if token_count is None:
+        return check_number_of_tokens(chunk.content, tokenizer.encode_ordinary)
+    return token_count
+
+
 def tokenizer_trim_chunks(
     chunks: list[InferenceChunk], max_chunk_toks: int = DOC_EMBEDDING_CONTEXT_SIZE
 ) -> list[InferenceChunk]:
     tokenizer = get_default_llm_tokenizer()
     new_chunks = copy(chunks)
     for ind, chunk in enumerate(new_chunks):
+        if get_chunk_token_count(chunk) <= max_chunk_toks:
+            continue
         tokens = tokenizer.encode(chunk.content)
         if len(tokens) > max_chunk_toks:
             new_chunk = copy(chunk)
@@ -156,7 +179,7 @@ def check_number_of_tokens(
     """
 
     if encode_fn is None:
-        encode_fn = tiktoken.get_encoding("cl100k_base").encode
+        encode_fn = get_default_llm_tokenizer().encode
 
     return len(encode_fn(text))
 
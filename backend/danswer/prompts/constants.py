@@ -10,3 +10,5 @@ QUOTE_PAT = "Quote:"
 QUOTES_PAT_PLURAL = "Quotes:"
 INVALID_PAT = "Invalid:"
 SOURCES_KEY = "sources"
+TIME_FILTER_KEY = "time_filter"
+REPHRASED_QUERIES_KEY = "rephrased_queries"
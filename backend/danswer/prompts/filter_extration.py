@@ -1,7 +1,9 @@
 # The following prompts are used for extracting filters to apply along with the query in the
 # document index. For example, a filter for dates or a filter by source type such as GitHub
 # or Slack
+from danswer.prompts.constants import REPHRASED_QUERIES_KEY
 from danswer.prompts.constants import SOURCES_KEY
+from danswer.prompts.constants import TIME_FILTER_KEY
 
 
 # Smaller followup prompts in time_filter.py
@@ -59,8 +61,50 @@ Note: The "file" source only applies to when the user refers to uploaded files i
 """.strip()
 
 
+# Replaces the time filter, source filter and query rephrasing prompts with a single call, see
+# query_understanding.py. Parts for the flows that don't need to run are left out
+QUERY_UNDERSTANDING_PROMPT = """
+You are a tool to understand a user query for a downstream search application. \
+Identify the filters to apply along with the query and answer with ONLY a json.
+
+{query_understanding_tasks}
+
+Sample Response:
+{sample_response}
+""".strip()
+
+QUERY_UNDERSTANDING_TIME_TASK = f"""
+Under the key "{TIME_FILTER_KEY}", give the time filter for the query. \
+The downstream application is able to use a recency bias or apply a hard cutoff to remove \
+all documents before the cutoff. The current day and time is {{current_day_time_str}}.
+The value is a json with the keys "filter_type", "filter_value", "value_multiple" and "date".
+The valid values for "filter_type" are "hard cutoff", "favors recent", or "not time sensitive".
+The valid values for "filter_value" are "day", "week", "month", "quarter", "half", or "year".
+The valid values for "value_multiple" is any number.
+The valid values for "date" is a date in format MM/DD/YYYY, ALWAYS follow this format.
+""".strip()
+
+QUERY_UNDERSTANDING_SOURCE_TASK = f"""
+Under the key "{SOURCES_KEY}", give null or a list of the sources the user is explicitly \
+limiting the scope of where information is coming from to. \
+The user may provide invalid source filters, ignore those. The valid sources are:
+{{valid_sources}}
+{{web_source_warning}}
+{{file_source_warning}}
+""".strip()
+
+QUERY_UNDERSTANDING_REPHRASE_TASK = f"""
+Under the key "{REPHRASED_QUERIES_KEY}", give a json with the query translated into each of \
+these languages, keyed by the language: {{languages}}
+If the query is already in one of the languages, give the ORIGINAL query for that language, \
+EXACTLY as is with no edits.
+""".strip()
+
+
 # Use the following for easy viewing of prompts
 if __name__ == "__main__":
     print(TIME_FILTER_PROMPT)
     print("------------------")
     print(SOURCE_FILTER_PROMPT)
+    print("------------------")
+    print(QUERY_UNDERSTANDING_PROMPT)
@@ -25,6 +25,36 @@ Respond with EXACTLY AND ONLY: "{USEFUL_PAT}" or "{NONUSEFUL_PAT}"
 """.strip()
 
 
+# Same judgement as above, for a number of sections in a single call
+BATCH_CHUNK_FILTER_PROMPT = f"""
+Determine for each of the numbered reference sections if it is USEFUL for answering the user query.
+It is NOT enough for a section to be related to the query, \
+it must contain information that is USEFUL for answering the query.
+If a section contains ANY useful information, that is good enough, \
+it does not need to fully answer the every part of the user query.
+
+Reference Sections:
+{{numbered_sections}}
+
+User Query:
+```
+{{user_query}}
+```
+
+Respond with EXACTLY AND ONLY a JSON object with an entry for every section number, \
+each being either "{USEFUL_PAT}" or "{NONUSEFUL_PAT}". For example:
+{{{{"1": "{USEFUL_PAT}", "2": "{NONUSEFUL_PAT}"}}}}
+""".strip()
+
+NUMBERED_SECTION_TEMPLATE = """
+Section {section_number}:
+```
+{chunk_text}
+```
+""".strip()
+
+
 # Use the following for easy viewing of prompts
 if __name__ == "__main__":
     print(CHUNK_FILTER_PROMPT)
+    print(BATCH_CHUNK_FILTER_PROMPT)
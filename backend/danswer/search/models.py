@@ -10,6 +10,7 @@ from danswer.configs.constants import DocumentSource
 from danswer.configs.model_configs import ENABLE_RERANKING_REAL_TIME_FLOW
 from danswer.indexing.models import DocAwareChunk
 from danswer.indexing.models import IndexChunk
+from danswer.indexing.models import StoredChunkEmbedding
 
 MAX_METRICS_CONTENT = (
     200  # Just need enough characters to identify where in the doc the chunk is
@@ -28,7 +29,11 @@ class QueryFlow(str, Enum):
 
 
 class Embedder:
-    def embed(self, chunks: list[DocAwareChunk]) -> list[IndexChunk]:
+    def embed(
+        self,
+        chunks: list[DocAwareChunk],
+        stored_embeddings: dict[tuple[str, int], StoredChunkEmbedding] | None = None,
+    ) -> list[IndexChunk]:
         raise NotImplementedError
 
 
@@ -61,14 +66,31 @@ class SearchQuery(BaseModel):
     skip_llm_chunk_filter: bool = DISABLE_LLM_CHUNK_FILTER
     # Only used if not skip_llm_chunk_filter
     max_llm_filter_chunks: int = NUM_RERANKED_RESULTS
+    # Multilingual rephrasings already made along with the filter extraction, if None and
+    # multilingual query expansion is on, retrieval asks the LLM for them
+    rephrased_queries: list[str] | None = None
 
     class Config:
         frozen = True
 
 
+class RetrievalTiming(BaseModel):
+    """Where the time of a single request to the document index went, in seconds. The query
+    and summary fetch times are as reported by the index, if it reports them"""
+
+    total: float
+    query: float | None = None
+    summary_fetch: float | None = None
+    # Round trip time not spent by the index on the request (connection, transfer, queueing)
+    network: float
+    json_decode: float
+
+
 class RetrievalMetricsContainer(BaseModel):
     search_type: SearchType
     metrics: list[ChunkMetric]  # This contains the scores for retrieval as well
+    # One per request to the document index made by the retrieval
+    timings: list[RetrievalTiming] = []
 
 
 class RerankMetricsContainer(BaseModel):
@@ -0,0 +1,81 @@
+import string
+import threading
+from functools import cached_property
+from functools import lru_cache
+
+from nltk.corpus import stopwords  # type:ignore
+from nltk.stem import WordNetLemmatizer  # type:ignore
+from nltk.tokenize import word_tokenize  # type:ignore
+
+
+_PUNCTUATION = frozenset(string.punctuation)
+_PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+
+_STOP_WORDS: frozenset[str] | None = None
+_LEMMATIZER: WordNetLemmatizer | None = None
+_NLTK_LOAD_LOCK = threading.Lock()
+
+
+def get_stop_words() -> frozenset[str]:
+    global _STOP_WORDS
+    if _STOP_WORDS is None:
+        with _NLTK_LOAD_LOCK:
+            if _STOP_WORDS is None:
+                _STOP_WORDS = frozenset(stopwords.words("english"))
+    return _STOP_WORDS
+
+
+def get_lemmatizer() -> WordNetLemmatizer:
+    global _LEMMATIZER
+    if _LEMMATIZER is None:
+        with _NLTK_LOAD_LOCK:
+            if _LEMMATIZER is None:
+                _LEMMATIZER = WordNetLemmatizer()
+    return _LEMMATIZER
+
+
+def simplify_text(text: str) -> str:
+    """Drops punctuation, whitespace and casing, used to tell apart queries which only differ
+    in trivial ways"""
+    return "".join(text.translate(_PUNCTUATION_TABLE).split()).lower()
+
+
+class NormalizedQuery:
+    """Normalized forms of a query, each is only computed the first time it is accessed.
+
+    The query is tokenized at most once, no matter how many of the forms are used."""
+
+    def __init__(self, query: str) -> None:
+        self.query = query
+
+    @cached_property
+    def tokens(self) -> list[str]:
+        return word_tokenize(self.query)
+
+    @cached_property
+    def keywords(self) -> list[str]:
+        """Tokens without stopwords and punctuation, or all the tokens if nothing is left"""
+        stop_words = get_stop_words()
+        keywords = [
+            token
+            for token in self.tokens
+            if token.casefold() not in stop_words and token not in _PUNCTUATION
+        ]
+        return keywords or self.tokens
+
+    @cached_property
+    def lemmas(self) -> list[str]:
+        """Lemmatized keywords"""
+        lemmatizer = get_lemmatizer()
+        return [lemmatizer.lemmatize(keyword) for keyword in self.keywords]
+
+    @cached_property
+    def simplified_text(self) -> str:
+        return simplify_text(self.query)
+
+
+@lru_cache(maxsize=1024)
+def normalize_query(query: str) -> NormalizedQuery:
+    """The same query text is normalized by several steps of a search (flow recommendation,
+    query expansion, keyword and hybrid retrieval), they all share the one instance"""
+    return NormalizedQuery(query)
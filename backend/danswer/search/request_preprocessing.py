@@ -1,16 +1,25 @@
 from sqlalchemy.orm import Session
 
+from danswer.configs.app_configs import COMBINED_QUERY_UNDERSTANDING
 from danswer.configs.app_configs import DISABLE_LLM_CHUNK_FILTER
 from danswer.configs.app_configs import DISABLE_LLM_FILTER_EXTRACTION
+from danswer.configs.app_configs import MULTILINGUAL_QUERY_EXPANSION
+from danswer.configs.app_configs import SPECULATIVE_RETRIEVAL
 from danswer.configs.model_configs import ENABLE_RERANKING_REAL_TIME_FLOW
 from danswer.configs.model_configs import SKIP_RERANKING
 from danswer.db.models import User
+from danswer.document_index.interfaces import DocumentIndex
+from danswer.indexing.models import InferenceChunk
 from danswer.search.access_filters import build_access_filters_for_user
 from danswer.search.danswer_helper import query_intent
 from danswer.search.models import IndexFilters
 from danswer.search.models import QueryFlow
 from danswer.search.models import SearchQuery
 from danswer.search.models import SearchType
+from danswer.search.search_runner import filter_speculative_chunks
+from danswer.search.search_runner import retrieve_chunks
+from danswer.secondary_llm_flows.query_expansion import get_expansion_languages
+from danswer.secondary_llm_flows.query_understanding import understand_query
 from danswer.secondary_llm_flows.source_filter import extract_source_filter
 from danswer.secondary_llm_flows.time_filter import extract_time_filter
 from danswer.server.chat.models import NewMessageRequest
@@ -28,7 +37,103 @@ def retrieval_preprocessing(
     skip_rerank_non_realtime: bool = SKIP_RERANKING,
     disable_llm_filter_extraction: bool = DISABLE_LLM_FILTER_EXTRACTION,
     skip_llm_chunk_filter: bool = DISABLE_LLM_CHUNK_FILTER,
+    combined_query_understanding: bool = COMBINED_QUERY_UNDERSTANDING,
+    multilingual_query_expansion: str | None = MULTILINGUAL_QUERY_EXPANSION,
 ) -> tuple[SearchQuery, SearchType | None, QueryFlow | None]:
+    retrieval_request, predicted_search_type, predicted_flow, _ = _preprocess(
+        new_message_request=new_message_request,
+        user=user,
+        db_session=db_session,
+        bypass_acl=bypass_acl,
+        include_query_intent=include_query_intent,
+        skip_rerank_realtime=skip_rerank_realtime,
+        skip_rerank_non_realtime=skip_rerank_non_realtime,
+        disable_llm_filter_extraction=disable_llm_filter_extraction,
+        skip_llm_chunk_filter=skip_llm_chunk_filter,
+        combined_query_understanding=combined_query_understanding,
+        multilingual_query_expansion=multilingual_query_expansion,
+    )
+    return retrieval_request, predicted_search_type, predicted_flow
+
+
+def speculative_retrieval_preprocessing(
+    new_message_request: NewMessageRequest,
+    user: User | None,
+    db_session: Session,
+    document_index: DocumentIndex,
+    bypass_acl: bool = False,
+    include_query_intent: bool = True,
+    skip_rerank_realtime: bool = not ENABLE_RERANKING_REAL_TIME_FLOW,
+    skip_rerank_non_realtime: bool = SKIP_RERANKING,
+    disable_llm_filter_extraction: bool = DISABLE_LLM_FILTER_EXTRACTION,
+    skip_llm_chunk_filter: bool = DISABLE_LLM_CHUNK_FILTER,
+    speculative_retrieval: bool = SPECULATIVE_RETRIEVAL,
+    combined_query_understanding: bool = COMBINED_QUERY_UNDERSTANDING,
+    multilingual_query_expansion: str | None = MULTILINGUAL_QUERY_EXPANSION,
+) -> tuple[
+    SearchQuery, SearchType | None, QueryFlow | None, list[InferenceChunk] | None
+]:
+    """Same as `retrieval_preprocessing`, but if `speculative_retrieval` is set, retrieval with
+    the user selected filters runs at the same time as the filter extraction / query intent.
+
+    The last element is the retrieved chunks to pass on to `full_chunk_search`, it is None if
+    the speculative hits could not be used and retrieval still needs to run"""
+    return _preprocess(
+        new_message_request=new_message_request,
+        user=user,
+        db_session=db_session,
+        bypass_acl=bypass_acl,
+        include_query_intent=include_query_intent,
+        skip_rerank_realtime=skip_rerank_realtime,
+        skip_rerank_non_realtime=skip_rerank_non_realtime,
+        disable_llm_filter_extraction=disable_llm_filter_extraction,
+        skip_llm_chunk_filter=skip_llm_chunk_filter,
+        speculative_document_index=document_index if speculative_retrieval else None,
+        combined_query_understanding=combined_query_understanding,
+        multilingual_query_expansion=multilingual_query_expansion,
+    )
+
+
+def _build_search_query(
+    new_message_request: NewMessageRequest,
+    filters: IndexFilters,
+    favor_recent: bool | None,
+    skip_rerank: bool,
+    skip_llm_chunk_filter: bool,
+    rephrased_queries: list[str] | None = None,
+) -> SearchQuery:
+    return SearchQuery(
+        query=new_message_request.query,
+        search_type=new_message_request.search_type,
+        filters=filters,
+        # use user specified favor_recent over generated favor_recent
+        favor_recent=(
+            new_message_request.favor_recent
+            if new_message_request.favor_recent is not None
+            else (favor_recent or False)
+        ),
+        skip_rerank=skip_rerank,
+        skip_llm_chunk_filter=skip_llm_chunk_filter,
+        rephrased_queries=rephrased_queries,
+    )
+
+
+def _preprocess(
+    new_message_request: NewMessageRequest,
+    user: User | None,
+    db_session: Session,
+    bypass_acl: bool,
+    include_query_intent: bool = True,
+    skip_rerank_realtime: bool = not ENABLE_RERANKING_REAL_TIME_FLOW,
+    skip_rerank_non_realtime: bool = SKIP_RERANKING,
+    disable_llm_filter_extraction: bool = DISABLE_LLM_FILTER_EXTRACTION,
+    skip_llm_chunk_filter: bool = DISABLE_LLM_CHUNK_FILTER,
+    speculative_document_index: DocumentIndex | None = None,
+    combined_query_understanding: bool = COMBINED_QUERY_UNDERSTANDING,
+    multilingual_query_expansion: str | None = MULTILINGUAL_QUERY_EXPANSION,
+) -> tuple[
+    SearchQuery, SearchType | None, QueryFlow | None, list[InferenceChunk] | None
+]:
     auto_filters_enabled = (
         not disable_llm_filter_extraction
         and new_message_request.enable_auto_detect_filters
@@ -38,7 +143,7 @@ def retrieval_preprocessing(
     # if we should bias more recent docs even more strongly
     run_time_filters = (
         FunctionCall(extract_time_filter, (new_message_request.query,), {})
-        if auto_filters_enabled
+        if auto_filters_enabled and not combined_query_understanding
         else None
     )
 
@@ -48,7 +153,31 @@ def retrieval_preprocessing(
     )
     run_source_filters = (
         FunctionCall(extract_source_filter, (new_message_request.query, db_session), {})
-        if should_run_source_filters
+        if should_run_source_filters and not combined_query_understanding
+        else None
+    )
+
+    # or get both of the above along with the multilingual rephrasings of the query from a
+    # single LLM call. Don't do query expansion on complex queries, same as in retrieval
+    expansion_languages = (
+        get_expansion_languages(multilingual_query_expansion)
+        if multilingual_query_expansion
+        and "\n" not in new_message_request.query
+        and "\r" not in new_message_request.query
+        else None
+    )
+    run_query_understanding = (
+        FunctionCall(
+            understand_query,
+            (new_message_request.query, db_session),
+            {
+                "extract_time_filter": auto_filters_enabled,
+                "extract_source_filter": should_run_source_filters,
+                "languages": expansion_languages,
+            },
+        )
+        if combined_query_understanding
+        and (auto_filters_enabled or expansion_languages)
         else None
     )
     # NOTE: this isn't really part of building the retrieval request, but is done here
@@ -59,12 +188,51 @@ def retrieval_preprocessing(
         else None
     )
 
+    user_acl_filters = (
+        None if bypass_acl else build_access_filters_for_user(user, db_session)
+    )
+
+    # figure out if we should skip running Tranformer-based re-ranking of the
+    # top chunks
+    skip_reranking = (
+        skip_rerank_realtime
+        if new_message_request.real_time
+        else skip_rerank_non_realtime
+    )
+
+    # retrieve with only the filters the user selected while the filters are extracted
+    speculative_query = (
+        _build_search_query(
+            new_message_request=new_message_request,
+            filters=IndexFilters(
+                source_type=new_message_request.filters.source_type,
+                document_set=new_message_request.filters.document_set,
+                time_cutoff=new_message_request.filters.time_cutoff,
+                access_control_list=user_acl_filters,
+            ),
+            favor_recent=None,
+            skip_rerank=skip_reranking,
+            skip_llm_chunk_filter=skip_llm_chunk_filter,
+        )
+        if speculative_document_index is not None
+        else None
+    )
+    run_speculative_retrieval = (
+        FunctionCall(
+            retrieve_chunks, (speculative_query, speculative_document_index), {}
+        )
+        if speculative_query is not None
+        else None
+    )
+
     functions_to_run = [
         filter_fn
         for filter_fn in [
             run_time_filters,
             run_source_filters,
+            run_query_understanding,
             run_query_intent,
+            run_speculative_retrieval,
         ]
         if filter_fn
     ]
@@ -78,44 +246,47 @@ def retrieval_preprocessing(
     source_filters = (
         parallel_results[run_source_filters.result_id] if run_source_filters else None
     )
+    rephrased_queries = None
+    if run_query_understanding:
+        query_understanding = parallel_results[run_query_understanding.result_id]
+        time_cutoff = query_understanding.time_cutoff
+        favor_recent = query_understanding.favor_recent
+        source_filters = query_understanding.source_filters
+        rephrased_queries = query_understanding.rephrased_queries
     predicted_search_type, predicted_flow = (
         parallel_results[run_query_intent.result_id]
         if run_query_intent
         else (None, None)
     )
 
-    user_acl_filters = (
-        None if bypass_acl else build_access_filters_for_user(user, db_session)
-    )
     final_filters = IndexFilters(
         source_type=new_message_request.filters.source_type or source_filters,
         document_set=new_message_request.filters.document_set,
         time_cutoff=new_message_request.filters.time_cutoff or time_cutoff,
         access_control_list=user_acl_filters,
     )
+    retrieval_request = _build_search_query(
+        new_message_request=new_message_request,
+        filters=final_filters,
+        favor_recent=favor_recent,
+        skip_rerank=skip_reranking,
+        skip_llm_chunk_filter=skip_llm_chunk_filter,
+        rephrased_queries=rephrased_queries,
+    )
 
-    # figure out if we should skip running Tranformer-based re-ranking of the
-    # top chunks
-    skip_reranking = (
-        skip_rerank_realtime
-        if new_message_request.real_time
-        else skip_rerank_non_realtime
+    retrieved_chunks = (
+        filter_speculative_chunks(
+            speculative_query=speculative_query,
+            query=retrieval_request,
+            chunks=parallel_results[run_speculative_retrieval.result_id],
+        )
+        if speculative_query is not None and run_speculative_retrieval is not None
+        else None
     )
 
     return (
-        SearchQuery(
-            query=new_message_request.query,
-            search_type=new_message_request.search_type,
-            filters=final_filters,
-            # use user specified favor_recent over generated favor_recent
-            favor_recent=(
-                new_message_request.favor_recent
-                if new_message_request.favor_recent is not None
-                else (favor_recent or False)
-            ),
-            skip_rerank=skip_reranking,
-            skip_llm_chunk_filter=skip_llm_chunk_filter,
-        ),
+        retrieval_request,
         predicted_search_type,
         predicted_flow,
+        retrieved_chunks,
     )
@@ -0,0 +1,145 @@
+from collections.abc import Hashable
+from collections.abc import Sequence
+
+import numpy
+
+# Everything here works on arrays with one entry per chunk, so that raising the number of hits
+# or reranked results does not add Python level work per chunk
+
+
+def boost_multipliers(boosts: Sequence[int] | numpy.ndarray) -> numpy.ndarray:
+    """Same as `translate_boost_count_to_multiplier` but for all the boosts at once"""
+    boost_array = numpy.asarray(boosts, dtype=numpy.float64)
+    # 3 in the equation below stretches it out to hit asymptotes slower
+    sigmoid = 1 / (1 + numpy.exp(-1 * boost_array / 3))
+    # 0.5 + sigmoid -> range of 0.5 to 1, 2 x sigmoid -> range of 1 to 2
+    return numpy.where(boost_array < 0, 0.5 + sigmoid, 2 * sigmoid)
+
+
+def rank_descending(scores: numpy.ndarray, k: int | None = None) -> numpy.ndarray:
+    """Indices of the scores from highest to lowest, equal scores keep their original order.
+
+    If `k` is given, only the indices of the top `k` scores are returned, these are found with
+    a partition rather than sorting all the scores."""
+    num_scores = len(scores)
+    if k is None or k >= num_scores:
+        return numpy.argsort(-scores, kind="stable")
+    if k <= 0:
+        return numpy.array([], dtype=numpy.int64)
+
+    top_k = numpy.argpartition(-scores, k - 1)[:k]
+    # Sorts by score and then by original position
+    return top_k[numpy.lexsort((top_k, -scores[top_k]))]
+
+
+def rerank_scores(
+    model_scores: Sequence[Sequence[float]] | numpy.ndarray,
+    boosts: Sequence[int],
+    recency_multipliers: Sequence[float],
+    model_min: float,
+    model_max: float,
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """Combines the scores of an ensemble of cross-encoders (one row per model), applies the
+    boost and recency multipliers and normalizes to the expected range of the models.
+
+    Returns the final scores and the raw averaged scores of the models"""
+    score_matrix = numpy.asarray(model_scores, dtype=numpy.float64)
+    raw_scores = score_matrix.mean(axis=0)
+
+    # Multipliers only make sense for positive scores
+    cross_models_min = score_matrix.min()
+    shifted_scores = raw_scores - cross_models_min
+
+    boosted_scores = (
+        shifted_scores
+        * boost_multipliers(boosts)
+        * numpy.asarray(recency_multipliers, dtype=numpy.float64)
+    )
+    normalized_scores = (boosted_scores + cross_models_min - model_min) / (
+        model_max - model_min
+    )
+    return normalized_scores, raw_scores
+
+
+def boosted_scores(
+    scores: Sequence[float],
+    boosts: Sequence[int],
+    recency_multipliers: Sequence[float],
+    norm_cutoff: int,
+    norm_min: float,
+    norm_max: float,
+) -> numpy.ndarray:
+    """Normalizes the retrieval scores over the range of the top `norm_cutoff` scores (widened
+    to at least `norm_min` to `norm_max`), then applies the boost and recency multipliers
+    """
+    score_array = numpy.asarray(scores, dtype=numpy.float64)
+    top_scores = score_array[rank_descending(score_array, norm_cutoff)]
+
+    norm_min = min(norm_min, top_scores.min())
+    norm_max = max(norm_max, top_scores.max())
+    # This should never be 0 unless user has done some weird/wrong settings
+    norm_range = norm_max - norm_min
+
+    return numpy.maximum(
+        0,
+        (score_array - norm_min)
+        * boost_multipliers(boosts)
+        * numpy.asarray(recency_multipliers, dtype=numpy.float64)
+        / norm_range,
+    )
+
+
+def legacy_boosted_scores(
+    scores: Sequence[float],
+    boosts: Sequence[int],
+    norm_min: float,
+    norm_max: float,
+) -> numpy.ndarray:
+    """Applies the boost multipliers relative to the range of the scores, then normalizes to
+    at least the `norm_min` to `norm_max` range for display purposes"""
+    score_array = numpy.asarray(scores, dtype=numpy.float64)
+    multipliers = boost_multipliers(boosts)
+
+    score_min = score_array.min()
+    score_range = score_array.max() - score_min
+    if score_range != 0:
+        unnormed_boosted_scores = (
+            score_array - score_min
+        ) / score_range * multipliers * score_range + score_min
+    else:
+        unnormed_boosted_scores = score_array * multipliers
+
+    norm_min = min(norm_min, score_min)
+    norm_max = max(norm_max, score_array.max())
+    # This should never be 0 unless user has done some weird/wrong settings
+    norm_range = norm_max - norm_min
+    if norm_range != 0:
+        return (unnormed_boosted_scores - norm_min) / norm_range
+    return unnormed_boosted_scores
+
+
+def max_merge(keys: Sequence[Hashable], scores: Sequence[float]) -> numpy.ndarray:
+    """For results of several queries which can contain the same item (e.g. the same chunk
+    found by multiple rephrasings), keeps only the highest scoring entry per key.
+
+    Returns the indices of the kept entries, highest score first. On equal scores, the earliest
+    entry of a key is kept and keys seen earlier come first."""
+    key_ids: dict[Hashable, int] = {}
+    # Keys are numbered in the order they are first seen
+    key_array = numpy.fromiter(
+        (key_ids.setdefault(key, len(key_ids)) for key in keys),
+        dtype=numpy.int64,
+        count=len(keys),
+    )
+    score_array = numpy.asarray(scores, dtype=numpy.float64)
+    positions = numpy.arange(len(key_array))
+
+    # Grouped by key, best score first and earliest entry first among equal scores
+    grouped = numpy.lexsort((positions, -score_array, key_array))
+    is_group_start = numpy.ones(len(grouped), dtype=bool)
+    is_group_start[1:] = key_array[grouped[1:]] != key_array[grouped[:-1]]
+    # Still in the order the keys were first seen, so the stable ranking keeps that order
+    # for equal scores
+    best_per_key = grouped[is_group_start]
+
+    return best_per_key[rank_descending(score_array[best_per_key])]
@@ -1,20 +1,27 @@
 import logging
-import os
 
 import numpy as np
 import requests
 import tensorflow as tf  # type: ignore
+from requests.adapters import HTTPAdapter
 from sentence_transformers import CrossEncoder  # type: ignore
 from sentence_transformers import SentenceTransformer  # type: ignore
 from transformers import AutoTokenizer  # type: ignore
 from transformers import TFDistilBertForSequenceClassification  # type: ignore
+from urllib3 import Retry
 
 from danswer.configs.app_configs import BACKGROUND_JOB_EMBEDDING_MODEL_SERVER_HOST
 from danswer.configs.app_configs import CROSS_ENCODER_MODEL_SERVER_HOST
 from danswer.configs.app_configs import CURRENT_PROCESS_IS_AN_INDEXING_JOB
 from danswer.configs.app_configs import EMBEDDING_MODEL_SERVER_HOST
 from danswer.configs.app_configs import INTENT_MODEL_SERVER_HOST
+from danswer.configs.app_configs import MODEL_SERVER_BINARY_VECTORS
+from danswer.configs.app_configs import MODEL_SERVER_CONNECTION_POOL_SIZE
+from danswer.configs.app_configs import MODEL_SERVER_EMBED_TIMEOUT
+from danswer.configs.app_configs import MODEL_SERVER_INTENT_TIMEOUT
+from danswer.configs.app_configs import MODEL_SERVER_MAX_RETRIES
 from danswer.configs.app_configs import MODEL_SERVER_PORT
+from danswer.configs.app_configs import MODEL_SERVER_RERANK_TIMEOUT
 from danswer.configs.model_configs import CROSS_EMBED_CONTEXT_SIZE
 from danswer.configs.model_configs import CROSS_ENCODER_MODEL_ENSEMBLE
 from danswer.configs.model_configs import DOC_EMBEDDING_CONTEXT_SIZE
@@ -22,33 +29,27 @@ from danswer.configs.model_configs import DOCUMENT_ENCODER_MODEL
 from danswer.configs.model_configs import INTENT_MODEL_VERSION
 from danswer.configs.model_configs import NORMALIZE_EMBEDDINGS
 from danswer.configs.model_configs import QUERY_MAX_CONTEXT_SIZE
+from danswer.search.tokenizer import get_default_tokenizer
 from danswer.utils.logger import setup_logger
+from shared_models.model_server_models import decode_vectors
 from shared_models.model_server_models import EmbedRequest
 from shared_models.model_server_models import EmbedResponse
 from shared_models.model_server_models import IntentRequest
 from shared_models.model_server_models import IntentResponse
 from shared_models.model_server_models import RerankRequest
 from shared_models.model_server_models import RerankResponse
+from shared_models.model_server_models import VectorEncoding
 
 logger = setup_logger()
 # Remove useless info about layer initialization
 logging.getLogger("transformers").setLevel(logging.ERROR)
 
 
-_TOKENIZER: None | AutoTokenizer = None
 _EMBED_MODEL: None | SentenceTransformer = None
 _RERANK_MODELS: None | list[CrossEncoder] = None
 _INTENT_TOKENIZER: None | AutoTokenizer = None
 _INTENT_MODEL: None | TFDistilBertForSequenceClassification = None
-
-
-def get_default_tokenizer() -> AutoTokenizer:
-    global _TOKENIZER
-    if _TOKENIZER is None:
-        _TOKENIZER = AutoTokenizer.from_pretrained(DOCUMENT_ENCODER_MODEL)
-        if hasattr(_TOKENIZER, "is_fast") and _TOKENIZER.is_fast:
-            os.environ["TOKENIZERS_PARALLELISM"] = "false"
-    return _TOKENIZER
+_MODEL_SERVER_SESSION: None | requests.Session = None
 
 
 def get_local_embedding_model(
@@ -114,6 +115,37 @@ def build_model_server_url(
     return f"http://{model_server_url}"
 
 
+def get_model_server_session() -> requests.Session:
+    """Process wide session so that calls to the model server reuse keep-alive connections
+    instead of opening a new TCP connection per request. Failed calls are retried with
+    backoff, the model server endpoints are all safe to retry."""
+    global _MODEL_SERVER_SESSION
+    if _MODEL_SERVER_SESSION is None:
+        retries = Retry(
+            total=MODEL_SERVER_MAX_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=["POST"],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=MODEL_SERVER_CONNECTION_POOL_SIZE,
+            pool_maxsize=MODEL_SERVER_CONNECTION_POOL_SIZE,
+            max_retries=retries,
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _MODEL_SERVER_SESSION = session
+    return _MODEL_SERVER_SESSION
+
+
+def _get_vector_encoding(
+    use_binary_vectors: bool = MODEL_SERVER_BINARY_VECTORS,
+) -> VectorEncoding:
+    return VectorEncoding.FLOAT32_BASE64 if use_binary_vectors else VectorEncoding.JSON
+
+
 class EmbeddingModel:
     def __init__(
         self,
@@ -154,15 +186,24 @@ class EmbeddingModel:
         self, texts: list[str], normalize_embeddings: bool = NORMALIZE_EMBEDDINGS
     ) -> list[list[float]]:
         if self.embed_server_endpoint:
-            embed_request = EmbedRequest(texts=texts)
+            embed_request = EmbedRequest(
+                texts=texts, vector_encoding=_get_vector_encoding()
+            )
 
             try:
-                response = requests.post(
-                    self.embed_server_endpoint, json=embed_request.dict()
+                response = get_model_server_session().post(
+                    self.embed_server_endpoint,
+                    json=embed_request.dict(),
+                    timeout=MODEL_SERVER_EMBED_TIMEOUT,
                 )
                 response.raise_for_status()
 
-                return EmbedResponse(**response.json()).embeddings
+                embed_response = EmbedResponse(**response.json())
+                if embed_response.encoded_embeddings is not None:
+                    return decode_vectors(
+                        embed_response.encoded_embeddings, num_vectors=len(texts)
+                    )
+                return embed_response.embeddings or []
             except requests.RequestException as e:
                 logger.exception(f"Failed to get Embedding: {e}")
                 raise
@@ -206,15 +247,28 @@ class CrossEncoderEnsembleModel:
 
     def predict(self, query: str, passages: list[str]) -> list[list[float]]:
         if self.rerank_server_endpoint:
-            rerank_request = RerankRequest(query=query, documents=passages)
+            rerank_request = RerankRequest(
+                query=query,
+                documents=passages,
+                vector_encoding=_get_vector_encoding(),
+            )
 
             try:
-                response = requests.post(
-                    self.rerank_server_endpoint, json=rerank_request.dict()
+                response = get_model_server_session().post(
+                    self.rerank_server_endpoint,
+                    json=rerank_request.dict(),
+                    timeout=MODEL_SERVER_RERANK_TIMEOUT,
                 )
                 response.raise_for_status()
 
-                return RerankResponse(**response.json()).scores
+                rerank_response = RerankResponse(**response.json())
+                if rerank_response.encoded_scores is not None:
+                    return decode_vectors(
+                        rerank_response.encoded_scores,
+                        # one row of scores per cross-encoder of the ensemble
+                        vector_dim=len(passages),
+                    )
+                return rerank_response.scores or []
             except requests.RequestException as e:
                 logger.exception(f"Failed to get Reranking Scores: {e}")
                 raise
@@ -267,8 +321,10 @@ class IntentModel:
             intent_request = IntentRequest(query=query)
 
             try:
-                response = requests.post(
-                    self.intent_server_endpoint, json=intent_request.dict()
+                response = get_model_server_session().post(
+                    self.intent_server_endpoint,
+                    json=intent_request.dict(),
+                    timeout=MODEL_SERVER_INTENT_TIMEOUT,
                 )
                 response.raise_for_status()
 
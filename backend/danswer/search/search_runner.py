@@ -1,37 +1,48 @@
-import string
+import hashlib
 from collections.abc import Callable
 from collections.abc import Iterator
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
 from typing import cast
 
 import numpy
-from nltk.corpus import stopwords  # type:ignore
-from nltk.stem import WordNetLemmatizer  # type:ignore
-from nltk.tokenize import word_tokenize  # type:ignore
 
 from danswer.configs.app_configs import HYBRID_ALPHA
 from danswer.configs.app_configs import MULTILINGUAL_QUERY_EXPANSION
 from danswer.configs.app_configs import NUM_RERANKED_RESULTS
+from danswer.configs.app_configs import QUERY_EMBEDDING_CACHE_SIZE
+from danswer.configs.app_configs import QUERY_EMBEDDING_CACHE_TTL_SECONDS
+from danswer.configs.app_configs import RERANK_SCORE_CACHE_SIZE
+from danswer.configs.app_configs import RERANK_SCORE_CACHE_TTL_SECONDS
+from danswer.configs.app_configs import SPECULATIVE_RETRIEVAL_MIN_HITS
 from danswer.configs.model_configs import ASYM_QUERY_PREFIX
 from danswer.configs.model_configs import CROSS_ENCODER_RANGE_MAX
 from danswer.configs.model_configs import CROSS_ENCODER_RANGE_MIN
+from danswer.configs.model_configs import DOCUMENT_ENCODER_MODEL
 from danswer.configs.model_configs import SIM_SCORE_RANGE_HIGH
 from danswer.configs.model_configs import SIM_SCORE_RANGE_LOW
-from danswer.document_index.document_index_utils import (
-    translate_boost_count_to_multiplier,
-)
 from danswer.document_index.interfaces import DocumentIndex
 from danswer.indexing.models import InferenceChunk
 from danswer.search.models import ChunkMetric
 from danswer.search.models import MAX_METRICS_CONTENT
 from danswer.search.models import RerankMetricsContainer
 from danswer.search.models import RetrievalMetricsContainer
+from danswer.search.models import RetrievalTiming
 from danswer.search.models import SearchQuery
 from danswer.search.models import SearchType
+from danswer.search.query_normalization import normalize_query
+from danswer.search.scoring import boosted_scores
+from danswer.search.scoring import legacy_boosted_scores
+from danswer.search.scoring import max_merge
+from danswer.search.scoring import rank_descending
+from danswer.search.scoring import rerank_scores
 from danswer.search.search_nlp_models import CrossEncoderEnsembleModel
 from danswer.search.search_nlp_models import EmbeddingModel
 from danswer.secondary_llm_flows.chunk_usefulness import llm_batch_eval_chunks
 from danswer.secondary_llm_flows.query_expansion import rephrase_query
 from danswer.server.chat.models import SearchDoc
+from danswer.utils.cache import TTLLRUCache
 from danswer.utils.logger import setup_logger
 from danswer.utils.threadpool_concurrency import FunctionCall
 from danswer.utils.threadpool_concurrency import run_functions_in_parallel
@@ -41,6 +52,16 @@ from danswer.utils.timing import log_function_time
 
 logger = setup_logger()
 
+# Keyed on (model name, prefix, normalized query)
+_QUERY_EMBEDDING_CACHE: TTLLRUCache[tuple[str, str, str], list[float]] = TTLLRUCache(
+    max_size=QUERY_EMBEDDING_CACHE_SIZE, ttl_seconds=QUERY_EMBEDDING_CACHE_TTL_SECONDS
+)
+# Keyed on (cross-encoder ensemble, normalized query, passage content hash), holds the score
+# from each model of the ensemble
+_RERANK_SCORE_CACHE: TTLLRUCache[tuple[str, str, str], tuple[float, ...]] = TTLLRUCache(
+    max_size=RERANK_SCORE_CACHE_SIZE, ttl_seconds=RERANK_SCORE_CACHE_TTL_SECONDS
+)
+
 
 def _log_top_chunk_links(search_flow: str, chunks: list[InferenceChunk]) -> None:
     top_links = [
@@ -49,37 +70,28 @@ def _log_top_chunk_links(search_flow: str, chunks: list[InferenceChunk]) -> None
     logger.info(f"Top links from {search_flow} search: {', '.join(top_links)}")
 
 
-def lemmatize_text(text: str) -> list[str]:
-    lemmatizer = WordNetLemmatizer()
-    word_tokens = word_tokenize(text)
-    return [lemmatizer.lemmatize(word) for word in word_tokens]
-
-
-def remove_stop_words_and_punctuation(text: str) -> list[str]:
-    stop_words = set(stopwords.words("english"))
-    word_tokens = word_tokenize(text)
-    text_trimmed = [
-        word
-        for word in word_tokens
-        if (word.casefold() not in stop_words and word not in string.punctuation)
-    ]
-    return text_trimmed or word_tokens
-
-
-def query_processing(
-    query: str,
-) -> str:
-    query = " ".join(remove_stop_words_and_punctuation(query))
-    query = " ".join(lemmatize_text(query))
-    return query
+def _normalize_query_for_cache(query: str) -> str:
+    return " ".join(query.split())
 
 
 def embed_query(
     query: str,
     prefix: str = ASYM_QUERY_PREFIX,
+    model_name: str = DOCUMENT_ENCODER_MODEL,
 ) -> list[float]:
+    cache_key = (model_name, prefix, _normalize_query_for_cache(query))
+    cached_embedding = _QUERY_EMBEDDING_CACHE.get(cache_key)
+    if cached_embedding is not None:
+        return cached_embedding
+
     prefixed_query = prefix + query
-    return EmbeddingModel().encode([prefixed_query])[0]
+    query_embedding = EmbeddingModel(model_name=model_name).encode([prefixed_query])[0]
+    _QUERY_EMBEDDING_CACHE.set(cache_key, query_embedding)
+    return query_embedding
+
+
+def get_query_embedding_cache_stats() -> dict[str, int]:
+    return _QUERY_EMBEDDING_CACHE.stats()
 
 
 def chunks_to_search_docs(chunks: list[InferenceChunk] | None) -> list[SearchDoc]:
@@ -112,23 +124,13 @@ def combine_retrieval_results(
 ) -> list[InferenceChunk]:
     all_chunks = [chunk for chunk_set in chunk_sets for chunk in chunk_set]
 
-    unique_chunks: dict[tuple[str, int], InferenceChunk] = {}
-    for chunk in all_chunks:
-        key = (chunk.document_id, chunk.chunk_id)
-        if key not in unique_chunks:
-            unique_chunks[key] = chunk
-            continue
-
-        stored_chunk_score = unique_chunks[key].score or 0
-        this_chunk_score = chunk.score or 0
-        if stored_chunk_score < this_chunk_score:
-            unique_chunks[key] = chunk
-
-    sorted_chunks = sorted(
-        unique_chunks.values(), key=lambda x: x.score or 0, reverse=True
+    # Only the highest scoring copy of each chunk is kept
+    kept_indices = max_merge(
+        keys=[(chunk.document_id, chunk.chunk_id) for chunk in all_chunks],
+        scores=[chunk.score or 0 for chunk in all_chunks],
     )
 
-    return sorted_chunks
+    return [all_chunks[ind] for ind in kept_indices]
 
 
 @log_function_time()
@@ -136,6 +138,7 @@ def doc_index_retrieval(
     query: SearchQuery,
     document_index: DocumentIndex,
     hybrid_alpha: float = HYBRID_ALPHA,
+    timing_callback: Callable[[RetrievalTiming], None] | None = None,
 ) -> list[InferenceChunk]:
     if query.search_type == SearchType.KEYWORD:
         top_chunks = document_index.keyword_retrieval(
@@ -143,6 +146,7 @@ def doc_index_retrieval(
             filters=query.filters,
             favor_recent=query.favor_recent,
             num_to_retrieve=query.num_hits,
+            timing_callback=timing_callback,
         )
 
     elif query.search_type == SearchType.SEMANTIC:
@@ -151,6 +155,7 @@ def doc_index_retrieval(
             filters=query.filters,
             favor_recent=query.favor_recent,
             num_to_retrieve=query.num_hits,
+            timing_callback=timing_callback,
         )
 
     elif query.search_type == SearchType.HYBRID:
@@ -160,6 +165,7 @@ def doc_index_retrieval(
             favor_recent=query.favor_recent,
             num_to_retrieve=query.num_hits,
             hybrid_alpha=hybrid_alpha,
+            timing_callback=timing_callback,
         )
 
     else:
@@ -168,6 +174,52 @@ def doc_index_retrieval(
     return top_chunks
 
 
+def _get_cross_encoder_scores(
+    query: str,
+    passages: list[str],
+    cross_encoders: CrossEncoderEnsembleModel,
+) -> list[list[float]]:
+    """Same output as `CrossEncoderEnsembleModel.predict` (one row of scores per model), but
+    only the passages not scored recently for this query are sent to the cross-encoders
+    """
+    ensemble_key = (
+        f"{','.join(cross_encoders.model_names)}|{cross_encoders.max_seq_length}"
+    )
+    normalized_query = _normalize_query_for_cache(query)
+    cache_keys = [
+        (
+            ensemble_key,
+            normalized_query,
+            hashlib.sha256(passage.encode("utf-8")).hexdigest(),
+        )
+        for passage in passages
+    ]
+
+    passage_scores = [_RERANK_SCORE_CACHE.get(cache_key) for cache_key in cache_keys]
+    miss_indices = [ind for ind, scores in enumerate(passage_scores) if scores is None]
+    if miss_indices:
+        miss_scores = cross_encoders.predict(
+            query=query, passages=[passages[ind] for ind in miss_indices]
+        )
+        for miss_ind, passage_ind in enumerate(miss_indices):
+            scores = tuple(model_scores[miss_ind] for model_scores in miss_scores)
+            _RERANK_SCORE_CACHE.set(cache_keys[passage_ind], scores)
+            passage_scores[passage_ind] = scores
+
+    logger.debug(
+        f"Cross-encoder scores for {len(passages) - len(miss_indices)} out of "
+        f"{len(passages)} passages came from the cache"
+    )
+    return [
+        [cast(tuple[float, ...], scores)[model_ind] for scores in passage_scores]
+        for model_ind in range(len(cross_encoders.model_names))
+    ]
+
+
+def get_rerank_score_cache_stats() -> dict[str, int]:
+    return _RERANK_SCORE_CACHE.stats()
+
+
 @log_function_time()
 def semantic_reranking(
     query: str,
@@ -183,40 +235,29 @@ def semantic_reranking(
     """
     cross_encoders = CrossEncoderEnsembleModel()
     passages = [chunk.content for chunk in chunks]
-    sim_scores_floats = cross_encoders.predict(query=query, passages=passages)
-
-    sim_scores = [numpy.array(scores) for scores in sim_scores_floats]
-
-    raw_sim_scores = cast(numpy.ndarray, sum(sim_scores) / len(sim_scores))
-
-    cross_models_min = numpy.min(sim_scores)
-
-    shifted_sim_scores = sum(
-        [enc_n_scores - cross_models_min for enc_n_scores in sim_scores]
-    ) / len(sim_scores)
-
-    boosts = [translate_boost_count_to_multiplier(chunk.boost) for chunk in chunks]
-    recency_multiplier = [chunk.recency_bias for chunk in chunks]
-    boosted_sim_scores = shifted_sim_scores * boosts * recency_multiplier
-    normalized_b_s_scores = (boosted_sim_scores + cross_models_min - model_min) / (
-        model_max - model_min
-    )
-    orig_indices = [i for i in range(len(normalized_b_s_scores))]
-    scored_results = list(
-        zip(normalized_b_s_scores, raw_sim_scores, chunks, orig_indices)
+    sim_scores_floats = _get_cross_encoder_scores(
+        query=query, passages=passages, cross_encoders=cross_encoders
     )
-    scored_results.sort(key=lambda x: x[0], reverse=True)
-    ranked_sim_scores, ranked_raw_scores, ranked_chunks, ranked_indices = zip(
-        *scored_results
+
+    normalized_b_s_scores, raw_sim_scores = rerank_scores(
+        model_scores=sim_scores_floats,
+        boosts=[chunk.boost for chunk in chunks],
+        recency_multipliers=[chunk.recency_bias for chunk in chunks],
+        model_min=model_min,
+        model_max=model_max,
     )
+    ranked_indices = rank_descending(normalized_b_s_scores).tolist()
+    ranked_sim_scores = normalized_b_s_scores[ranked_indices].tolist()
+    ranked_raw_scores = raw_sim_scores[ranked_indices].tolist()
+    ranked_chunks = [chunks[ind] for ind in ranked_indices]
 
     logger.debug(
         f"Reranked (Boosted + Time Weighted) similarity scores: {ranked_sim_scores}"
     )
 
     # Assign new chunk scores based on reranking
-    for ind, chunk in enumerate(ranked_chunks):
-        chunk.score = ranked_sim_scores[ind]
+    for chunk, score in zip(ranked_chunks, ranked_sim_scores):
+        chunk.score = score
 
     if rerank_metrics_callback is not None:
         chunk_metrics = [
@@ -235,7 +276,17 @@ def semantic_reranking(
             )
         )
 
-    return list(ranked_chunks), list(ranked_indices)
+    return ranked_chunks, ranked_indices
+
+
+def _sort_by_new_scores(
+    chunks: list[InferenceChunk], new_scores: numpy.ndarray
+) -> list[InferenceChunk]:
+    ranked_indices = rank_descending(new_scores)
+    final_chunks = [chunks[ind] for ind in ranked_indices]
+    for chunk, score in zip(final_chunks, new_scores[ranked_indices].tolist()):
+        chunk.score = score
+    return final_chunks
 
 
 def apply_boost_legacy(
@@ -244,50 +295,21 @@ def apply_boost_legacy(
     norm_max: float = SIM_SCORE_RANGE_HIGH,
 ) -> list[InferenceChunk]:
     scores = [chunk.score or 0 for chunk in chunks]
-    boosts = [translate_boost_count_to_multiplier(chunk.boost) for chunk in chunks]
-
     logger.debug(f"Raw similarity scores: {scores}")
 
-    score_min = min(scores)
-    score_max = max(scores)
-    score_range = score_max - score_min
-
-    if score_range != 0:
-        boosted_scores = [
-            ((score - score_min) / score_range) * boost
-            for score, boost in zip(scores, boosts)
-        ]
-        unnormed_boosted_scores = [
-            score * score_range + score_min for score in boosted_scores
-        ]
-    else:
-        unnormed_boosted_scores = [
-            score * boost for score, boost in zip(scores, boosts)
-        ]
-
-    norm_min = min(norm_min, min(scores))
-    norm_max = max(norm_max, max(scores))
-    # This should never be 0 unless user has done some weird/wrong settings
-    norm_range = norm_max - norm_min
-
-    # For score display purposes
-    if norm_range != 0:
-        re_normed_scores = [
-            ((score - norm_min) / norm_range) for score in unnormed_boosted_scores
-        ]
-    else:
-        re_normed_scores = unnormed_boosted_scores
-
-    rescored_chunks = list(zip(re_normed_scores, chunks))
-    rescored_chunks.sort(key=lambda x: x[0], reverse=True)
-    sorted_boosted_scores, boost_sorted_chunks = zip(*rescored_chunks)
-
-    final_chunks = list(boost_sorted_chunks)
-    final_scores = list(sorted_boosted_scores)
-    for ind, chunk in enumerate(final_chunks):
-        chunk.score = final_scores[ind]
+    final_chunks = _sort_by_new_scores(
+        chunks,
+        legacy_boosted_scores(
+            scores=scores,
+            boosts=[chunk.boost for chunk in chunks],
+            norm_min=norm_min,
+            norm_max=norm_max,
+        ),
+    )
 
-    logger.debug(f"Boost sorted similary scores: {list(final_scores)}")
+    logger.debug(
+        f"Boost sorted similary scores: {[chunk.score for chunk in final_chunks]}"
+    )
 
     return final_chunks
 
@@ -303,41 +325,26 @@ def apply_boost(
     scores = [chunk.score or 0.0 for chunk in chunks]
     logger.debug(f"Raw similarity scores: {scores}")
 
-    boosts = [translate_boost_count_to_multiplier(chunk.boost) for chunk in chunks]
-    recency_multiplier = [chunk.recency_bias for chunk in chunks]
-
-    norm_min = min(norm_min, min(scores[:norm_cutoff]))
-    norm_max = max(norm_max, max(scores[:norm_cutoff]))
-    # This should never be 0 unless user has done some weird/wrong settings
-    norm_range = norm_max - norm_min
-
-    boosted_scores = [
-        max(0, (score - norm_min) * boost * recency / norm_range)
-        for score, boost, recency in zip(scores, boosts, recency_multiplier)
-    ]
-
-    rescored_chunks = list(zip(boosted_scores, chunks))
-    rescored_chunks.sort(key=lambda x: x[0], reverse=True)
-    sorted_boosted_scores, boost_sorted_chunks = zip(*rescored_chunks)
-
-    final_chunks = list(boost_sorted_chunks)
-    final_scores = list(sorted_boosted_scores)
-    for ind, chunk in enumerate(final_chunks):
-        chunk.score = final_scores[ind]
+    final_chunks = _sort_by_new_scores(
+        chunks,
+        boosted_scores(
+            scores=scores,
+            boosts=[chunk.boost for chunk in chunks],
+            recency_multipliers=[chunk.recency_bias for chunk in chunks],
+            norm_cutoff=norm_cutoff,
+            norm_min=norm_min,
+            norm_max=norm_max,
+        ),
+    )
 
     logger.debug(
-        f"Boosted + Time Weighted sorted similarity scores: {list(final_scores)}"
+        "Boosted + Time Weighted sorted similarity scores: "
+        f"{[chunk.score for chunk in final_chunks]}"
     )
 
     return final_chunks
 
 
-def _simplify_text(text: str) -> str:
-    return "".join(
-        char for char in text if char not in string.punctuation and not char.isspace()
-    ).lower()
-
-
 def retrieve_chunks(
     query: SearchQuery,
     document_index: DocumentIndex,
@@ -347,30 +354,46 @@ def retrieve_chunks(
     | None = None,
 ) -> list[InferenceChunk]:
     """Returns a list of the best chunks from an initial keyword/semantic/ hybrid search."""
+    # Only collected if they are going to be reported, appending is safe across the threads
+    timings: list[RetrievalTiming] = []
+    timing_callback = timings.append if retrieval_metrics_callback else None
+
     # Don't do query expansion on complex queries, rephrasings likely would not work well
     if not multilingual_query_expansion or "\n" in query.query or "\r" in query.query:
         top_chunks = doc_index_retrieval(
-            query=query, document_index=document_index, hybrid_alpha=hybrid_alpha
+            query=query,
+            document_index=document_index,
+            hybrid_alpha=hybrid_alpha,
+            timing_callback=timing_callback,
         )
     else:
         simplified_queries = set()
         run_queries: list[tuple[Callable, tuple]] = []
 
         # Currently only uses query expansion on multilingual use cases
-        query_rephrases = rephrase_query(query.query, multilingual_query_expansion)
+        query_rephrases = (
+            list(query.rephrased_queries)
+            if query.rephrased_queries is not None
+            else rephrase_query(query.query, multilingual_query_expansion)
+        )
         # Just to be extra sure, add the original query.
         query_rephrases.append(query.query)
         for rephrase in set(query_rephrases):
             # Sometimes the model rephrases the query in the same language with minor changes
             # Avoid doing an extra search with the minor changes as this biases the results
-            simplified_rephrase = _simplify_text(rephrase)
+            simplified_rephrase = normalize_query(rephrase).simplified_text
             if simplified_rephrase in simplified_queries:
                 continue
             simplified_queries.add(simplified_rephrase)
 
-            q_copy = query.copy(update={"query": rephrase}, deep=True)
+            q_copy = query.copy(
+                update={"query": rephrase, "rephrased_queries": None}, deep=True
+            )
             run_queries.append(
-                (doc_index_retrieval, (q_copy, document_index, hybrid_alpha))
+                (
+                    doc_index_retrieval,
+                    (q_copy, document_index, hybrid_alpha, timing_callback),
+                )
             )
         parallel_search_results = run_functions_tuples_in_parallel(run_queries)
         top_chunks = combine_retrieval_results(parallel_search_results)
@@ -383,24 +406,105 @@ def retrieve_chunks(
         return []
 
     if retrieval_metrics_callback is not None:
-        chunk_metrics = [
-            ChunkMetric(
-                document_id=chunk.document_id,
-                chunk_content_start=chunk.content[:MAX_METRICS_CONTENT],
-                first_link=chunk.source_links[0] if chunk.source_links else None,
-                score=chunk.score if chunk.score is not None else 0,
-            )
-            for chunk in top_chunks
-        ]
-        retrieval_metrics_callback(
-            RetrievalMetricsContainer(
-                search_type=query.search_type, metrics=chunk_metrics
-            )
-        )
+        _send_retrieval_metrics(query, top_chunks, retrieval_metrics_callback, timings)
 
     return top_chunks
 
 
+def _send_retrieval_metrics(
+    query: SearchQuery,
+    chunks: list[InferenceChunk],
+    retrieval_metrics_callback: Callable[[RetrievalMetricsContainer], None],
+    timings: list[RetrievalTiming] | None = None,
+) -> None:
+    chunk_metrics = [
+        ChunkMetric(
+            document_id=chunk.document_id,
+            # The content of most of the hits is never fetched, the blurb is the start of it
+            chunk_content_start=chunk.blurb[:MAX_METRICS_CONTENT],
+            first_link=chunk.source_links[0] if chunk.source_links else None,
+            score=chunk.score if chunk.score is not None else 0,
+        )
+        for chunk in chunks
+    ]
+    retrieval_metrics_callback(
+        RetrievalMetricsContainer(
+            search_type=query.search_type,
+            metrics=chunk_metrics,
+            timings=list(timings or []),
+        )
+    )
+
+
+def _passes_time_cutoff(
+    chunk: InferenceChunk,
+    cutoff: datetime,
+    # Same as the Vespa time filter, untimed documents only pass cutoffs older than this
+    untimed_doc_cutoff: timedelta = timedelta(days=92),
+) -> bool:
+    if chunk.updated_at is None:
+        return datetime.now(timezone.utc) - untimed_doc_cutoff > cutoff
+    return chunk.updated_at >= cutoff
+
+
+def filter_speculative_chunks(
+    speculative_query: SearchQuery,
+    query: SearchQuery,
+    chunks: list[InferenceChunk],
+    min_hits: int = SPECULATIVE_RETRIEVAL_MIN_HITS,
+) -> list[InferenceChunk] | None:
+    """Narrows down the chunks retrieved for `speculative_query` to the ones retrieval for
+    `query` would have returned. Only source and time filters which the speculative query did
+    not have can be applied locally.
+
+    Returns None if retrieval has to be run again for `query`, either because the two queries
+    rank differently or because fewer than `min_hits` chunks are left after filtering"""
+    speculative_filters = speculative_query.filters
+    filters = query.filters
+    # Filters which the speculative query already applied have to be the same
+    if speculative_filters.source_type not in (None, filters.source_type):
+        return None
+    if speculative_filters.time_cutoff not in (None, filters.time_cutoff):
+        return None
+    comparable_query = query.copy(
+        update={
+            "filters": filters.copy(
+                update={
+                    "source_type": speculative_filters.source_type,
+                    "time_cutoff": speculative_filters.time_cutoff,
+                }
+            ),
+            # The speculative retrieval rephrased the query on its own
+            "rephrased_queries": speculative_query.rephrased_queries,
+        }
+    )
+    if comparable_query != speculative_query:
+        return None
+
+    allowed_sources = (
+        {source.value for source in filters.source_type}
+        if speculative_filters.source_type is None and filters.source_type
+        else None
+    )
+    time_cutoff = (
+        filters.time_cutoff if speculative_filters.time_cutoff is None else None
+    )
+    filtered_chunks = [
+        chunk
+        for chunk in chunks
+        if (allowed_sources is None or chunk.source_type in allowed_sources)
+        and (time_cutoff is None or _passes_time_cutoff(chunk, time_cutoff))
+    ]
+    if len(filtered_chunks) < len(chunks) and len(filtered_chunks) < min_hits:
+        logger.info(
+            f"Only {len(filtered_chunks)} out of {len(chunks)} speculatively retrieved "
+            "chunks passed the extracted filters, retrieving again"
+        )
+        return None
+
+    return filtered_chunks
+
+
 def should_rerank(query: SearchQuery) -> bool:
     # Don't re-rank for keyword search
     return query.search_type != SearchType.KEYWORD and not query.skip_rerank
@@ -410,6 +514,17 @@ def should_apply_llm_based_relevance_filter(query: SearchQuery) -> bool:
     return not query.skip_llm_chunk_filter
 
 
+def _num_chunks_to_read(query: SearchQuery, num_chunks: int) -> int:
+    """How many of the top chunks the reranking / LLM filter read the content of"""
+    num_to_read = 0
+    if should_rerank(query):
+        # A num_rerank of None reranks all of the chunks
+        num_to_read = query.num_rerank if query.num_rerank is not None else num_chunks
+    if should_apply_llm_based_relevance_filter(query):
+        num_to_read = max(num_to_read, query.max_llm_filter_chunks)
+    return num_to_read
+
+
 def rerank_chunks(
     query: SearchQuery,
     chunks_to_rerank: list[InferenceChunk],
@@ -455,6 +570,7 @@ def full_chunk_search(
     retrieval_metrics_callback: Callable[[RetrievalMetricsContainer], None]
     | None = None,
     rerank_metrics_callback: Callable[[RerankMetricsContainer], None] | None = None,
+    retrieved_chunks: list[InferenceChunk] | None = None,
 ) -> tuple[list[InferenceChunk], list[bool]]:
     """A utility which provides an easier interface than `full_chunk_search_generator`.
     Rather than returning the chunks and llm relevance filter results in two separate
@@ -466,6 +582,7 @@ def full_chunk_search(
         multilingual_query_expansion=multilingual_query_expansion,
         retrieval_metrics_callback=retrieval_metrics_callback,
         rerank_metrics_callback=rerank_metrics_callback,
+        retrieved_chunks=retrieved_chunks,
     )
     top_chunks = cast(list[InferenceChunk], next(search_generator))
     llm_chunk_selection = cast(list[bool], next(search_generator))
@@ -480,20 +597,44 @@ def full_chunk_search_generator(
     retrieval_metrics_callback: Callable[[RetrievalMetricsContainer], None]
     | None = None,
     rerank_metrics_callback: Callable[[RerankMetricsContainer], None] | None = None,
-) -> Iterator[list[InferenceChunk] | list[bool]]:
-    """Always yields twice. Once with the selected chunks and once with the LLM relevance filter result."""
+    retrieved_chunks: list[InferenceChunk] | None = None,
+    progressive: bool = False,
+) -> Iterator[list[InferenceChunk] | list[int] | list[bool]]:
+    """Always yields twice. Once with the selected chunks and once with the LLM relevance filter result.
+
+    If `progressive` is set, always yields three times instead. First with the chunks in retrieval
+    order as soon as they are retrieved, then with the indices of those chunks in their final
+    (reranked) order and last with the LLM relevance filter result for the final order.
+
+    If `retrieved_chunks` is passed in (e.g. from speculative retrieval), retrieval is skipped
+    and those chunks are post-processed instead."""
     chunks_yielded = False
 
-    retrieved_chunks = retrieve_chunks(
-        query=query,
-        document_index=document_index,
-        hybrid_alpha=hybrid_alpha,
-        multilingual_query_expansion=multilingual_query_expansion,
-        retrieval_metrics_callback=retrieval_metrics_callback,
-    )
+    if retrieved_chunks is None:
+        retrieved_chunks = retrieve_chunks(
+            query=query,
+            document_index=document_index,
+            hybrid_alpha=hybrid_alpha,
+            multilingual_query_expansion=multilingual_query_expansion,
+            retrieval_metrics_callback=retrieval_metrics_callback,
+        )
+    elif retrieved_chunks and retrieval_metrics_callback is not None:
+        _send_retrieval_metrics(query, retrieved_chunks, retrieval_metrics_callback)
+
+    # Fetch the content of the chunks the reranking / LLM filter are going to read here rather
+    # than on their first read in the worker threads below, so that a failed fetch is raised
+    # from here. Chunks without content are dropped, there is nothing to rerank / judge
+    num_chunks_to_load = _num_chunks_to_read(query, len(retrieved_chunks))
+    if retrieved_chunks and num_chunks_to_load:
+        retrieved_chunks = (
+            document_index.load_chunk_contents(retrieved_chunks[:num_chunks_to_load])
+            + retrieved_chunks[num_chunks_to_load:]
+        )
 
     if not retrieved_chunks:
         yield cast(list[InferenceChunk], [])
+        if progressive:
+            yield cast(list[int], [])
         yield cast(list[bool], [])
         return
 
@@ -513,11 +654,14 @@ def full_chunk_search_generator(
         )
         rerank_task_id = post_processing_tasks[-1].result_id
     else:
-        final_chunks = retrieved_chunks
         # NOTE: if we don't rerank, we can return the chunks immediately
         # since we know this is the final order
-        _log_top_chunk_links(query.search_type.value, final_chunks)
-        yield final_chunks
+        _log_top_chunk_links(query.search_type.value, retrieved_chunks)
+
+    if progressive or rerank_task_id is None:
+        # In progressive mode the retrieval order goes out right away, the reranking happens
+        # after, once the caller asks for the final order
+        yield retrieved_chunks
         chunks_yielded = True
 
     llm_filter_task_id = None
@@ -539,7 +683,7 @@ def full_chunk_search_generator(
         list[InferenceChunk] | None,
         post_processing_results.get(str(rerank_task_id)) if rerank_task_id else None,
     )
-    if reranked_chunks:
+    if reranked_chunks and not progressive:
         if chunks_yielded:
             logger.error(
                 "Trying to yield re-ranked chunks, but chunks were already yielded. This should never happen."
@@ -548,6 +692,15 @@ def full_chunk_search_generator(
             _log_top_chunk_links(query.search_type.value, reranked_chunks)
             yield reranked_chunks
 
+    final_chunks = reranked_chunks or retrieved_chunks
+    if progressive:
+        if reranked_chunks:
+            _log_top_chunk_links(query.search_type.value, reranked_chunks)
+        retrieval_indices = {
+            id(chunk): ind for ind, chunk in enumerate(retrieved_chunks)
+        }
+        yield [retrieval_indices[id(chunk)] for chunk in final_chunks]
+
     llm_chunk_selection = cast(
         list[str] | None,
         post_processing_results.get(str(llm_filter_task_id))
@@ -555,9 +708,6 @@ def full_chunk_search_generator(
         else None,
     )
     if llm_chunk_selection is not None:
-        yield [
-            chunk.unique_id in llm_chunk_selection
-            for chunk in reranked_chunks or retrieved_chunks
-        ]
+        yield [chunk.unique_id in llm_chunk_selection for chunk in final_chunks]
     else:
-        yield [True for _ in reranked_chunks or retrieved_chunks]
+        yield [True for _ in final_chunks]
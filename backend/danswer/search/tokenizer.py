@@ -0,0 +1,19 @@
+import os
+
+from transformers import AutoTokenizer  # type: ignore
+
+from danswer.configs.model_configs import DOCUMENT_ENCODER_MODEL
+
+
+# Kept apart from search_nlp_models so that importing the tokenizer (e.g. in the chunking
+# worker processes) does not also import TensorFlow and sentence_transformers
+_TOKENIZER: None | AutoTokenizer = None
+
+
+def get_default_tokenizer() -> AutoTokenizer:
+    global _TOKENIZER
+    if _TOKENIZER is None:
+        _TOKENIZER = AutoTokenizer.from_pretrained(DOCUMENT_ENCODER_MODEL)
+        if hasattr(_TOKENIZER, "is_fast") and _TOKENIZER.is_fast:
+            os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    return _TOKENIZER
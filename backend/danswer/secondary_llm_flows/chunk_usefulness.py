@@ -1,14 +1,37 @@
+import hashlib
 from collections.abc import Callable
 
+from danswer.configs.app_configs import LLM_CHUNK_FILTER_BATCH_SIZE
+from danswer.configs.app_configs import LLM_CHUNK_FILTER_CACHE_SIZE
+from danswer.configs.app_configs import LLM_CHUNK_FILTER_CACHE_TTL_SECONDS
 from danswer.llm.factory import get_default_llm
 from danswer.llm.utils import dict_based_prompt_to_langchain_prompt
+from danswer.prompts.llm_chunk_filter import BATCH_CHUNK_FILTER_PROMPT
 from danswer.prompts.llm_chunk_filter import CHUNK_FILTER_PROMPT
 from danswer.prompts.llm_chunk_filter import NONUSEFUL_PAT
+from danswer.prompts.llm_chunk_filter import NUMBERED_SECTION_TEMPLATE
+from danswer.prompts.llm_chunk_filter import USEFUL_PAT
+from danswer.utils.cache import TTLLRUCache
 from danswer.utils.logger import setup_logger
+from danswer.utils.text_processing import extract_embedded_json
 from danswer.utils.threadpool_concurrency import run_functions_tuples_in_parallel
 
 logger = setup_logger()
 
+# Keyed on (normalized query, chunk content hash), only verdicts the LLM actually gave are
+# cached, chunks kept because a call failed or timed out are judged again next time
+_CHUNK_USEFULNESS_CACHE: TTLLRUCache[tuple[str, str], bool] = TTLLRUCache(
+    max_size=LLM_CHUNK_FILTER_CACHE_SIZE,
+    ttl_seconds=LLM_CHUNK_FILTER_CACHE_TTL_SECONDS,
+)
+
+
+def _get_cache_key(query: str, chunk_content: str) -> tuple[str, str]:
+    return (
+        " ".join(query.split()),
+        hashlib.sha256(chunk_content.encode("utf-8")).hexdigest(),
+    )
+
 
 def llm_eval_chunk(query: str, chunk_content: str) -> bool:
     def _get_usefulness_messages() -> list[dict[str, str]]:
@@ -43,25 +66,136 @@ def llm_eval_chunk(query: str, chunk_content: str) -> bool:
     return _extract_usefulness(model_output)
 
 
-def llm_batch_eval_chunks(
-    query: str, chunk_contents: list[str], use_threads: bool = True
-) -> list[bool]:
-    if use_threads:
+def _extract_batch_usefulness(model_output: str, num_chunks: int) -> list[bool | None]:
+    """One verdict per chunk, None for the chunks the LLM left out or answered with
+    something other than the two patterns"""
+    try:
+        verdicts = extract_embedded_json(model_output)
+    except ValueError:
+        logger.warning("Could not parse the LLM batch chunk filter output as JSON")
+        return [None] * num_chunks
+
+    usefulness: list[bool | None] = []
+    for section_number in range(1, num_chunks + 1):
+        verdict = verdicts.get(str(section_number))
+        if not isinstance(verdict, str):
+            usefulness.append(None)
+        elif verdict.strip().lower() == NONUSEFUL_PAT.lower():
+            usefulness.append(False)
+        elif verdict.strip().lower() == USEFUL_PAT.lower():
+            usefulness.append(True)
+        else:
+            usefulness.append(None)
+    return usefulness
+
+
+def llm_eval_chunks_batched(query: str, chunk_contents: list[str]) -> list[bool | None]:
+    """Judges all the chunks with a single LLM call. The chunks the LLM did not give a clear
+    verdict for are judged again individually (in parallel), the same as without batching.
+    None for the chunks whose individual call failed as well"""
+    numbered_sections = "\n\n".join(
+        NUMBERED_SECTION_TEMPLATE.format(section_number=ind, chunk_text=chunk_content)
+        for ind, chunk_content in enumerate(chunk_contents, start=1)
+    )
+    messages = [
+        {
+            "role": "user",
+            "content": BATCH_CHUNK_FILTER_PROMPT.format(
+                numbered_sections=numbered_sections, user_query=query
+            ),
+        },
+    ]
+    filled_llm_prompt = dict_based_prompt_to_langchain_prompt(messages)
+    # A longer cap than for a single chunk since the output grows with the batch.
+    # If this call raises (timeout included) there is no per-chunk fallback, the caller
+    # marks the whole batch None and keeps all of its chunks
+    model_output = get_default_llm(use_fast_llm=True, timeout=10).invoke(
+        filled_llm_prompt
+    )
+    logger.debug(model_output)
+
+    usefulness = _extract_batch_usefulness(model_output, len(chunk_contents))
+    missing_indices = [ind for ind, useful in enumerate(usefulness) if useful is None]
+    if missing_indices:
+        logger.debug(
+            f"LLM batch chunk filter gave no verdict for {len(missing_indices)} "
+            f"of {len(chunk_contents)} chunks, judging those individually"
+        )
+        fallback_results = run_functions_tuples_in_parallel(
+            [(llm_eval_chunk, (query, chunk_contents[ind])) for ind in missing_indices],
+            allow_failures=True,
+        )
+        for ind, useful in zip(missing_indices, fallback_results):
+            usefulness[ind] = useful
+
+    return usefulness
+
+
+def _run_eval_calls(
+    query: str,
+    chunk_contents: list[str],
+    batch_size: int,
+    use_threads: bool,
+) -> list[bool | None]:
+    """None for the chunks whose LLM call failed"""
+    if batch_size > 0:
+        batches = [
+            chunk_contents[ind : ind + batch_size]
+            for ind in range(0, len(chunk_contents), batch_size)
+        ]
         functions_with_args: list[tuple[Callable, tuple]] = [
+            (llm_eval_chunks_batched, (query, batch)) for batch in batches
+        ]
+    else:
+        batches = [[chunk_content] for chunk_content in chunk_contents]
+        functions_with_args = [
             (llm_eval_chunk, (query, chunk_content)) for chunk_content in chunk_contents
         ]
 
+    if use_threads:
         logger.debug(
             "Running LLM usefulness eval in parallel (following logging may be out of order)"
         )
-        parallel_results = run_functions_tuples_in_parallel(
+        call_results = run_functions_tuples_in_parallel(
             functions_with_args, allow_failures=True
         )
+    else:
+        call_results = [func(*args) for func, args in functions_with_args]
 
-        # In case of failure/timeout, don't throw out the chunk
-        return [True if item is None else item for item in parallel_results]
+    results: list[bool | None] = []
+    for batch, call_result in zip(batches, call_results):
+        if call_result is None:
+            results.extend([None] * len(batch))
+        elif isinstance(call_result, list):
+            results.extend(call_result)
+        else:
+            results.append(call_result)
+    return results
 
-    else:
-        return [
-            llm_eval_chunk(query, chunk_content) for chunk_content in chunk_contents
-        ]
+
+def llm_batch_eval_chunks(
+    query: str,
+    chunk_contents: list[str],
+    use_threads: bool = True,
+    batch_size: int = LLM_CHUNK_FILTER_BATCH_SIZE,
+) -> list[bool]:
+    cache_keys = [
+        _get_cache_key(query, chunk_content) for chunk_content in chunk_contents
+    ]
+    usefulness = [_CHUNK_USEFULNESS_CACHE.get(cache_key) for cache_key in cache_keys]
+    miss_indices = [ind for ind, useful in enumerate(usefulness) if useful is None]
+
+    if miss_indices:
+        miss_results = _run_eval_calls(
+            query=query,
+            chunk_contents=[chunk_contents[ind] for ind in miss_indices],
+            batch_size=batch_size,
+            use_threads=use_threads,
+        )
+        for ind, useful in zip(miss_indices, miss_results):
+            if useful is not None:
+                _CHUNK_USEFULNESS_CACHE.set(cache_keys[ind], useful)
+            usefulness[ind] = useful
+
+    # In case of failure/timeout, don't throw out the chunk
+    return [True if useful is None else useful for useful in usefulness]
@@ -30,13 +30,17 @@ def llm_rephrase_query(query: str, language: str) -> str:
     return model_output
 
 
+def get_expansion_languages(multilingual_query_expansion: str) -> list[str]:
+    languages = multilingual_query_expansion.split(",")
+    return [language.strip() for language in languages]
+
+
 def rephrase_query(
     query: str,
     multilingual_query_expansion: str,
     use_threads: bool = True,
 ) -> list[str]:
-    languages = multilingual_query_expansion.split(",")
-    languages = [language.strip() for language in languages]
+    languages = get_expansion_languages(multilingual_query_expansion)
     if use_threads:
         functions_with_args: list[tuple[Callable, tuple]] = [
             (llm_rephrase_query, (query, language)) for language in languages
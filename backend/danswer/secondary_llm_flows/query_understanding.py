@@ -0,0 +1,196 @@
+import json
+import random
+from datetime import datetime
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from danswer.configs.constants import DocumentSource
+from danswer.db.connector import fetch_unique_document_sources
+from danswer.db.engine import get_sqlalchemy_engine
+from danswer.llm.factory import get_default_llm
+from danswer.llm.utils import dict_based_prompt_to_langchain_prompt
+from danswer.prompts.constants import REPHRASED_QUERIES_KEY
+from danswer.prompts.constants import SOURCES_KEY
+from danswer.prompts.constants import TIME_FILTER_KEY
+from danswer.prompts.filter_extration import FILE_SOURCE_WARNING
+from danswer.prompts.filter_extration import QUERY_UNDERSTANDING_PROMPT
+from danswer.prompts.filter_extration import QUERY_UNDERSTANDING_REPHRASE_TASK
+from danswer.prompts.filter_extration import QUERY_UNDERSTANDING_SOURCE_TASK
+from danswer.prompts.filter_extration import QUERY_UNDERSTANDING_TIME_TASK
+from danswer.prompts.filter_extration import WEB_SOURCE_WARNING
+from danswer.prompts.prompt_utils import get_current_llm_day_time
+from danswer.secondary_llm_flows.source_filter import strings_to_document_sources
+from danswer.secondary_llm_flows.time_filter import time_filter_from_model_json
+from danswer.utils.logger import setup_logger
+from danswer.utils.text_processing import extract_embedded_json
+from danswer.utils.timing import log_function_time
+
+logger = setup_logger()
+
+
+class QueryUnderstanding(BaseModel):
+    time_cutoff: datetime | None = None
+    favor_recent: bool = False
+    # None if no specific sources were detected
+    source_filters: list[DocumentSource] | None = None
+    # None if the query was not rephrased or the rephrasings could not be parsed
+    rephrased_queries: list[str] | None = None
+
+
+def _get_query_understanding_messages(
+    query: str,
+    include_time_filter: bool,
+    valid_sources: list[DocumentSource],
+    languages: list[str] | None,
+) -> list[dict[str, str]]:
+    tasks: list[str] = []
+    sample_response: dict = {}
+
+    if include_time_filter:
+        tasks.append(
+            QUERY_UNDERSTANDING_TIME_TASK.format(
+                current_day_time_str=get_current_llm_day_time()
+            )
+        )
+        sample_response[TIME_FILTER_KEY] = {"filter_type": "favors recent"}
+
+    if valid_sources:
+        tasks.append(
+            QUERY_UNDERSTANDING_SOURCE_TASK.format(
+                valid_sources=[s.value for s in valid_sources],
+                web_source_warning=WEB_SOURCE_WARNING
+                if DocumentSource.WEB in valid_sources
+                else "",
+                file_source_warning=FILE_SOURCE_WARNING
+                if DocumentSource.FILE in valid_sources
+                else "",
+            ).strip()
+        )
+        sample_response[SOURCES_KEY] = [
+            s.value for s in random.sample(valid_sources, min(2, len(valid_sources)))
+        ]
+
+    if languages:
+        tasks.append(
+            QUERY_UNDERSTANDING_REPHRASE_TASK.format(languages=", ".join(languages))
+        )
+        sample_response[REPHRASED_QUERIES_KEY] = {
+            language: "..." for language in languages
+        }
+
+    return [
+        {
+            "role": "system",
+            "content": QUERY_UNDERSTANDING_PROMPT.format(
+                query_understanding_tasks="\n\n".join(tasks),
+                sample_response=json.dumps(sample_response),
+            ),
+        },
+        {"role": "user", "content": query},
+    ]
+
+
+def _extract_query_understanding_from_llm_out(
+    model_out: str,
+    extract_time_filter: bool,
+    extract_sources: bool,
+    languages: list[str] | None,
+) -> QueryUnderstanding:
+    """Every field falls back to its default on its own, a malformed time filter does not
+    throw away the sources or the rephrasings"""
+    try:
+        model_json = extract_embedded_json(model_out)
+    except ValueError:
+        logger.warning("LLM failed to provide a valid Query Understanding output")
+        return QueryUnderstanding()
+
+    time_cutoff, favor_recent = None, False
+    time_filter_json = model_json.get(TIME_FILTER_KEY)
+    if extract_time_filter and isinstance(time_filter_json, dict):
+        try:
+            time_cutoff, favor_recent = time_filter_from_model_json(time_filter_json)
+        except (TypeError, ValueError, OverflowError):
+            logger.warning("LLM failed to provide a valid Time Filter output")
+
+    source_filters = None
+    if extract_sources:
+        sources_list = model_json.get(SOURCES_KEY)
+        if isinstance(sources_list, list):
+            source_filters = (
+                strings_to_document_sources(
+                    [source for source in sources_list if isinstance(source, str)]
+                )
+                or None
+            )
+        elif sources_list is not None:
+            logger.warning("LLM failed to provide a valid Source Filter output")
+
+    rephrased_queries = None
+    if languages:
+        rephrases_dict = model_json.get(REPHRASED_QUERIES_KEY)
+        if isinstance(rephrases_dict, dict):
+            rephrased_queries = [
+                rephrase.strip()
+                for rephrase in rephrases_dict.values()
+                if isinstance(rephrase, str) and rephrase.strip()
+            ]
+        if not rephrased_queries:
+            logger.warning("LLM failed to provide valid Query Rephrasings")
+            rephrased_queries = None
+
+    return QueryUnderstanding(
+        time_cutoff=time_cutoff,
+        favor_recent=favor_recent,
+        source_filters=source_filters,
+        rephrased_queries=rephrased_queries,
+    )
+
+
+@log_function_time()
+def understand_query(
+    query: str,
+    db_session: Session,
+    extract_time_filter: bool = True,
+    extract_source_filter: bool = True,
+    languages: list[str] | None = None,
+) -> QueryUnderstanding:
+    """Does the work of `extract_time_filter`, `extract_source_filter` and `rephrase_query`
+    (for the given languages) with a single call to the fast LLM. The parts that are not
+    asked for are left out of the prompt and left at their defaults in the result"""
+    valid_sources = (
+        fetch_unique_document_sources(db_session) if extract_source_filter else []
+    )
+    extract_sources = bool(valid_sources)
+    if not extract_time_filter and not extract_sources and not languages:
+        return QueryUnderstanding()
+
+    messages = _get_query_understanding_messages(
+        query=query,
+        include_time_filter=extract_time_filter,
+        valid_sources=valid_sources,
+        languages=languages,
+    )
+    filled_llm_prompt = dict_based_prompt_to_langchain_prompt(messages)
+    model_output = get_default_llm(use_fast_llm=True).invoke(filled_llm_prompt)
+    logger.debug(model_output)
+
+    return _extract_query_understanding_from_llm_out(
+        model_output,
+        extract_time_filter=extract_time_filter,
+        extract_sources=extract_sources,
+        languages=languages,
+    )
+
+
+if __name__ == "__main__":
+    # Just for trying out prompt changes against the real LLM, the parsing of its output is
+    # covered by the unit tests
+    with Session(get_sqlalchemy_engine()) as db_session:
+        while True:
+            user_input = input("Query to Understand: ")
+            print(
+                understand_query(
+                    user_input, db_session, languages=["English", "French"]
+                )
+            )
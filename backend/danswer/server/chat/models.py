@@ -70,7 +70,16 @@ class QADocsResponse(RetrievalDocs):
         return initial_dict
 
 
-# Second chunk of info for streaming QA
+# Only sent if progressive results are requested, after the first chunk which then holds the
+# documents in retrieval order. Gives the final (reranked) order of those documents
+class DocumentReorderResponse(BaseModel):
+    # Position of each document in the first chunk, in the new order
+    reordered_indices: list[int]
+    # New scores, in the new order
+    scores: list[float | None]
+
+
+# Second chunk of info for streaming QA, indices are into the final document order
 class LLMRelevanceFilterResponse(BaseModel):
     relevant_chunk_indices: list[int]
 
@@ -88,6 +97,8 @@ class NewMessageRequest(BaseModel):
     real_time: bool = True
     # Pagination purposes, offset is in batches, not by document count
     offset: int | None = None
+    # For streaming, send the documents before reranking and a DocumentReorderResponse after
+    progressive_results: bool = False
 
 
 class CreateChatSessionID(BaseModel):
@@ -18,7 +18,7 @@ from danswer.document_index.vespa.index import VespaIndex
 from danswer.search.access_filters import build_access_filters_for_user
 from danswer.search.danswer_helper import recommend_search_flow
 from danswer.search.models import IndexFilters
-from danswer.search.request_preprocessing import retrieval_preprocessing
+from danswer.search.request_preprocessing import speculative_retrieval_preprocessing
 from danswer.search.search_runner import chunks_to_search_docs
 from danswer.search.search_runner import full_chunk_search
 from danswer.secondary_llm_flows.query_validation import get_query_answerability
@@ -132,16 +132,19 @@ def handle_search_request(
         db_session=db_session,
     )
 
-    retrieval_request, _, _ = retrieval_preprocessing(
+    document_index = get_default_document_index()
+    retrieval_request, _, _, retrieved_chunks = speculative_retrieval_preprocessing(
         new_message_request=new_message_request,
         user=user,
         db_session=db_session,
+        document_index=document_index,
         include_query_intent=False,
     )
 
     top_chunks, _ = full_chunk_search(
         query=retrieval_request,
-        document_index=get_default_document_index(),
+        document_index=document_index,
+        retrieved_chunks=retrieved_chunks,
     )
     top_docs = chunks_to_search_docs(top_chunks)
 
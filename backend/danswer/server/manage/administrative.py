@@ -1,3 +1,4 @@
+from dataclasses import asdict
 from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
@@ -23,6 +24,7 @@ from danswer.direct_qa.factory import get_default_qa_model
 from danswer.document_index.factory import get_default_document_index
 from danswer.dynamic_configs import get_dynamic_config_store
 from danswer.dynamic_configs.interface import ConfigNotFoundError
+from danswer.llm.concurrency import get_llm_concurrency_stats
 from danswer.llm.factory import get_default_llm
 from danswer.llm.utils import get_gen_ai_api_key
 from danswer.llm.utils import test_llm
@@ -30,6 +32,7 @@ from danswer.server.documents.models import ConnectorCredentialPairIdentifier
 from danswer.server.manage.models import BoostDoc
 from danswer.server.manage.models import BoostUpdateRequest
 from danswer.server.manage.models import HiddenUpdateRequest
+from danswer.server.manage.models import LLMConcurrencyStats
 from danswer.server.models import ApiKey
 from danswer.utils.logger import setup_logger
 
@@ -184,6 +187,17 @@ def delete_genai_api_key(
     get_dynamic_config_store().delete(GEN_AI_API_KEY_STORAGE_KEY)
 
 
+@router.get("/admin/llm-concurrency")
+def get_llm_concurrency(
+    _: User | None = Depends(current_admin_user),
+) -> list[LLMConcurrencyStats]:
+    """Calls in flight and waiting per LLM provider, along with how long calls had to wait"""
+    return [
+        LLMConcurrencyStats(**asdict(provider_stats))
+        for provider_stats in get_llm_concurrency_stats()
+    ]
+
+
 @router.post("/admin/deletion-attempt")
 def create_deletion_attempt_for_connector_id(
     connector_credential_pair_identifier: ConnectorCredentialPairIdentifier,
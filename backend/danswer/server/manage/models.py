@@ -37,6 +37,16 @@ class UserRoleResponse(BaseModel):
     role: str
 
 
+class LLMConcurrencyStats(BaseModel):
+    provider: str
+    max_concurrent_requests: int
+    in_flight: int
+    queue_depth: int
+    total_requests: int
+    total_wait_seconds: float
+    max_wait_seconds: float
+
+
 class BoostDoc(BaseModel):
     document_id: str
     semantic_id: str
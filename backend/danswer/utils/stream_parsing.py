@@ -0,0 +1,229 @@
+import re
+from collections.abc import Sequence
+
+# Everything here looks at each character of the LLM output a constant number of times
+# (amortized), no matter how long the output gets. The state carried over from one token to
+# the next is bounded by the length of the patterns, never by the output so far
+
+
+class StreamPatternMatcher:
+    """Finds the first occurrence of `pattern` in text that arrives in pieces (Knuth-Morris-Pratt
+    automaton). Characters in `ignored_chars` are skipped in the text as if they were not there.
+    """
+
+    def __init__(
+        self, pattern: str, ignored_chars: str = "", case_insensitive: bool = False
+    ) -> None:
+        if not pattern:
+            raise ValueError("Pattern to match can't be empty")
+        self.case_insensitive = case_insensitive
+        self.pattern = pattern.lower() if case_insensitive else pattern
+        self.ignored_chars = frozenset(ignored_chars)
+        # Length of the pattern prefix matched by the end of the text seen so far
+        self.matched_length = 0
+        self.found = False
+
+        # Length of the longest proper prefix of pattern[: i + 1] which is also a suffix of it
+        self._failure = [0] * len(self.pattern)
+        prefix_length = 0
+        for ind in range(1, len(self.pattern)):
+            while prefix_length and self.pattern[ind] != self.pattern[prefix_length]:
+                prefix_length = self._failure[prefix_length - 1]
+            if self.pattern[ind] == self.pattern[prefix_length]:
+                prefix_length += 1
+            self._failure[ind] = prefix_length
+
+    def feed(self, text: str) -> int:
+        """Returns the index in `text` right after the end of the pattern if this completes the
+        pattern, -1 otherwise. Once the pattern is found, further text is not looked at
+        """
+        if self.found:
+            return -1
+
+        pattern = self.pattern
+        failure = self._failure
+        matched_length = self.matched_length
+        for ind, char in enumerate(text.lower() if self.case_insensitive else text):
+            if char in self.ignored_chars:
+                continue
+            while matched_length and char != pattern[matched_length]:
+                matched_length = failure[matched_length - 1]
+            if char == pattern[matched_length]:
+                matched_length += 1
+            if matched_length == len(pattern):
+                self.matched_length = matched_length
+                self.found = True
+                return ind + 1
+
+        self.matched_length = matched_length
+        return -1
+
+
+class JsonStringEndFinder:
+    """Finds the closing quote of a JSON string that arrives in pieces, starting from right
+    after its opening quote. Escaped quotes (and escaped backslashes) are accounted for.
+    """
+
+    def __init__(self) -> None:
+        self._escaped = False
+        self.found = False
+
+    def feed(self, text: str) -> int:
+        """Returns the index of the closing quote in `text`, -1 if it is not in there"""
+        if self.found:
+            return -1
+
+        search_start = 0
+        if self._escaped and text:
+            self._escaped = False
+            search_start = 1
+        while True:
+            quote_ind = text.find('"', search_start)
+            backslash_ind = text.find("\\", search_start)
+            if backslash_ind == -1 or (quote_ind != -1 and quote_ind < backslash_ind):
+                if quote_ind != -1:
+                    self.found = True
+                return quote_ind
+            # The character after the backslash is escaped, no matter what it is
+            if backslash_ind + 1 == len(text):
+                self._escaped = True
+                return -1
+            search_start = backslash_ind + 2
+
+
+class JsonStringValueStream:
+    """Streams the value of a string field of a JSON object being generated by an LLM, e.g. the
+    answer out of `{"answer": "...", "quotes": [...]}`.
+
+    `start` must match everything up to and including the opening quote of the value. The
+    value is only streamed once all the `conditions` have matched as well (in any order).
+    """
+
+    def __init__(
+        self,
+        start: StreamPatternMatcher,
+        conditions: Sequence[StreamPatternMatcher] = (),
+    ) -> None:
+        self.start = start
+        self.conditions = conditions
+        self.end = JsonStringEndFinder()
+        self.started = False
+
+    @property
+    def finished(self) -> bool:
+        return self.end.found
+
+    def feed(self, token: str) -> str:
+        """Returns the part of the token that belongs to the value, check `finished` to know if
+        the value ended with this token"""
+        if self.finished:
+            return ""
+
+        if not self.started:
+            for condition in self.conditions:
+                condition.feed(token)
+            value_start = self.start.feed(token)
+            if not self.start.found or not all(
+                condition.found for condition in self.conditions
+            ):
+                return ""
+
+            self.started = True
+            # If the token that starts the value already has some of it, for example if the
+            # token is "? then the ? is not streamed. This is ok as it prevents streaming the
+            # ? in the event that the model outputs the UNCERTAINTY_PAT. The end of the value
+            # is still looked for in there
+            self.end.feed(token[value_start:] if value_start != -1 else "")
+            return ""
+
+        value_end = self.end.feed(token)
+        return token if value_end == -1 else token[:value_end]
+
+
+class SectionEndStream:
+    """Streams text up until any of the `end_patterns` (for example the start of the quotes
+    section after the answer). Text which may be the beginning of one of the patterns is held
+    back until it's clear whether it is or not, so no part of the pattern gets streamed.
+    """
+
+    def __init__(self, end_patterns: Sequence[str]) -> None:
+        self.matchers = [StreamPatternMatcher(pattern) for pattern in end_patterns]
+        self.finished = False
+        self._held_back = ""
+
+    def feed(self, token: str) -> str:
+        if self.finished:
+            return ""
+
+        text = self._held_back + token
+        # Where each pattern found in this token starts in `text`
+        pattern_starts = [
+            len(self._held_back) + match_end - len(matcher.pattern)
+            for matcher in self.matchers
+            if (match_end := matcher.feed(token)) != -1
+        ]
+        if pattern_starts:
+            self.finished = True
+            self._held_back = ""
+            return text[: min(pattern_starts)]
+
+        hold_length = max(matcher.matched_length for matcher in self.matchers)
+        self._held_back = text[len(text) - hold_length :] if hold_length else ""
+        return text[: len(text) - hold_length]
+
+    def flush(self) -> str:
+        """Whatever is held back once the stream is over, it didn't turn into a pattern"""
+        held_back, self._held_back = self._held_back, ""
+        return held_back
+
+
+class CitationStream:
+    """Replaces the `[n]` citations in streamed text with markdown links to the `n`th link
+    (1 indexed). Citations without a link are left alone. Text that may still become a
+    citation (e.g. `[1`) is held back until it's clear whether it is one."""
+
+    def __init__(self, links: Sequence[str | None]) -> None:
+        self.links = links
+        # "[" and the digits following it while waiting for the "]"
+        self._pending = ""
+
+    def _format_citation(self, citation: str) -> str:
+        number = int(citation[1:])
+        if 1 <= number <= len(self.links):
+            link = self.links[number - 1]
+            if link:
+                return f"[{citation}]]({link})"
+        return citation + "]"
+
+    def feed(self, token: str) -> str:
+        output: list[str] = []
+        for piece in _BRACKET_SPLIT_PATTERN.split(token):
+            if not piece:
+                continue
+            if self._pending:
+                if piece == "]":
+                    if len(self._pending) > 1:
+                        output.append(self._format_citation(self._pending))
+                    else:
+                        output.append("[]")
+                    self._pending = ""
+                    continue
+                if piece.isascii() and piece.isdigit():
+                    self._pending += piece
+                    continue
+                output.append(self._pending)
+                self._pending = ""
+            if piece == "[":
+                self._pending = "["
+            else:
+                output.append(piece)
+        return "".join(output)
+
+    def flush(self) -> str:
+        pending, self._pending = self._pending, ""
+        return pending
+
+
+# Brackets on their own, runs of digits and runs of anything else, the citation state only
+# changes at the boundaries of these
+_BRACKET_SPLIT_PATTERN = re.compile(r"(\[|\]|[0-9]+)")
@@ -1,6 +1,12 @@
+import threading
+
 from fastapi import APIRouter
 from fastapi import HTTPException
 
+from danswer.configs.app_configs import MODEL_SERVER_DYNAMIC_BATCHING
+from danswer.configs.app_configs import MODEL_SERVER_MAX_BATCH_QUEUE_SIZE
+from danswer.configs.app_configs import MODEL_SERVER_MAX_BATCH_SIZE
+from danswer.configs.app_configs import MODEL_SERVER_MAX_BATCH_WAIT_MS
 from danswer.configs.model_configs import CROSS_ENCODER_MODEL_ENSEMBLE
 from danswer.configs.model_configs import DOCUMENT_ENCODER_MODEL
 from danswer.configs.model_configs import NORMALIZE_EMBEDDINGS
@@ -8,10 +14,14 @@ from danswer.search.search_nlp_models import get_local_embedding_model
 from danswer.search.search_nlp_models import get_local_reranking_model_ensemble
 from danswer.utils.logger import setup_logger
 from danswer.utils.timing import log_function_time
+from model_server.micro_batching import BatchQueueFullError
+from model_server.micro_batching import MicroBatcher
 from shared_models.model_server_models import EmbedRequest
 from shared_models.model_server_models import EmbedResponse
+from shared_models.model_server_models import encode_vectors
 from shared_models.model_server_models import RerankRequest
 from shared_models.model_server_models import RerankResponse
+from shared_models.model_server_models import VectorEncoding
 
 logger = setup_logger()
 
@@ -19,6 +29,12 @@ WARM_UP_STRING = "Danswer is amazing"
 
 router = APIRouter(prefix="/encoder")
 
+_EMBED_BATCHER: MicroBatcher[str, list[float]] | None = None
+_RERANK_BATCHER: MicroBatcher[tuple[str, str], list[float]] | None = None
+# Requests are served on a thread pool, only one batcher (and its worker thread) per model
+_EMBED_BATCHER_LOCK = threading.Lock()
+_RERANK_BATCHER_LOCK = threading.Lock()
+
 
 @log_function_time()
 def embed_text(
@@ -44,13 +60,82 @@ def calc_sim_scores(query: str, docs: list[str]) -> list[list[float]]:
     return sim_scores
 
 
+def _calc_pair_sim_scores(query_doc_pairs: list[tuple[str, str]]) -> list[list[float]]:
+    """Pairs may come from different queries, returns the scores of each cross-encoder
+    for each pair (transposed compared to `calc_sim_scores`)"""
+    cross_encoders = get_local_reranking_model_ensemble()
+    sim_scores = [
+        encoder.predict(query_doc_pairs).tolist()  # type: ignore
+        for encoder in cross_encoders
+    ]
+    return [list(pair_scores) for pair_scores in zip(*sim_scores)]
+
+
+def get_embed_batcher() -> MicroBatcher[str, list[float]]:
+    global _EMBED_BATCHER
+    if _EMBED_BATCHER is None:
+        with _EMBED_BATCHER_LOCK:
+            if _EMBED_BATCHER is None:
+                _EMBED_BATCHER = MicroBatcher(
+                    name="bi-encoder-embed",
+                    process_batch=embed_text,
+                    max_batch_size=MODEL_SERVER_MAX_BATCH_SIZE,
+                    max_wait_ms=MODEL_SERVER_MAX_BATCH_WAIT_MS,
+                    max_queue_size=MODEL_SERVER_MAX_BATCH_QUEUE_SIZE,
+                )
+    return _EMBED_BATCHER
+
+
+def get_rerank_batcher() -> MicroBatcher[tuple[str, str], list[float]]:
+    global _RERANK_BATCHER
+    if _RERANK_BATCHER is None:
+        with _RERANK_BATCHER_LOCK:
+            if _RERANK_BATCHER is None:
+                _RERANK_BATCHER = MicroBatcher(
+                    name="cross-encoder-scores",
+                    process_batch=_calc_pair_sim_scores,
+                    max_batch_size=MODEL_SERVER_MAX_BATCH_SIZE,
+                    max_wait_ms=MODEL_SERVER_MAX_BATCH_WAIT_MS,
+                    max_queue_size=MODEL_SERVER_MAX_BATCH_QUEUE_SIZE,
+                )
+    return _RERANK_BATCHER
+
+
+def batched_embed_text(texts: list[str]) -> list[list[float]]:
+    return get_embed_batcher().submit(texts)
+
+
+def batched_calc_sim_scores(query: str, docs: list[str]) -> list[list[float]]:
+    pair_scores = get_rerank_batcher().submit([(query, doc) for doc in docs])
+    # back to one list of scores per cross-encoder, same as `calc_sim_scores`
+    return [list(encoder_scores) for encoder_scores in zip(*pair_scores)]
+
+
+@router.get("/batching-stats")
+def get_batching_stats() -> dict[str, dict[str, float]]:
+    if not MODEL_SERVER_DYNAMIC_BATCHING:
+        return {}
+    return {
+        "bi-encoder-embed": get_embed_batcher().stats(),
+        "cross-encoder-scores": get_rerank_batcher().stats(),
+    }
+
+
 @router.post("/bi-encoder-embed")
 def process_embed_request(
     embed_request: EmbedRequest,
 ) -> EmbedResponse:
     try:
-        embeddings = embed_text(texts=embed_request.texts)
+        embeddings = (
+            batched_embed_text(texts=embed_request.texts)
+            if MODEL_SERVER_DYNAMIC_BATCHING
+            else embed_text(texts=embed_request.texts)
+        )
+        if embed_request.vector_encoding == VectorEncoding.FLOAT32_BASE64:
+            return EmbedResponse(encoded_embeddings=encode_vectors(embeddings))
         return EmbedResponse(embeddings=embeddings)
+    except BatchQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -58,10 +143,20 @@ def process_embed_request(
 @router.post("/cross-encoder-scores")
 def process_rerank_request(embed_request: RerankRequest) -> RerankResponse:
     try:
-        sim_scores = calc_sim_scores(
-            query=embed_request.query, docs=embed_request.documents
+        sim_scores = (
+            batched_calc_sim_scores(
+                query=embed_request.query, docs=embed_request.documents
+            )
+            if MODEL_SERVER_DYNAMIC_BATCHING
+            else calc_sim_scores(
+                query=embed_request.query, docs=embed_request.documents
+            )
         )
+        if embed_request.vector_encoding == VectorEncoding.FLOAT32_BASE64:
+            return RerankResponse(encoded_scores=encode_vectors(sim_scores))
         return RerankResponse(scores=sim_scores)
+    except BatchQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,154 @@
+import queue
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from typing import Generic
+from typing import TypeVar
+
+from danswer.utils.logger import setup_logger
+
+logger = setup_logger()
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class BatchQueueFullError(Exception):
+    pass
+
+
+class _PendingRequest(Generic[T, R]):
+    def __init__(self, items: list[T]) -> None:
+        self.items = items
+        self.enqueued_at = time.monotonic()
+        self.future: Future[list[R]] = Future()
+
+
+class MicroBatcher(Generic[T, R]):
+    """Coalesces concurrent requests into a single call of `process_batch`. Each request is a
+    list of items, the batch is run once `max_batch_size` items are collected or once the
+    oldest request has waited `max_wait_ms`, then the results are split back out per request.
+
+    `process_batch` must return exactly one result per input item, in order. A single request
+    larger than `max_batch_size` is never split, it is just run as its own batch."""
+
+    def __init__(
+        self,
+        name: str,
+        process_batch: Callable[[list[T]], list[R]],
+        max_batch_size: int,
+        max_wait_ms: float,
+        max_queue_size: int,
+    ) -> None:
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_secs = max_wait_ms / 1000
+        self.requests: queue.Queue[_PendingRequest[T, R]] = queue.Queue(
+            maxsize=max_queue_size
+        )
+
+        self._carry_over: _PendingRequest[T, R] | None = None
+        self._stats_lock = threading.Lock()
+        self._num_batches = 0
+        self._num_requests = 0
+        self._num_items = 0
+        self._last_batch_size = 0
+        self._max_batch_size_seen = 0
+        self._total_wait_secs = 0.0
+
+        self._worker = threading.Thread(
+            target=self._run, name=f"micro-batcher-{name}", daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, items: list[T]) -> list[R]:
+        if not items:
+            return []
+
+        request: _PendingRequest[T, R] = _PendingRequest(items)
+        try:
+            self.requests.put_nowait(request)
+        except queue.Full:
+            raise BatchQueueFullError(
+                f"Too many requests queued for {self.name}, try again later"
+            )
+        return request.future.result()
+
+    def _collect_batch(self) -> list[_PendingRequest[T, R]]:
+        first_request = self._carry_over or self.requests.get()
+        self._carry_over = None
+
+        batch = [first_request]
+        num_items = len(first_request.items)
+        deadline = first_request.enqueued_at + self.max_wait_secs
+        while num_items < self.max_batch_size:
+            remaining_secs = deadline - time.monotonic()
+            if remaining_secs <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining_secs)
+            except queue.Empty:
+                break
+
+            if num_items + len(request.items) > self.max_batch_size:
+                self._carry_over = request
+                break
+            batch.append(request)
+            num_items += len(request.items)
+
+        return batch
+
+    def _record_batch(self, batch: list[_PendingRequest[T, R]], start: float) -> None:
+        batch_size = sum(len(request.items) for request in batch)
+        with self._stats_lock:
+            self._num_batches += 1
+            self._num_requests += len(batch)
+            self._num_items += batch_size
+            self._last_batch_size = batch_size
+            self._max_batch_size_seen = max(self._max_batch_size_seen, batch_size)
+            self._total_wait_secs += sum(
+                start - request.enqueued_at for request in batch
+            )
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            start = time.monotonic()
+            self._record_batch(batch, start)
+
+            all_items = [item for request in batch for item in request.items]
+            try:
+                results = self.process_batch(all_items)
+                if len(results) != len(all_items):
+                    raise RuntimeError(
+                        f"{self.name} returned {len(results)} results for {len(all_items)} items"
+                    )
+            except Exception as e:
+                logger.exception(f"Batched {self.name} call failed: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            offset = 0
+            for request in batch:
+                request.future.set_result(results[offset : offset + len(request.items)])
+                offset += len(request.items)
+
+    def stats(self) -> dict[str, float]:
+        with self._stats_lock:
+            return {
+                "queue_depth": self.requests.qsize(),
+                "num_batches": self._num_batches,
+                "num_requests": self._num_requests,
+                "num_items": self._num_items,
+                "last_batch_size": self._last_batch_size,
+                "max_batch_size": self._max_batch_size_seen,
+                "avg_batch_size": self._num_items / self._num_batches
+                if self._num_batches
+                else 0,
+                "avg_wait_ms": 1000 * self._total_wait_secs / self._num_requests
+                if self._num_requests
+                else 0,
+            }
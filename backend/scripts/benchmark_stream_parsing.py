@@ -0,0 +1,103 @@
+# This file is purely for development use, not included in any builds
+# Times the parsing of streamed LLM answers over long synthetic streams. The time per token
+# should stay flat as the streams get longer
+import argparse
+import random
+import string
+import time
+from collections.abc import Callable
+
+from danswer.utils.stream_parsing import CitationStream
+from danswer.utils.stream_parsing import JsonStringValueStream
+from danswer.utils.stream_parsing import SectionEndStream
+from danswer.utils.stream_parsing import StreamPatternMatcher
+
+
+def _synthetic_tokens(num_tokens: int, prefix: str, suffix: str) -> list[str]:
+    words = [
+        "the",
+        "answer",
+        "is",
+        "in",
+        "document",
+        "[1]",
+        "[",
+        "2",
+        "]",
+        'a \\"quote\\"',
+    ]
+    return [prefix] + [random.choice(words) + " " for _ in range(num_tokens)] + [suffix]
+
+
+def _parse_json_answer(tokens: list[str]) -> None:
+    answer_stream = JsonStringValueStream(
+        start=StreamPatternMatcher('{"answer":"', ignored_chars=string.whitespace)
+    )
+    for token in tokens:
+        answer_stream.feed(token)
+
+
+def _parse_final_answer(tokens: list[str]) -> None:
+    answer_stream = JsonStringValueStream(
+        start=StreamPatternMatcher(
+            '"actioninput":"', ignored_chars=" _", case_insensitive=True
+        ),
+        conditions=[
+            StreamPatternMatcher(
+                '"action":"finalanswer",', ignored_chars=" ", case_insensitive=True
+            )
+        ],
+    )
+    for token in tokens:
+        answer_stream.feed(token)
+
+
+def _parse_freeform_answer(tokens: list[str]) -> None:
+    section_stream = SectionEndStream(end_patterns=["\nQuote:", "\n\nQuote\n"])
+    for token in tokens:
+        section_stream.feed(token)
+    section_stream.flush()
+
+
+def _replace_citations(tokens: list[str]) -> None:
+    citation_stream = CitationStream([f"link_{i}" for i in range(1, 11)])
+    for token in tokens:
+        citation_stream.feed(token)
+    citation_stream.flush()
+
+
+def _time_per_token(parse: Callable[[list[str]], None], tokens: list[str]) -> float:
+    start = time.perf_counter()
+    parse(tokens)
+    return (time.perf_counter() - start) / len(tokens) * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--lengths",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000],
+        help="Number of tokens of the synthetic streams",
+    )
+    args = parser.parse_args()
+
+    benchmarks: list[tuple[str, Callable[[list[str]], None], str, str]] = [
+        ("json answer", _parse_json_answer, '{"answer": "', '"}'),
+        (
+            "chat final answer",
+            _parse_final_answer,
+            '{"action": "Final Answer", "action_input": "',
+            '"}',
+        ),
+        ("freeform answer", _parse_freeform_answer, "", "\nQuote: the end"),
+        ("citations", _replace_citations, "", ""),
+    ]
+    for name, parse, prefix, suffix in benchmarks:
+        for num_tokens in args.lengths:
+            tokens = _synthetic_tokens(num_tokens, prefix, suffix)
+            print(
+                f"{name:>20} {num_tokens:>9} tokens: "
+                f"{_time_per_token(parse, tokens):.2f} us / token"
+            )
@@ -1,21 +1,63 @@
+import base64
+from collections.abc import Sequence
+from enum import Enum
+from typing import cast
+
+import numpy as np
 from pydantic import BaseModel
 
 
+class VectorEncoding(str, Enum):
+    JSON = "json"
+    # Little-endian float32 bytes, base64 encoded. Lossless for the model outputs which are
+    # float32 to begin with and far cheaper to serialize / parse than lists of JSON floats
+    FLOAT32_BASE64 = "float32_base64"
+
+
+def encode_vectors(vectors: Sequence[Sequence[float]] | np.ndarray) -> str:
+    return base64.b64encode(np.asarray(vectors, dtype="<f4").tobytes()).decode("ascii")
+
+
+def decode_vectors(
+    encoded_vectors: str,
+    num_vectors: int | None = None,
+    vector_dim: int | None = None,
+) -> list[list[float]]:
+    """Exactly one of the number of vectors or their dimension must be provided to restore
+    the shape of the matrix"""
+    if (num_vectors is None) == (vector_dim is None):
+        raise ValueError("Provide exactly one of num_vectors or vector_dim")
+    if num_vectors == 0 or vector_dim == 0:
+        return []
+
+    flat_vectors = np.frombuffer(base64.b64decode(encoded_vectors), dtype="<f4")
+    if vector_dim is not None:
+        return flat_vectors.reshape(-1, vector_dim).tolist()
+    return flat_vectors.reshape(cast(int, num_vectors), -1).tolist()
+
+
 class EmbedRequest(BaseModel):
     texts: list[str]
+    # Older model servers ignore this field and always respond with JSON floats
+    vector_encoding: VectorEncoding = VectorEncoding.JSON
 
 
 class EmbedResponse(BaseModel):
-    embeddings: list[list[float]]
+    embeddings: list[list[float]] | None = None
+    # Set instead of `embeddings` if the request asked for a binary vector encoding
+    encoded_embeddings: str | None = None
 
 
 class RerankRequest(BaseModel):
     query: str
     documents: list[str]
+    vector_encoding: VectorEncoding = VectorEncoding.JSON
 
 
 class RerankResponse(BaseModel):
-    scores: list[list[float]]
+    scores: list[list[float]] | None = None
+    # One row per cross-encoder in the ensemble
+    encoded_scores: str | None = None
 
 
 class IntentRequest(BaseModel):
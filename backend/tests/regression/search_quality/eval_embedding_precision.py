@@ -0,0 +1,149 @@
+"""Compares the recall and vector size of the embedding storage precisions supported by
+VESPA_EMBEDDING_CELL_TYPE on a sample of the chunk embeddings of a live index.
+
+The float results are the baseline, so run this against an index storing float embeddings.
+Every cell type is simulated locally with an exact angular nearest neighbor search, this
+isolates the loss from the quantization from the approximation of the HNSW index. The time
+reported is that of the NumPy dot products, it says nothing about Vespa's query latency. For
+that, deploy each cell type and run eval_search.py against it."""
+import argparse
+import json
+import time
+
+import numpy as np
+import requests
+
+from danswer.configs.constants import EMBEDDINGS
+from danswer.configs.constants import EmbeddingCellType
+from danswer.document_index.vespa.index import _parse_vespa_embeddings
+from danswer.document_index.vespa.index import DOCUMENT_ID_ENDPOINT
+from danswer.search.search_runner import embed_query
+
+_BYTES_PER_CELL = {
+    EmbeddingCellType.FLOAT: 4,
+    EmbeddingCellType.BFLOAT16: 2,
+    EmbeddingCellType.INT8: 1,
+}
+
+
+def fetch_chunk_vectors(num_chunks: int, page_size: int = 100) -> np.ndarray:
+    """Visits the chunks through the document API, unlike paging a query with an offset this
+    is not capped by the max offset of Vespa (1000 hits)"""
+    vectors: list[list[float]] = []
+    params: dict[str, str | int] = {
+        # danswer_chunk is the document type, see DOCUMENT_ID_ENDPOINT
+        "fieldSet": f"danswer_chunk:{EMBEDDINGS}",
+        "format.tensors": "short-value",
+    }
+    num_fetched = 0
+    while num_fetched < num_chunks:
+        params["wantedDocumentCount"] = min(page_size, num_chunks - num_fetched)
+        response = requests.get(DOCUMENT_ID_ENDPOINT, params=params)
+        response.raise_for_status()
+        response_json = response.json()
+        for document in response_json.get("documents", [])[: num_chunks - num_fetched]:
+            embeddings = _parse_vespa_embeddings(document["fields"][EMBEDDINGS])
+            vectors.append(embeddings.full_embedding)
+            vectors.extend(embeddings.mini_chunk_embeddings)
+            num_fetched += 1
+        # No continuation once every chunk has been visited
+        if "continuation" not in response_json:
+            break
+        params["continuation"] = response_json["continuation"]
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def to_bfloat16(vectors: np.ndarray) -> np.ndarray:
+    """Rounds to the nearest bfloat16 (the upper 16 bits of a float32), returned as float32"""
+    bits = vectors.astype(np.float32).view(np.uint32)
+    rounding = ((bits >> 16) & 1) + 0x7FFF
+    return ((bits + rounding) & 0xFFFF0000).view(np.float32)
+
+
+def to_int8(vectors: np.ndarray) -> np.ndarray:
+    """Same per vector scaling as `quantize_embedding`"""
+    max_abs = np.abs(vectors).max(axis=1, keepdims=True)
+    max_abs[max_abs == 0] = 1
+    return np.rint(vectors * (127 / max_abs)).astype(np.int8)
+
+
+def quantize(vectors: np.ndarray, cell_type: EmbeddingCellType) -> np.ndarray:
+    if cell_type == EmbeddingCellType.BFLOAT16:
+        return to_bfloat16(vectors)
+    if cell_type == EmbeddingCellType.INT8:
+        return to_int8(vectors)
+    return vectors
+
+
+def top_k_angular(
+    query_vectors: np.ndarray, chunk_vectors: np.ndarray, k: int
+) -> tuple[np.ndarray, float]:
+    """Returns the indices of the k closest chunks per query and the average seconds of NumPy
+    compute per query"""
+    start = time.monotonic()
+    chunks = chunk_vectors.astype(np.float32)
+    chunks /= np.linalg.norm(chunks, axis=1, keepdims=True) + 1e-12
+    queries = query_vectors.astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True) + 1e-12
+
+    similarities = queries @ chunks.T
+    top_k = np.argpartition(-similarities, kth=min(k, chunks.shape[0] - 1), axis=1)[
+        :, :k
+    ]
+    return top_k, (time.monotonic() - start) / len(query_vectors)
+
+
+def main(questions_json: str, num_chunks: int, k: int) -> None:
+    with open(questions_json, "r") as file:
+        questions = list(json.load(file).keys())
+
+    chunk_vectors = fetch_chunk_vectors(num_chunks)
+    query_vectors = np.asarray([embed_query(question) for question in questions])
+    print(
+        f"{len(questions)} queries against {chunk_vectors.shape[0]} chunk vectors "
+        f"of dimension {chunk_vectors.shape[1]}, recall@{k} relative to float\n"
+    )
+
+    baseline, _ = top_k_angular(query_vectors, chunk_vectors, k)
+    for cell_type in EmbeddingCellType:
+        top_k, numpy_secs_per_query = top_k_angular(
+            quantize(query_vectors, cell_type), quantize(chunk_vectors, cell_type), k
+        )
+        recall = np.mean(
+            [
+                len(set(found) & set(expected)) / k
+                for found, expected in zip(top_k, baseline)
+            ]
+        )
+        vector_bytes = _BYTES_PER_CELL[cell_type] * chunk_vectors.shape[1]
+        print(
+            f"{cell_type.value:>9}: recall {recall:.4f}, "
+            f"{vector_bytes} bytes per vector, "
+            f"{1000 * numpy_secs_per_query:.3f} ms of NumPy exact scoring per query"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "regression_questions_json",
+        type=str,
+        help="Path to the Questions JSON file.",
+        default="./tests/regression/search_quality/test_questions.json",
+        nargs="?",
+    )
+    parser.add_argument(
+        "--num_chunks",
+        type=int,
+        help="Number of chunks sampled from the index.",
+        default=10000,
+    )
+    parser.add_argument(
+        "--k",
+        type=int,
+        help="Number of nearest neighbors compared.",
+        default=50,
+    )
+    args = parser.parse_args()
+
+    main(args.regression_questions_json, args.num_chunks, args.k)
@@ -84,6 +84,61 @@ class TestQAPostprocessing(unittest.TestCase):
             "Answer: Air Bud was a movie about dogs and quote: people loved it",
         )
 
+    def test_match_quotes_to_docs(self) -> None:
+        def _build_chunk(
+            document_id: str, content: str, source_links: dict[int, str]
+        ) -> InferenceChunk:
+            return InferenceChunk(
+                document_id=document_id,
+                source_type="testing",
+                chunk_id=0,
+                content=content,
+                source_links=source_links,
+                blurb="anything",
+                semantic_identifier="anything",
+                section_continuation=False,
+                recency_bias=1,
+                boost=0,
+                hidden=False,
+                score=1,
+                metadata={},
+                match_highlights=[],
+                updated_at=None,
+            )
+
+        # Link offsets are into the cleaned up text, as set by the chunker
+        test_chunk_0 = _build_chunk(
+            "test doc 0",
+            "Here's a doc with some LINK embedded in the text\n\nTHIS SECTION IS A LINK",
+            {0: "doc 0 base", 39: "second section link"},
+        )
+        test_chunk_1 = _build_chunk(
+            "test doc 1",
+            "Some completely different text here, this section is a link",
+            {0: "doc 1 base"},
+        )
+        test_chunk_2 = _build_chunk("test doc 2", "Not citable, no links", {})
+
+        results = match_quotes_to_docs(
+            [
+                "a doc with some",
+                "this section is a link",  # First chunk containing it
+                '"Completely  different text"',
+                "no links",
+                "not in any of the docs",
+                "   ",
+            ],
+            [test_chunk_0, test_chunk_1, test_chunk_2],
+        )
+        self.assertEqual(
+            [(quote.quote, quote.document_id, quote.link) for quote in results.quotes],
+            [
+                ("a doc with some", "test doc 0", "doc 0 base"),
+                ("this section is a link", "test doc 0", "second section link"),
+                ('"Completely  different text"', "test doc 1", "doc 1 base"),
+            ],
+        )
+
     @unittest.skip(
         "Using fuzzy match is too slow anyway, doesn't matter if it's broken"
     )
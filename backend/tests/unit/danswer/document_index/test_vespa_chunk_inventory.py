@@ -0,0 +1,207 @@
+import json
+import re
+import threading
+import unittest
+from typing import Any
+
+import requests
+
+from danswer.access.models import DocumentAccess
+from danswer.configs.constants import CHUNK_ID
+from danswer.configs.constants import DOCUMENT_ID
+from danswer.configs.constants import DocumentSource
+from danswer.connectors.models import Document
+from danswer.document_index.document_index_utils import get_uuid_from_chunk
+from danswer.document_index.interfaces import DocumentInsertionRecord
+from danswer.document_index.vespa.feed_client import VespaFeedClient
+from danswer.document_index.vespa.index import _clear_and_index_vespa_chunks
+from danswer.document_index.vespa.index import _get_vespa_chunk_ids_by_document_ids
+from danswer.document_index.vespa.index import _MAX_VESPA_HITS
+from danswer.document_index.vespa.index import _MAX_VESPA_OFFSET
+from danswer.document_index.vespa.index import DOCUMENT_ID_ENDPOINT
+from danswer.indexing.models import ChunkEmbedding
+from danswer.indexing.models import DocMetadataAwareIndexChunk
+
+
+def _build_chunk(doc_id: str, chunk_id: int) -> DocMetadataAwareIndexChunk:
+    return DocMetadataAwareIndexChunk(
+        chunk_id=chunk_id,
+        blurb="Some blurb",
+        content="Some content",
+        source_links={0: "link"},
+        section_continuation=False,
+        source_document=Document(
+            id=doc_id,
+            sections=[],
+            source=DocumentSource.FILE,
+            semantic_identifier=doc_id,
+            metadata={},
+        ),
+        embeddings=ChunkEmbedding(full_embedding=[0.1, 0.2], mini_chunk_embeddings=[]),
+        content_hash="hash",
+        llm_token_counts={},
+        access=DocumentAccess(user_ids=set(), is_public=True),
+        document_sets=set(),
+    )
+
+
+def _vespa_chunk_id(doc_id: str, chunk_id: int) -> str:
+    return str(get_uuid_from_chunk(_build_chunk(doc_id, chunk_id)))
+
+
+def _response(
+    status_code: int, body: dict[str, Any] | None = None
+) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body or {}).encode()
+    return response
+
+
+class _FakeVespaSession:
+    """Answers the chunk queries from the chunks it holds the way Vespa would, including
+    rejecting queries that page beyond the max offset. Feeds and deletes change the chunks.
+    """
+
+    def __init__(self, num_chunks_by_doc: dict[str, int]) -> None:
+        # Vespa chunk id -> (document id, chunk id)
+        self.chunks = {
+            _vespa_chunk_id(doc_id, chunk_id): (doc_id, chunk_id)
+            for doc_id, num_chunks in num_chunks_by_doc.items()
+            for chunk_id in range(num_chunks)
+        }
+        self.deleted: set[str] = set()
+        self.fed: set[str] = set()
+        self.num_queries = 0
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        with self._lock:
+            if method == "GET":
+                self.num_queries += 1
+                return self._search(kwargs["params"])
+
+            vespa_chunk_id = url.removeprefix(f"{DOCUMENT_ID_ENDPOINT}/")
+            if method == "DELETE":
+                self.deleted.add(vespa_chunk_id)
+                self.chunks.pop(vespa_chunk_id, None)
+            elif method == "POST":
+                fields = kwargs["json"]["fields"]
+                self.fed.add(vespa_chunk_id)
+                self.chunks[vespa_chunk_id] = (fields[DOCUMENT_ID], fields[CHUNK_ID])
+            return _response(200)
+
+    def _search(self, params: dict[str, Any]) -> requests.Response:
+        offset, hits = int(params["offset"]), int(params["hits"])
+        if offset > _MAX_VESPA_OFFSET or hits > _MAX_VESPA_HITS:
+            return _response(400, {"root": {"errors": ["Too far to page"]}})
+
+        yql = params["yql"]
+        doc_ids = {
+            re.sub(r"\\(.)", r"\1", doc_id)
+            for doc_id in re.findall(
+                rf"{DOCUMENT_ID} contains '((?:[^'\\]|\\.)*)'", yql
+            )
+        }
+        after_chunk_id = re.search(rf"{CHUNK_ID} > (-?\d+)", yql)
+        matches = [
+            (vespa_chunk_id, doc_id, chunk_id)
+            for vespa_chunk_id, (doc_id, chunk_id) in self.chunks.items()
+            if doc_id in doc_ids
+            and (after_chunk_id is None or chunk_id > int(after_chunk_id.group(1)))
+        ]
+        if "order by" in yql:
+            matches.sort(key=lambda match: match[2])
+
+        children = [
+            {
+                "fields": {
+                    "documentid": f"id:default:danswer_chunk::{vespa_chunk_id}",
+                    DOCUMENT_ID: doc_id,
+                    CHUNK_ID: chunk_id,
+                }
+            }
+            for vespa_chunk_id, doc_id, chunk_id in matches[offset : offset + hits]
+        ]
+        return _response(200, {"root": {"children": children}})
+
+
+def _feed_client(session: _FakeVespaSession) -> VespaFeedClient:
+    feed_client = VespaFeedClient(max_retries=0)
+    feed_client.session = session  # type: ignore[assignment]
+    return feed_client
+
+
+class TestVespaChunkInventory(unittest.TestCase):
+    def test_chunk_ids_by_document(self) -> None:
+        session = _FakeVespaSession({"doc 1": 3, "doc 2": 1, "doc's 3": 2})
+        doc_chunk_ids = _get_vespa_chunk_ids_by_document_ids(
+            ["doc 1", "doc 2", "doc's 3", "not indexed"],
+            feed_client=_feed_client(session),
+            docs_per_query=2,
+        )
+
+        # Documents without chunks are left out
+        self.assertEqual(
+            {doc_id: set(chunk_ids) for doc_id, chunk_ids in doc_chunk_ids.items()},
+            {
+                "doc 1": {_vespa_chunk_id("doc 1", ind) for ind in range(3)},
+                "doc 2": {_vespa_chunk_id("doc 2", 0)},
+                "doc's 3": {_vespa_chunk_id("doc's 3", ind) for ind in range(2)},
+            },
+        )
+        self.assertEqual(session.num_queries, 2)
+
+    def test_more_chunks_than_an_offset_can_page(self) -> None:
+        # Together more than can be paged through, split up into a query per document. The
+        # large document does not fit on its own either and is paged by chunk id instead
+        num_chunks_by_doc = {"large doc": 2 * _MAX_VESPA_OFFSET + 1, "small doc": 700}
+        session = _FakeVespaSession(num_chunks_by_doc)
+        doc_chunk_ids = _get_vespa_chunk_ids_by_document_ids(
+            list(num_chunks_by_doc), feed_client=_feed_client(session)
+        )
+
+        for doc_id, num_chunks in num_chunks_by_doc.items():
+            self.assertEqual(len(doc_chunk_ids[doc_id]), num_chunks)
+            self.assertEqual(
+                set(doc_chunk_ids[doc_id]),
+                {_vespa_chunk_id(doc_id, ind) for ind in range(num_chunks)},
+            )
+
+
+class TestClearAndIndexVespaChunks(unittest.TestCase):
+    def test_only_stale_chunks_are_deleted(self) -> None:
+        session = _FakeVespaSession({"shrunk doc": 5, "unchanged doc": 2})
+        chunks = [
+            *(_build_chunk("shrunk doc", ind) for ind in range(3)),
+            *(_build_chunk("unchanged doc", ind) for ind in range(2)),
+            _build_chunk("new doc", 0),
+        ]
+
+        records = _clear_and_index_vespa_chunks(
+            chunks, feed_client=_feed_client(session)
+        )
+
+        # The chunks still part of a document are overwritten rather than deleted
+        self.assertEqual(
+            session.deleted,
+            {_vespa_chunk_id("shrunk doc", 3), _vespa_chunk_id("shrunk doc", 4)},
+        )
+        self.assertEqual(
+            session.fed, {str(get_uuid_from_chunk(chunk)) for chunk in chunks}
+        )
+        self.assertEqual(set(session.chunks), session.fed)
+        self.assertEqual(
+            records,
+            {
+                DocumentInsertionRecord(document_id="shrunk doc", already_existed=True),
+                DocumentInsertionRecord(
+                    document_id="unchanged doc", already_existed=True
+                ),
+                DocumentInsertionRecord(document_id="new doc", already_existed=False),
+            },
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import threading
+import time
+import unittest
+from typing import Any
+
+from danswer.configs.constants import BLURB
+from danswer.configs.constants import CHUNK_ID
+from danswer.configs.constants import CONTENT
+from danswer.configs.constants import DOCUMENT_ID
+from danswer.configs.constants import PRIMARY_OWNERS
+from danswer.configs.constants import RECENCY_BIAS
+from danswer.configs.constants import SECTION_CONTINUATION
+from danswer.configs.constants import SEMANTIC_IDENTIFIER
+from danswer.configs.constants import SOURCE_TYPE
+from danswer.document_index.vespa.index import _ChunkContentFetcher
+from danswer.document_index.vespa.index import _vespa_hit_to_inference_chunk
+from danswer.document_index.vespa.index import CONTENT_SUMMARY
+from danswer.document_index.vespa.index import VespaIndex
+from danswer.document_index.vespa.query_client import VespaQueryClient
+from danswer.indexing.models import InferenceChunk
+from danswer.indexing.models import is_deferred
+from danswer.search.models import RetrievalTiming
+
+
+def _listing_hit(chunk_id: int, with_content_summary: bool = True) -> dict[str, Any]:
+    fields: dict[str, Any] = {
+        DOCUMENT_ID: "test doc",
+        CHUNK_ID: chunk_id,
+        BLURB: f"Blurb {chunk_id}",
+        SOURCE_TYPE: "testing",
+        SEMANTIC_IDENTIFIER: "anything",
+        SECTION_CONTINUATION: False,
+        PRIMARY_OWNERS: [f"owner {chunk_id}"],
+        "matchfeatures": {RECENCY_BIAS: 1.0},
+    }
+    if with_content_summary:
+        fields[CONTENT_SUMMARY] = f"<hi>Content</hi> {chunk_id}"
+    return {"fields": fields, "relevance": 1.0 / (chunk_id + 1)}
+
+
+class _FakeQueryClient(VespaQueryClient):
+    """Answers every content fetch with the content of all of the chunks it knows about,
+    records how many chunks each fetch asked for"""
+
+    def __init__(self, chunk_ids_with_content: list[int], delay: float = 0) -> None:
+        super().__init__()
+        self.chunk_ids_with_content = chunk_ids_with_content
+        self.delay = delay
+        self.fetch_sizes: list[int] = []
+        self._lock = threading.Lock()
+
+    def search(
+        self, url: str, params: dict[str, Any]
+    ) -> tuple[dict[str, Any], RetrievalTiming]:
+        with self._lock:
+            self.fetch_sizes.append(int(params["hits"]))
+        time.sleep(self.delay)
+        hits = [
+            {
+                "fields": {
+                    DOCUMENT_ID: "test doc",
+                    CHUNK_ID: chunk_id,
+                    CONTENT: f"Content {chunk_id}",
+                }
+            }
+            for chunk_id in self.chunk_ids_with_content
+        ]
+        timing = RetrievalTiming(total=0, network=0, json_decode=0)
+        return {"root": {"children": hits}}, timing
+
+
+def _build_chunks(
+    fetcher: _ChunkContentFetcher, num_chunks: int
+) -> list[InferenceChunk]:
+    return [
+        _vespa_hit_to_inference_chunk(_listing_hit(chunk_id), fetcher)
+        for chunk_id in range(num_chunks)
+    ]
+
+
+class TestVespaContentFetch(unittest.TestCase):
+    def test_fetches_in_batches(self) -> None:
+        query_client = _FakeQueryClient(list(range(5)))
+        fetcher = _ChunkContentFetcher(query_client, fetch_size=2)
+        chunks = _build_chunks(fetcher, 5)
+        # Read from the listing, not fetched
+        self.assertEqual(chunks[1].primary_owners, ["owner 1"])
+        self.assertEqual(query_client.fetch_sizes, [])
+
+        # Fetches the read chunk along with the next one
+        self.assertEqual(chunks[0].content, "Content 0")
+        self.assertEqual(query_client.fetch_sizes, [2])
+        self.assertEqual(chunks[1].content, "Content 1")
+        self.assertEqual(query_client.fetch_sizes, [2])
+
+        # Skips ahead, then goes back to the one chunk left in between
+        self.assertEqual(chunks[3].content, "Content 3")
+        self.assertFalse(is_deferred(chunks[4], "content"))
+        self.assertTrue(is_deferred(chunks[2], "content"))
+        self.assertEqual(chunks[2].content, "Content 2")
+        self.assertEqual(query_client.fetch_sizes, [2, 2, 1])
+
+    def test_concurrent_reads_fetch_once(self) -> None:
+        query_client = _FakeQueryClient(list(range(4)), delay=0.05)
+        fetcher = _ChunkContentFetcher(query_client, fetch_size=4)
+        chunks = _build_chunks(fetcher, 4)
+
+        contents: list[str] = []
+        threads = [
+            threading.Thread(
+                target=lambda ind=ind: contents.append(chunks[ind].content)
+            )
+            for ind in [0, 0, 1, 2, 3, 3]
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(query_client.fetch_sizes, [4])
+        self.assertEqual(
+            sorted(contents),
+            [
+                "Content 0",
+                "Content 0",
+                "Content 1",
+                "Content 2",
+                "Content 3",
+                "Content 3",
+            ],
+        )
+
+    def test_load_chunk_contents(self) -> None:
+        # Chunk 3 has no content
+        query_client = _FakeQueryClient([0, 1, 2, 4])
+        fetcher = _ChunkContentFetcher(query_client)
+        chunks = _build_chunks(fetcher, 5)
+        # Already loaded chunks are not fetched again
+        chunks[0].content = "Already loaded"
+
+        document_index = VespaIndex()
+        document_index.query_client = query_client
+        loaded_chunks = document_index.load_chunk_contents(chunks)
+
+        self.assertEqual(
+            [chunk.chunk_id for chunk in loaded_chunks],
+            [0, 1, 2, 4],
+        )
+        self.assertEqual(
+            [chunk.content for chunk in loaded_chunks],
+            ["Already loaded", "Content 1", "Content 2", "Content 4"],
+        )
+        self.assertEqual(sum(query_client.fetch_sizes), 4)
+
+    def test_match_highlights(self) -> None:
+        fetcher = _ChunkContentFetcher(_FakeQueryClient([]))
+        chunk = _vespa_hit_to_inference_chunk(_listing_hit(0), fetcher)
+        self.assertEqual(chunk.match_highlights, ["<hi>Content</hi> 0"])
+
+        # Falls back to the blurb without fetching the content
+        chunk = _vespa_hit_to_inference_chunk(
+            _listing_hit(1, with_content_summary=False), fetcher
+        )
+        self.assertEqual(chunk.match_highlights, ["Blurb 1"])
+        self.assertTrue(is_deferred(chunk, "content"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import threading
+import unittest
+from typing import Any
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import requests
+
+from danswer.document_index.vespa import feed_client
+from danswer.document_index.vespa.feed_client import _AdaptiveThrottle
+from danswer.document_index.vespa.feed_client import (
+    _SUCCESSES_PER_WINDOW_INCREASE,
+)
+from danswer.document_index.vespa.feed_client import VespaFeedClient
+
+
+def _response(status_code: int) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    return response
+
+
+class TestAdaptiveThrottle(unittest.TestCase):
+    def test_decrease_once_per_window(self) -> None:
+        throttle = _AdaptiveThrottle(min_in_flight=2, max_in_flight=16)
+
+        # A whole window of operations gets pushed back, only halves once
+        sent_at = [throttle.acquire() for _ in range(16)]
+        for num_decreases in sent_at:
+            throttle.release()
+            throttle.record_backpressure(num_decreases)
+        self.assertEqual(throttle.window, 8)
+
+        # Pushed back again once sent with the smaller window
+        num_decreases = throttle.acquire()
+        throttle.release()
+        throttle.record_backpressure(num_decreases)
+        self.assertEqual(throttle.window, 4)
+
+        # Never below the minimum
+        for _ in range(3):
+            num_decreases = throttle.acquire()
+            throttle.release()
+            throttle.record_backpressure(num_decreases)
+        self.assertEqual(throttle.window, 2)
+
+    def test_additive_increase(self) -> None:
+        throttle = _AdaptiveThrottle(min_in_flight=1, max_in_flight=4)
+        throttle.record_backpressure(throttle.acquire())
+        throttle.release()
+        self.assertEqual(throttle.window, 2)
+
+        for _ in range(_SUCCESSES_PER_WINDOW_INCREASE - 1):
+            throttle.record_success()
+        self.assertEqual(throttle.window, 2)
+        throttle.record_success()
+        self.assertEqual(throttle.window, 3)
+
+        # Backpressure resets the streak
+        for _ in range(_SUCCESSES_PER_WINDOW_INCREASE - 1):
+            throttle.record_success()
+        throttle.record_backpressure(throttle.acquire() - 1)
+        throttle.release()
+        throttle.record_success()
+        self.assertEqual(throttle.window, 3)
+
+        # Never above the maximum
+        for _ in range(_SUCCESSES_PER_WINDOW_INCREASE * 3):
+            throttle.record_success()
+        self.assertEqual(throttle.window, 4)
+
+    def test_acquire_waits_for_room(self) -> None:
+        throttle = _AdaptiveThrottle(min_in_flight=1, max_in_flight=2)
+        throttle.acquire()
+        throttle.acquire()
+
+        acquired = threading.Event()
+
+        def _acquire() -> None:
+            throttle.acquire()
+            acquired.set()
+
+        threading.Thread(target=_acquire, daemon=True).start()
+        self.assertFalse(acquired.wait(0.1))
+        throttle.release()
+        self.assertTrue(acquired.wait(1))
+        self.assertEqual(throttle.in_flight, 2)
+
+
+class TestVespaFeedClient(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sleeps: list[float] = []
+        self.enterContext(
+            patch.object(feed_client.time, "sleep", side_effect=self.sleeps.append)
+        )
+
+    def _client(self, *outcomes: Any) -> VespaFeedClient:
+        client = VespaFeedClient(
+            min_in_flight=1, max_in_flight=8, max_retries=5, initial_backoff=0.5
+        )
+        client.session = MagicMock()
+        client.session.request.side_effect = list(outcomes)
+        return client
+
+    def test_retries_with_backoff(self) -> None:
+        client = self._client(
+            _response(429),
+            requests.ConnectionError(),
+            _response(502),
+            requests.ReadTimeout(),
+            _response(500),
+            _response(200),
+        )
+        response = client.send("POST", "url", json={})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.session.request.call_count, 6)
+        self.assertEqual(self.sleeps, [0.5, 1.0, 2.0, 4.0, 8.0])
+        # Only the 429 counts as backpressure
+        self.assertEqual(client.throttle.window, 4)
+        self.assertEqual(client.throttle.in_flight, 0)
+
+    def test_timeout(self) -> None:
+        client = self._client(_response(200), _response(200))
+        client.send("GET", "url")
+        client.send("GET", "url", timeout=60)
+        self.assertEqual(
+            [call.kwargs["timeout"] for call in client.session.request.call_args_list],
+            [client.timeout, 60],
+        )
+
+    def test_other_responses_are_not_retried(self) -> None:
+        client = self._client(_response(400))
+        self.assertEqual(client.send("POST", "url").status_code, 400)
+        self.assertEqual(client.session.request.call_count, 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_gives_up_after_max_retries(self) -> None:
+        client = self._client(*[_response(503)] * 6)
+        self.assertEqual(client.send("POST", "url").status_code, 503)
+        self.assertEqual(client.session.request.call_count, 6)
+        self.assertEqual(self.sleeps, [0.5, 1.0, 2.0, 4.0, 8.0])
+        # Every retry was sent after the previous decrease
+        self.assertEqual(client.throttle.window, 1)
+
+        client = self._client(*[requests.Timeout()] * 6)
+        with self.assertRaises(requests.Timeout):
+            client.send("POST", "url")
+        self.assertEqual(client.throttle.in_flight, 0)
+
+    def test_concurrent_backpressure_decreases_once(self) -> None:
+        client = VespaFeedClient(min_in_flight=1, max_in_flight=8, max_retries=1)
+        all_sent = threading.Barrier(8)
+        num_requests = 0
+        lock = threading.Lock()
+
+        def _request(*args: Any, **kwargs: Any) -> requests.Response:
+            nonlocal num_requests
+            with lock:
+                num_requests += 1
+                is_first_send = num_requests <= 8
+            # Every operation of the window is in flight before any of them gets its answer
+            if is_first_send:
+                all_sent.wait(timeout=5)
+                return _response(429)
+            return _response(200)
+
+        client.session = MagicMock()
+        client.session.request.side_effect = _request
+        responses = client.map(lambda _: client.send("PUT", "url"), list(range(8)))
+
+        self.assertEqual([response.status_code for response in responses], [200] * 8)
+        self.assertEqual(client.throttle.window, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
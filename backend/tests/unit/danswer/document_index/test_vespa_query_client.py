@@ -0,0 +1,111 @@
+import time
+import unittest
+from typing import Any
+from unittest.mock import MagicMock
+
+import requests
+
+from danswer.document_index.vespa.query_client import _CircuitBreaker
+from danswer.document_index.vespa.query_client import VespaQueryClient
+from danswer.document_index.vespa.query_client import VespaUnavailableError
+
+
+def _response(status_code: int) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = b'{"root": {}, "timing": {"searchtime": 0.001}}'
+    return response
+
+
+def _client_answering(*outcomes: Any) -> VespaQueryClient:
+    """Each query gets the next of the outcomes, an exception is raised, anything else is
+    returned as the response"""
+    client = VespaQueryClient(circuit_breaker_failures=2, circuit_breaker_cooldown=0.05)
+    client.session = MagicMock()
+    client.session.get.side_effect = list(outcomes)
+    return client
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_transitions(self) -> None:
+        breaker = _CircuitBreaker(failure_threshold=2, cooldown=0.05)
+
+        # Closed, a success resets the failures
+        breaker.before_request()
+        breaker.record_failure()
+        breaker.before_request()
+        breaker.record_success()
+        breaker.before_request()
+        breaker.record_failure()
+        breaker.before_request()
+
+        # Open after the second failure in a row
+        breaker.record_failure()
+        with self.assertRaises(VespaUnavailableError):
+            breaker.before_request()
+
+        # Half-open after the cooldown, only a single trial request goes through
+        time.sleep(0.06)
+        breaker.before_request()
+        with self.assertRaises(VespaUnavailableError):
+            breaker.before_request()
+
+        # A failed trial opens the circuit again right away
+        breaker.record_failure()
+        with self.assertRaises(VespaUnavailableError):
+            breaker.before_request()
+
+        # A successful trial closes it
+        time.sleep(0.06)
+        breaker.before_request()
+        breaker.record_success()
+        breaker.before_request()
+        breaker.before_request()
+
+    def test_client_records_outcomes(self) -> None:
+        client = _client_answering(
+            _response(400),
+            _response(503),
+            requests.ConnectionError(),
+            _response(200),
+        )
+        # Bad queries don't count as failures
+        with self.assertRaises(requests.HTTPError):
+            client.search("url", {})
+        with self.assertRaises(requests.HTTPError):
+            client.search("url", {})
+        with self.assertRaises(requests.ConnectionError):
+            client.search("url", {})
+
+        with self.assertRaises(VespaUnavailableError):
+            client.search("url", {})
+        self.assertEqual(client.session.get.call_count, 3)
+
+        time.sleep(0.06)
+        response_json, timing = client.search("url", {})
+        self.assertEqual(response_json, {"root": {}, "timing": {"searchtime": 0.001}})
+        self.assertGreaterEqual(timing.total, 0)
+        self.assertIsNone(client.circuit_breaker._opened_at)
+
+    def test_unexpected_error_releases_trial(self) -> None:
+        client = _client_answering(
+            requests.Timeout(),
+            requests.Timeout(),
+            ValueError("not a Vespa failure"),
+            _response(200),
+        )
+        for _ in range(2):
+            with self.assertRaises(requests.Timeout):
+                client.search("url", {})
+
+        time.sleep(0.06)
+        # The trial ends with an error that says nothing about Vespa
+        with self.assertRaises(ValueError):
+            client.search("url", {})
+        # The next request gets to be the trial instead of being rejected forever
+        client.search("url", {})
+        self.assertIsNone(client.circuit_breaker._opened_at)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+import random
+import unittest
+from typing import Any
+from unittest.mock import patch
+
+from llama_index.text_splitter import SentenceSplitter
+from tokenizers import decoders  # type: ignore
+from tokenizers import models
+from tokenizers import pre_tokenizers
+from tokenizers import Tokenizer
+from tokenizers import trainers
+from transformers import PreTrainedTokenizerFast  # type: ignore
+
+from danswer.configs.constants import DocumentSource
+from danswer.connectors.models import Document
+from danswer.connectors.models import Section
+from danswer.indexing import chunker
+from danswer.indexing.chunker import chunk_document
+from danswer.indexing.chunker import SECTION_SEPARATOR
+from danswer.utils.text_processing import shared_precompare_cleanup
+
+_CHUNK_SIZE = 48
+_CHUNK_OVERLAP = 8
+_BLURB_SIZE = 12
+
+_WORDS = (
+    "deploy the release tonight staging looks green but the migration on prod took "
+    "longer than expected can someone check grafana :eyes: :+1: thanks!! ok.. "
+    "rolling back now https://example.com/runbook?id=42 @channel FYI 3.14 v2.0"
+).split()
+
+
+def _slack_documents(num_docs: int = 20) -> list[Document]:
+    """Threads of short messages with the odd long message, emoji, links and whitespace
+    around the messages"""
+    rand = random.Random(7)
+    documents = []
+    for doc_ind in range(num_docs):
+        sections = []
+        for message_ind in range(rand.randint(1, 30)):
+            num_words = rand.choice([0, 1, 3, 5, 8, 13, 21, 120])
+            text = " ".join(rand.choice(_WORDS) for _ in range(num_words))
+            if num_words > 30:
+                text = ". ".join(text.split(" thanks!! "))
+            if text:
+                text = (
+                    rand.choice(["", " ", "\n", "  "]) + text + rand.choice(["", "\n"])
+                )
+            sections.append(
+                Section(
+                    text=text,
+                    link=f"https://slack.com/archives/{doc_ind}/p{message_ind}",
+                )
+            )
+        documents.append(
+            Document(
+                id=f"slack thread {doc_ind}",
+                sections=sections,
+                source=DocumentSource.SLACK,
+                semantic_identifier=f"#thread {doc_ind}",
+                metadata={},
+            )
+        )
+    return documents
+
+
+def _train_tokenizer(
+    model: Any, pre_tokenizer: Any, trainer: Any, documents: list[Document]
+) -> PreTrainedTokenizerFast:
+    tokenizer = Tokenizer(model)
+    tokenizer.pre_tokenizer = pre_tokenizer
+    tokenizer.train_from_iterator(
+        [section.text for document in documents for section in document.sections]
+        + [
+            SECTION_SEPARATOR.join(section.text for section in document.sections)
+            for document in documents
+        ],
+        trainer=trainer,
+    )
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer)
+
+
+def _wordpiece_tokenizer(documents: list[Document]) -> PreTrainedTokenizerFast:
+    tokenizer = _train_tokenizer(
+        models.WordPiece(unk_token="[UNK]"),
+        pre_tokenizers.BertPreTokenizer(),
+        trainers.WordPieceTrainer(vocab_size=200, special_tokens=["[UNK]"]),
+        documents,
+    )
+    tokenizer.backend_tokenizer.decoder = decoders.WordPiece()
+    return tokenizer
+
+
+def _byte_level_bpe_tokenizer(documents: list[Document]) -> PreTrainedTokenizerFast:
+    return _train_tokenizer(
+        models.BPE(),
+        pre_tokenizers.ByteLevel(add_prefix_space=False),
+        trainers.BpeTrainer(
+            vocab_size=400, initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+        ),
+        documents,
+    )
+
+
+def _reference_chunk_document(
+    document: Document, tokenizer: PreTrainedTokenizerFast
+) -> list[dict[str, Any]]:
+    """The chunking as it was before sections were tokenized only once, tokenizing the
+    whole chunk text again for every section"""
+
+    def _extract_blurb(text: str) -> str:
+        return SentenceSplitter(
+            tokenizer=tokenizer.tokenize, chunk_size=_BLURB_SIZE, chunk_overlap=0
+        ).split_text(text)[0]
+
+    def _chunk(chunk_text: str, link_offsets: dict[int, str]) -> dict[str, Any]:
+        return {
+            "content": chunk_text,
+            "blurb": _extract_blurb(chunk_text),
+            "source_links": link_offsets,
+        }
+
+    chunks: list[dict[str, Any]] = []
+    link_offsets: dict[int, str] = {}
+    chunk_text = ""
+    for section in document.sections:
+        section_link_text = section.link or ""
+        section_tok_length = len(tokenizer.tokenize(section.text))
+        current_tok_length = len(tokenizer.tokenize(chunk_text))
+        curr_offset_len = len(shared_precompare_cleanup(chunk_text))
+
+        if section_tok_length > _CHUNK_SIZE:
+            if chunk_text:
+                chunks.append(_chunk(chunk_text, link_offsets))
+                link_offsets = {}
+                chunk_text = ""
+
+            blurb = _extract_blurb(section.text)
+            split_texts = SentenceSplitter(
+                tokenizer=tokenizer.tokenize,
+                chunk_size=_CHUNK_SIZE,
+                chunk_overlap=_CHUNK_OVERLAP,
+            ).split_text(section.text)
+            chunks.extend(
+                {
+                    "content": chunk_str,
+                    "blurb": blurb,
+                    "source_links": {0: section_link_text},
+                }
+                for chunk_str in split_texts
+            )
+            continue
+
+        if (
+            current_tok_length
+            + len(tokenizer.tokenize(SECTION_SEPARATOR))
+            + section_tok_length
+            <= _CHUNK_SIZE
+        ):
+            chunk_text += (
+                SECTION_SEPARATOR + section.text if chunk_text else section.text
+            )
+            link_offsets[curr_offset_len] = section_link_text
+        else:
+            chunks.append(_chunk(chunk_text, link_offsets))
+            link_offsets = {0: section_link_text}
+            chunk_text = section.text
+
+    if chunk_text:
+        chunks.append(_chunk(chunk_text, link_offsets))
+    return chunks
+
+
+class TestChunker(unittest.TestCase):
+    def setUp(self) -> None:
+        self.documents = _slack_documents()
+
+    def _clear_caches(self) -> None:
+        chunker._count_tokens.cache_clear()
+        chunker._token_counts_add_up.cache_clear()
+        chunker.get_sentence_splitter.cache_clear()
+
+    def _assert_same_as_reference(self, tokenizer: PreTrainedTokenizerFast) -> None:
+        self._clear_caches()
+        self.addCleanup(self._clear_caches)
+        with patch.object(chunker, "get_default_tokenizer", return_value=tokenizer):
+            for document in self.documents:
+                chunks = chunk_document(
+                    document,
+                    chunk_tok_size=_CHUNK_SIZE,
+                    subsection_overlap=_CHUNK_OVERLAP,
+                    blurb_size=_BLURB_SIZE,
+                )
+                reference_chunks = _reference_chunk_document(document, tokenizer)
+
+                self.assertEqual(
+                    [chunk.content for chunk in chunks],
+                    [chunk["content"] for chunk in reference_chunks],
+                )
+                self.assertEqual(
+                    [chunk.source_links for chunk in chunks],
+                    [chunk["source_links"] for chunk in reference_chunks],
+                )
+                self.assertEqual(
+                    [chunk.blurb for chunk in chunks],
+                    [chunk["blurb"] for chunk in reference_chunks],
+                )
+                self.assertEqual(
+                    [chunk.chunk_id for chunk in chunks], list(range(len(chunks)))
+                )
+
+    def test_wordpiece_matches_reference(self) -> None:
+        tokenizer = _wordpiece_tokenizer(self.documents)
+        with patch.object(chunker, "get_default_tokenizer", return_value=tokenizer):
+            self.assertTrue(chunker._token_counts_add_up())
+        self._assert_same_as_reference(tokenizer)
+
+    def test_byte_level_bpe_matches_reference(self) -> None:
+        tokenizer = _byte_level_bpe_tokenizer(self.documents)
+        # The whitespace around the messages is tokenized differently once they are joined,
+        # the token count of the joined text is not the sum of its sections
+        joined_text = SECTION_SEPARATOR.join(
+            section.text for section in self.documents[0].sections
+        )
+        self.assertNotEqual(
+            len(tokenizer.tokenize(joined_text)),
+            sum(
+                len(tokenizer.tokenize(section.text))
+                for section in self.documents[0].sections
+            )
+            + len(tokenizer.tokenize(SECTION_SEPARATOR))
+            * (len(self.documents[0].sections) - 1),
+        )
+        self._clear_caches()
+        with patch.object(chunker, "get_default_tokenizer", return_value=tokenizer):
+            self.assertFalse(chunker._token_counts_add_up())
+        self._assert_same_as_reference(tokenizer)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import copy
+import unittest
+from dataclasses import fields
+from typing import Any
+
+from danswer.indexing.models import Deferred
+from danswer.indexing.models import InferenceChunk
+from danswer.indexing.models import is_deferred
+from danswer.indexing.models import LazyInferenceChunk
+
+
+def _build_chunk(**deferred_fields: Any) -> LazyInferenceChunk:
+    chunk = LazyInferenceChunk(
+        document_id="test doc",
+        source_type="testing",
+        chunk_id=0,
+        content="Some content",
+        source_links={0: "link"},
+        blurb="Some blurb",
+        semantic_identifier="anything",
+        section_continuation=False,
+        recency_bias=1,
+        boost=0,
+        hidden=False,
+        score=1,
+        metadata={},
+        match_highlights=[],
+        updated_at=None,
+    )
+    for field_name, deferred in deferred_fields.items():
+        setattr(chunk, field_name, deferred)
+    return chunk
+
+
+class _CountingLoad:
+    def __init__(self, value: Any) -> None:
+        self.value = value
+        self.calls = 0
+
+    def __call__(self) -> Any:
+        self.calls += 1
+        return self.value
+
+
+class TestDeferredFields(unittest.TestCase):
+    def test_construction(self) -> None:
+        chunk = _build_chunk()
+        self.assertEqual(chunk.content, "Some content")
+        self.assertEqual(chunk.source_links, {0: "link"})
+        self.assertEqual(chunk.metadata, {})
+        self.assertIsNone(chunk.primary_owners)
+        self.assertFalse(is_deferred(chunk, "content"))
+        self.assertEqual(
+            [field.name for field in fields(chunk)],
+            [field.name for field in fields(InferenceChunk)],
+        )
+
+    def test_first_read_loads_once(self) -> None:
+        load_content = _CountingLoad("Loaded content")
+        load_metadata = _CountingLoad({"key": "value"})
+        chunk = _build_chunk(
+            content=Deferred(load_content), metadata=Deferred(load_metadata)
+        )
+        self.assertTrue(is_deferred(chunk, "content"))
+        self.assertEqual(load_content.calls, 0)
+
+        self.assertEqual(chunk.content, "Loaded content")
+        self.assertEqual(chunk.content, "Loaded content")
+        self.assertEqual(load_content.calls, 1)
+        self.assertFalse(is_deferred(chunk, "content"))
+
+        # The other fields stay deferred until read
+        self.assertTrue(is_deferred(chunk, "metadata"))
+        self.assertEqual(load_metadata.calls, 0)
+        self.assertFalse(is_deferred(chunk, "document_id"))
+
+        # Assigning replaces the deferred value without loading it
+        chunk.metadata = {"key": "other value"}
+        self.assertEqual(chunk.metadata, {"key": "other value"})
+        self.assertEqual(load_metadata.calls, 0)
+
+    def test_copy(self) -> None:
+        load_content = _CountingLoad("Loaded content")
+        chunk = _build_chunk(content=Deferred(load_content))
+        chunk_copy = copy.copy(chunk)
+
+        # Both share the Deferred, the first read through either loads it for both
+        self.assertEqual(chunk_copy.content, "Loaded content")
+        self.assertTrue(is_deferred(chunk, "content"))
+        self.assertEqual(chunk.content, "Loaded content")
+        self.assertEqual(load_content.calls, 1)
+
+        # But the copies are independent once loaded
+        chunk_copy.content = "Trimmed"
+        self.assertEqual(chunk.content, "Loaded content")
+
+    def test_compare_and_repr_do_not_load(self) -> None:
+        load_content = _CountingLoad("Loaded content")
+        chunk = _build_chunk(content=Deferred(load_content))
+        other_chunk = _build_chunk(content=Deferred(load_content))
+
+        self.assertNotEqual(chunk, other_chunk)
+        self.assertEqual(chunk, chunk)
+        self.assertEqual(chunk.unique_id, other_chunk.unique_id)
+        repr(chunk)
+        self.assertEqual(load_content.calls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import threading
+import time
+import unittest
+from collections.abc import Generator
+from collections.abc import Iterator
+from typing import Any
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from danswer.configs.constants import DocumentSource
+from danswer.connectors.models import Document
+from danswer.connectors.models import IndexAttemptMetadata
+from danswer.indexing import indexing_pipeline
+from danswer.indexing.indexing_pipeline import EmbeddedDocumentBatch
+from danswer.indexing.indexing_pipeline import run_pipelined_indexing
+
+
+def _build_doc(doc_id: str) -> Document:
+    return Document(
+        id=doc_id,
+        sections=[],
+        source=DocumentSource.FILE,
+        semantic_identifier=doc_id,
+        metadata={},
+    )
+
+
+def _build_batches(*batch_doc_ids: list[str]) -> list[list[Document]]:
+    return [[_build_doc(doc_id) for doc_id in doc_ids] for doc_ids in batch_doc_ids]
+
+
+def _fake_chunk_and_embed(
+    *, documents: list[Document], **kwargs: Any
+) -> EmbeddedDocumentBatch:
+    return EmbeddedDocumentBatch(
+        documents=documents, updatable_docs=documents, chunks_with_embeddings=[]
+    )
+
+
+class _RecordingWriter:
+    """Stands in for `_index_embedded_documents`, the batches listed in `slow_batches` take a
+    while to write and the batches listed in `failing_batches` fail"""
+
+    def __init__(
+        self,
+        slow_batches: set[int] | None = None,
+        failing_batches: set[int] | None = None,
+    ) -> None:
+        self.slow_batches = slow_batches or set()
+        self.failing_batches = failing_batches or set()
+        # (event, batch index) in the order they happened
+        self.events: list[tuple[str, int]] = []
+        self._lock = threading.Lock()
+
+    def __call__(
+        self, *, embedded_batch: EmbeddedDocumentBatch, **kwargs: Any
+    ) -> tuple[int, int]:
+        batch_ind = int(embedded_batch.documents[0].semantic_identifier.split("-")[0])
+        with self._lock:
+            self.events.append(("start", batch_ind))
+        if batch_ind in self.slow_batches:
+            time.sleep(0.2)
+        with self._lock:
+            self.events.append(("end", batch_ind))
+        if batch_ind in self.failing_batches:
+            raise RuntimeError(f"Writing batch {batch_ind} failed")
+        return len(embedded_batch.documents), 0
+
+
+def _numbered_batches(*batch_doc_ids: list[str]) -> list[list[Document]]:
+    """The semantic identifier of every document starts with the index of its batch"""
+    batches = _build_batches(*batch_doc_ids)
+    for batch_ind, batch in enumerate(batches):
+        for doc in batch:
+            doc.semantic_identifier = f"{batch_ind}-{doc.id}"
+    return batches
+
+
+class TestPipelinedIndexing(unittest.TestCase):
+    def setUp(self) -> None:
+        # Kept patched until the end of the test, the stages may still be running after the
+        # pipeline generator is done
+        self.enterContext(
+            patch.object(
+                indexing_pipeline, "_chunk_and_embed_documents", _fake_chunk_and_embed
+            )
+        )
+
+    def _run(
+        self, doc_batches: Any, writer: _RecordingWriter, num_index_writers: int = 1
+    ) -> Generator[tuple[list[Document], int, int], None, None]:
+        self.enterContext(
+            patch.object(indexing_pipeline, "_index_embedded_documents", writer)
+        )
+        return run_pipelined_indexing(
+            doc_batches=doc_batches,
+            index_attempt_metadata=IndexAttemptMetadata(
+                connector_id=1, credential_id=1
+            ),
+            chunker=MagicMock(),
+            embedder=MagicMock(),
+            document_index=MagicMock(),
+            queue_size=1,
+            num_index_writers=num_index_writers,
+        )
+
+    def test_yields_in_order(self) -> None:
+        batches = _numbered_batches(["a"], ["b", "c"], ["d"])
+        results = list(
+            self._run(batches, _RecordingWriter(slow_batches={0}), num_index_writers=3)
+        )
+        self.assertEqual(
+            [(batch, new_docs) for batch, new_docs, _ in results],
+            [(batch, len(batch)) for batch in batches],
+        )
+
+    def test_overlapping_batches_are_written_in_order(self) -> None:
+        batches = _numbered_batches(["a", "b"], ["c"], ["b", "d"])
+        writer = _RecordingWriter(slow_batches={0})
+        list(self._run(batches, writer, num_index_writers=3))
+
+        # Batch 1 shares nothing with batch 0 and is written alongside it, batch 2 has to
+        # wait for batch 0 to be done with document "b"
+        self.assertLess(
+            writer.events.index(("start", 1)), writer.events.index(("end", 0))
+        )
+        self.assertLess(
+            writer.events.index(("end", 0)), writer.events.index(("start", 2))
+        )
+
+    def test_fetch_failure(self) -> None:
+        def _failing_batches() -> Iterator[list[Document]]:
+            yield from _numbered_batches(["a"])
+            raise ValueError("Connector failed")
+
+        results = self._run(_failing_batches(), _RecordingWriter())
+        self.assertEqual(next(results)[0][0].id, "a")
+        with self.assertRaisesRegex(ValueError, "Connector failed"):
+            next(results)
+
+    def test_chunk_and_embed_failure(self) -> None:
+        def _failing_chunk_and_embed(
+            *, documents: list[Document], **kwargs: Any
+        ) -> EmbeddedDocumentBatch:
+            if documents[0].id == "b":
+                raise ValueError("Embedding failed")
+            return _fake_chunk_and_embed(documents=documents)
+
+        self.enterContext(
+            patch.object(
+                indexing_pipeline,
+                "_chunk_and_embed_documents",
+                _failing_chunk_and_embed,
+            )
+        )
+        writer = _RecordingWriter()
+        results = self._run(_numbered_batches(["a"], ["b"], ["c"]), writer)
+        self.assertEqual(next(results)[0][0].id, "a")
+        with self.assertRaisesRegex(ValueError, "Embedding failed"):
+            next(results)
+        # Nothing past the failed batch is written
+        self.assertEqual(writer.events, [("start", 0), ("end", 0)])
+
+    def test_write_failure(self) -> None:
+        results = self._run(
+            _numbered_batches(["a"], ["b"], ["c"]),
+            _RecordingWriter(failing_batches={1}),
+            num_index_writers=2,
+        )
+        self.assertEqual(next(results)[0][0].id, "a")
+        with self.assertRaisesRegex(RuntimeError, "Writing batch 1 failed"):
+            next(results)
+
+    def test_early_close_stops_the_stages(self) -> None:
+        fetched_batches: list[int] = []
+
+        def _endless_batches() -> Iterator[list[Document]]:
+            batch_ind = 0
+            while True:
+                fetched_batches.append(batch_ind)
+                doc = _build_doc(f"doc {batch_ind}")
+                doc.semantic_identifier = f"{batch_ind}-{doc.id}"
+                yield [doc]
+                batch_ind += 1
+
+        threads_before = set(threading.enumerate())
+        results = self._run(_endless_batches(), _RecordingWriter())
+        next(results)
+        stage_threads = [
+            thread
+            for thread in threading.enumerate()
+            if thread not in threads_before
+            and thread.name in ("indexing-fetch", "indexing-chunk-embed")
+        ]
+        self.assertEqual(len(stage_threads), 2)
+        results.close()
+
+        # The stages notice within their queue timeouts and stop pulling from the connector
+        for thread in stage_threads:
+            thread.join(timeout=10)
+            self.assertFalse(thread.is_alive())
+        # No more than what fits in the queues and the stages was fetched ahead
+        self.assertLess(len(fetched_batches), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+
+import numpy
+
+from danswer.document_index.document_index_utils import (
+    translate_boost_count_to_multiplier,
+)
+from danswer.search.scoring import boost_multipliers
+from danswer.search.scoring import max_merge
+from danswer.search.scoring import rank_descending
+
+
+class TestScoring(unittest.TestCase):
+    def test_boost_multipliers(self) -> None:
+        boosts = [-10, -1, 0, 1, 10]
+        self.assertTrue(
+            numpy.allclose(
+                boost_multipliers(boosts),
+                [translate_boost_count_to_multiplier(boost) for boost in boosts],
+            )
+        )
+
+    def test_rank_descending(self) -> None:
+        scores = numpy.array([0.2, 0.9, 0.5, 0.9, 0.1])
+        # Equal scores keep their original order
+        self.assertEqual(rank_descending(scores).tolist(), [1, 3, 2, 0, 4])
+        self.assertEqual(rank_descending(scores, k=3).tolist(), [1, 3, 2])
+        self.assertEqual(rank_descending(scores, k=0).tolist(), [])
+
+    def test_max_merge(self) -> None:
+        keys = [("a", 0), ("b", 0), ("a", 0), ("c", 1), ("b", 0)]
+        scores = [0.5, 0.7, 0.8, 0.7, 0.7]
+        # ("a", 0) keeps its second copy, ("b", 0) its first since the scores are equal
+        # and ("b", 0) stays ahead of ("c", 1) since it was seen first
+        self.assertEqual(max_merge(keys, scores).tolist(), [2, 1, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from typing import Any
+
+from danswer.configs.constants import DocumentSource
+from danswer.indexing.models import InferenceChunk
+from danswer.search.models import IndexFilters
+from danswer.search.models import SearchQuery
+from danswer.search.models import SearchType
+from danswer.search.search_runner import _passes_time_cutoff
+from danswer.search.search_runner import filter_speculative_chunks
+
+
+def _build_chunk(
+    chunk_id: int, source_type: str, updated_at: datetime | None
+) -> InferenceChunk:
+    return InferenceChunk(
+        document_id=f"doc {chunk_id}",
+        source_type=source_type,
+        chunk_id=0,
+        content="Some content",
+        source_links=None,
+        blurb="Some blurb",
+        semantic_identifier="anything",
+        section_continuation=False,
+        recency_bias=1,
+        boost=0,
+        hidden=False,
+        score=1,
+        metadata={},
+        match_highlights=[],
+        updated_at=updated_at,
+    )
+
+
+def _build_query(favor_recent: bool = False, **filters: Any) -> SearchQuery:
+    return SearchQuery(
+        query="What is the deadline?",
+        search_type=SearchType.HYBRID,
+        filters=IndexFilters(access_control_list=["PUBLIC"], **filters),
+        favor_recent=favor_recent,
+    )
+
+
+def _doc_ids(chunks: list[InferenceChunk] | None) -> list[str] | None:
+    return [chunk.document_id for chunk in chunks] if chunks is not None else None
+
+
+_NOW = datetime.now(timezone.utc)
+
+
+class TestSpeculativeRetrieval(unittest.TestCase):
+    def test_passes_time_cutoff(self) -> None:
+        recent_cutoff = _NOW - timedelta(days=30)
+        old_cutoff = _NOW - timedelta(days=100)
+
+        self.assertTrue(
+            _passes_time_cutoff(_build_chunk(0, "slack", _NOW), recent_cutoff)
+        )
+        self.assertFalse(
+            _passes_time_cutoff(
+                _build_chunk(0, "slack", _NOW - timedelta(days=31)), recent_cutoff
+            )
+        )
+        # Untimed documents only pass cutoffs from before the last 92 days
+        untimed_chunk = _build_chunk(0, "slack", None)
+        self.assertFalse(_passes_time_cutoff(untimed_chunk, recent_cutoff))
+        self.assertTrue(_passes_time_cutoff(untimed_chunk, old_cutoff))
+
+    def test_stricter_source_filter(self) -> None:
+        chunks = [
+            _build_chunk(0, "slack", None),
+            _build_chunk(1, "web", None),
+            _build_chunk(2, "slack", None),
+        ]
+        query = _build_query(source_type=[DocumentSource.SLACK])
+
+        # Not filtered speculatively, applied locally
+        filtered_chunks = filter_speculative_chunks(
+            _build_query(), query, chunks, min_hits=1
+        )
+        self.assertEqual(_doc_ids(filtered_chunks), ["doc 0", "doc 2"])
+
+        # Filtered speculatively on a different set of sources, would rank differently
+        self.assertIsNone(
+            filter_speculative_chunks(
+                _build_query(source_type=[DocumentSource.SLACK, DocumentSource.WEB]),
+                query,
+                chunks,
+                min_hits=1,
+            )
+        )
+
+        # Filtered speculatively on the same sources, nothing left to filter
+        filtered_chunks = filter_speculative_chunks(query, query, chunks, min_hits=1)
+        self.assertEqual(_doc_ids(filtered_chunks), ["doc 0", "doc 1", "doc 2"])
+
+    def test_time_cutoff(self) -> None:
+        chunks = [
+            _build_chunk(0, "slack", _NOW - timedelta(days=10)),
+            _build_chunk(1, "slack", None),
+            _build_chunk(2, "slack", _NOW - timedelta(days=60)),
+        ]
+
+        # Untimed documents are dropped by a cutoff within the last 92 days
+        filtered_chunks = filter_speculative_chunks(
+            _build_query(),
+            _build_query(time_cutoff=_NOW - timedelta(days=30)),
+            chunks,
+            min_hits=1,
+        )
+        self.assertEqual(_doc_ids(filtered_chunks), ["doc 0"])
+
+        # And kept by an older one
+        filtered_chunks = filter_speculative_chunks(
+            _build_query(),
+            _build_query(time_cutoff=_NOW - timedelta(days=100)),
+            chunks,
+            min_hits=1,
+        )
+        self.assertEqual(_doc_ids(filtered_chunks), ["doc 0", "doc 1", "doc 2"])
+
+    def test_too_few_hits_left(self) -> None:
+        chunks = [
+            _build_chunk(0, "slack", None),
+            _build_chunk(1, "web", None),
+            _build_chunk(2, "web", None),
+        ]
+        query = _build_query(source_type=[DocumentSource.SLACK])
+        self.assertIsNone(
+            filter_speculative_chunks(_build_query(), query, chunks, min_hits=2)
+        )
+
+        # Fewer than min_hits retrieved in the first place, but none were filtered out
+        filtered_chunks = filter_speculative_chunks(
+            _build_query(), _build_query(), chunks, min_hits=5
+        )
+        self.assertEqual(_doc_ids(filtered_chunks), ["doc 0", "doc 1", "doc 2"])
+
+    def test_different_favor_recent(self) -> None:
+        chunks = [_build_chunk(0, "slack", _NOW)]
+        self.assertIsNone(
+            filter_speculative_chunks(
+                _build_query(favor_recent=False),
+                _build_query(favor_recent=True),
+                chunks,
+                min_hits=1,
+            )
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from danswer.prompts.llm_chunk_filter import NONUSEFUL_PAT
+from danswer.prompts.llm_chunk_filter import USEFUL_PAT
+from danswer.secondary_llm_flows import chunk_usefulness
+from danswer.secondary_llm_flows.chunk_usefulness import _extract_batch_usefulness
+from danswer.secondary_llm_flows.chunk_usefulness import _run_eval_calls
+from danswer.secondary_llm_flows.chunk_usefulness import llm_eval_chunks_batched
+
+
+class TestExtractBatchUsefulness(unittest.TestCase):
+    def test_valid_output(self) -> None:
+        model_output = "Here you go:\n" + json.dumps(
+            {"1": USEFUL_PAT, "2": NONUSEFUL_PAT}
+        )
+        self.assertEqual(_extract_batch_usefulness(model_output, 2), [True, False])
+
+    def test_missing_section_number(self) -> None:
+        model_output = json.dumps({"1": USEFUL_PAT, "3": NONUSEFUL_PAT})
+        self.assertEqual(
+            _extract_batch_usefulness(model_output, 3), [True, None, False]
+        )
+
+    def test_non_string_verdict(self) -> None:
+        model_output = json.dumps({"1": True, "2": None, "3": [USEFUL_PAT]})
+        self.assertEqual(_extract_batch_usefulness(model_output, 3), [None, None, None])
+
+    def test_mixed_case_patterns(self) -> None:
+        model_output = json.dumps(
+            {"1": " yes USEFUL ", "2": "NOT useful", "3": "Useful, probably"}
+        )
+        self.assertEqual(
+            _extract_batch_usefulness(model_output, 3), [True, False, None]
+        )
+
+    def test_garbage_output(self) -> None:
+        for model_output in ["", "I cannot judge these", "{1: Yes useful, 2: nope"]:
+            self.assertEqual(_extract_batch_usefulness(model_output, 2), [None, None])
+
+
+class TestLlmEvalChunksBatched(unittest.TestCase):
+    def setUp(self) -> None:
+        self.llm = MagicMock()
+        self.enterContext(
+            patch.object(chunk_usefulness, "get_default_llm", return_value=self.llm)
+        )
+        self.single_chunk_calls: list[str] = []
+
+        def _llm_eval_chunk(query: str, chunk_content: str) -> bool:
+            self.single_chunk_calls.append(chunk_content)
+            return chunk_content != "chunk 3"
+
+        self.enterContext(
+            patch.object(chunk_usefulness, "llm_eval_chunk", _llm_eval_chunk)
+        )
+
+    def test_falls_back_only_for_missing_verdicts(self) -> None:
+        self.llm.invoke.return_value = json.dumps(
+            {"1": USEFUL_PAT, "2": "maybe", "4": NONUSEFUL_PAT}
+        )
+        usefulness = llm_eval_chunks_batched(
+            "query", ["chunk 1", "chunk 2", "chunk 3", "chunk 4"]
+        )
+        self.assertEqual(usefulness, [True, True, False, False])
+        self.assertEqual(sorted(self.single_chunk_calls), ["chunk 2", "chunk 3"])
+
+    def test_no_fallback_when_all_verdicts_given(self) -> None:
+        self.llm.invoke.return_value = json.dumps({"1": USEFUL_PAT, "2": NONUSEFUL_PAT})
+        usefulness = llm_eval_chunks_batched("query", ["chunk 1", "chunk 2"])
+        self.assertEqual(usefulness, [True, False])
+        self.assertEqual(self.single_chunk_calls, [])
+
+    def test_failed_batch_call_keeps_the_whole_batch(self) -> None:
+        self.llm.invoke.side_effect = TimeoutError()
+        usefulness = _run_eval_calls(
+            "query", ["chunk 1", "chunk 2", "chunk 3"], batch_size=2, use_threads=True
+        )
+        self.assertEqual(usefulness, [None, None, None])
+        self.assertEqual(self.single_chunk_calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import json
+import unittest
+from typing import Any
+
+from danswer.configs.constants import DocumentSource
+from danswer.secondary_llm_flows.query_understanding import (
+    _extract_query_understanding_from_llm_out,
+)
+
+
+def _extract(model_json: dict[str, Any]) -> Any:
+    return _extract_query_understanding_from_llm_out(
+        f"Sure, here you go:\n{json.dumps(model_json)}",
+        extract_time_filter=True,
+        extract_sources=True,
+        languages=["English", "French"],
+    )
+
+
+class TestQueryUnderstandingParsing(unittest.TestCase):
+    def test_valid_output(self) -> None:
+        understanding = _extract(
+            {
+                "time_filter": {"filter_type": "favors recent"},
+                "sources": ["slack", "not a source"],
+                "rephrased_queries": {"English": " hello ", "French": "bonjour"},
+            }
+        )
+        self.assertIsNone(understanding.time_cutoff)
+        self.assertTrue(understanding.favor_recent)
+        self.assertEqual(understanding.source_filters, [DocumentSource.SLACK])
+        self.assertEqual(understanding.rephrased_queries, ["hello", "bonjour"])
+
+    def test_malformed_time_filter(self) -> None:
+        understanding = _extract(
+            {
+                "time_filter": {"filter_type": 5},
+                "sources": ["slack"],
+                "rephrased_queries": {"English": "hello", "French": "bonjour"},
+            }
+        )
+        self.assertIsNone(understanding.time_cutoff)
+        self.assertFalse(understanding.favor_recent)
+        self.assertEqual(understanding.source_filters, [DocumentSource.SLACK])
+        self.assertEqual(understanding.rephrased_queries, ["hello", "bonjour"])
+
+    def test_sources_not_a_list(self) -> None:
+        understanding = _extract(
+            {
+                "time_filter": {"filter_type": "favors recent"},
+                "sources": "slack",
+                "rephrased_queries": {"English": "hello", "French": "bonjour"},
+            }
+        )
+        self.assertTrue(understanding.favor_recent)
+        self.assertIsNone(understanding.source_filters)
+        self.assertEqual(understanding.rephrased_queries, ["hello", "bonjour"])
+
+    def test_rephrasings_not_strings(self) -> None:
+        understanding = _extract(
+            {
+                "time_filter": {"filter_type": "favors recent"},
+                "sources": ["slack", 3],
+                "rephrased_queries": {"English": 1, "French": ["bonjour"]},
+            }
+        )
+        self.assertTrue(understanding.favor_recent)
+        self.assertEqual(understanding.source_filters, [DocumentSource.SLACK])
+        self.assertIsNone(understanding.rephrased_queries)
+
+        # Only the malformed rephrasings are dropped
+        understanding = _extract(
+            {"rephrased_queries": {"English": None, "French": "bonjour"}}
+        )
+        self.assertEqual(understanding.rephrased_queries, ["bonjour"])
+
+    def test_not_json(self) -> None:
+        understanding = _extract_query_understanding_from_llm_out(
+            "I can't help with that",
+            extract_time_filter=True,
+            extract_sources=True,
+            languages=["English"],
+        )
+        self.assertIsNone(understanding.time_cutoff)
+        self.assertFalse(understanding.favor_recent)
+        self.assertIsNone(understanding.source_filters)
+        self.assertIsNone(understanding.rephrased_queries)
+
+
+if __name__ == "__main__":
+    unittest.main()
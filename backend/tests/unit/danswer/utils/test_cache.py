@@ -0,0 +1,37 @@
+import time
+import unittest
+
+from danswer.utils.cache import TTLLRUCache
+
+
+class TestTTLLRUCache(unittest.TestCase):
+    def test_lru_eviction(self) -> None:
+        cache: TTLLRUCache[str, int] = TTLLRUCache(max_size=2, ttl_seconds=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        # Touching "a" makes "b" the least recently used entry
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats(), {"size": 2, "hits": 3, "misses": 1})
+
+    def test_ttl_expiry(self) -> None:
+        cache: TTLLRUCache[str, int] = TTLLRUCache(max_size=2, ttl_seconds=0.1)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+
+        time.sleep(0.2)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled(self) -> None:
+        cache: TTLLRUCache[str, int] = TTLLRUCache(max_size=0, ttl_seconds=60)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
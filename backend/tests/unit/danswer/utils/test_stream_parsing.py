@@ -0,0 +1,107 @@
+import string
+import unittest
+
+from danswer.utils.stream_parsing import CitationStream
+from danswer.utils.stream_parsing import JsonStringValueStream
+from danswer.utils.stream_parsing import SectionEndStream
+from danswer.utils.stream_parsing import StreamPatternMatcher
+
+
+def _stream_json_answer(tokens: list[str]) -> tuple[str, bool]:
+    answer_stream = JsonStringValueStream(
+        start=StreamPatternMatcher('{"answer":"', ignored_chars=string.whitespace)
+    )
+    answer = "".join(answer_stream.feed(token) for token in tokens)
+    return answer, answer_stream.finished
+
+
+class TestStreamParsing(unittest.TestCase):
+    def test_pattern_matcher(self) -> None:
+        matcher = StreamPatternMatcher("abab")
+        self.assertEqual(matcher.feed("aba"), -1)
+        self.assertEqual(matcher.matched_length, 3)
+        # Falls back to the "ab" matched by the end of "abaab" rather than starting over
+        self.assertEqual(matcher.feed("abx"), -1)
+        self.assertEqual(matcher.feed("ab"), -1)
+        self.assertEqual(matcher.feed("ab!"), 2)
+        self.assertTrue(matcher.found)
+
+        matcher = StreamPatternMatcher(
+            '"action":"finalanswer",', ignored_chars=" ", case_insensitive=True
+        )
+        self.assertEqual(matcher.feed('{"action": "Final '), -1)
+        self.assertEqual(matcher.feed('Answer", "'), 8)
+
+    def test_json_string_value(self) -> None:
+        tokens = ['{\n  "ans', 'wer": "', "It's ", 'a \\"dog', '\\"", "quotes": []}']
+        self.assertEqual(_stream_json_answer(tokens), ('It\'s a \\"dog\\"', True))
+
+        # Escaped backslash right before the closing quote, split across tokens
+        tokens = ['{"answer": "', "C:\\", "\\", '" }']
+        self.assertEqual(_stream_json_answer(tokens), ("C:\\\\", True))
+
+        # The rest of the token that starts the answer is not streamed
+        tokens = ['{"answer":"?', " Unknown", '"}']
+        self.assertEqual(_stream_json_answer(tokens), (" Unknown", True))
+
+        self.assertEqual(_stream_json_answer(["No json", " here"]), ("", False))
+
+    def test_json_string_value_conditions(self) -> None:
+        def _stream_final_answer(tokens: list[str]) -> str:
+            answer_stream = JsonStringValueStream(
+                start=StreamPatternMatcher(
+                    '"actioninput":"', ignored_chars=" _", case_insensitive=True
+                ),
+                conditions=[
+                    StreamPatternMatcher(
+                        '"action":"finalanswer",',
+                        ignored_chars=" ",
+                        case_insensitive=True,
+                    )
+                ],
+            )
+            return "".join(answer_stream.feed(token) for token in tokens)
+
+        tokens = ['{"action": "Final Answer",', ' "action_input": "', "Hi", '"}']
+        self.assertEqual(_stream_final_answer(tokens), "Hi")
+
+        tokens = ['{"action": "Current Search",', ' "action_input": "', "Hi", '"}']
+        self.assertEqual(_stream_final_answer(tokens), "")
+
+    def test_section_end(self) -> None:
+        section_stream = SectionEndStream(end_patterns=["\nQuote:", "\n\nQuote\n"])
+        streamed = [
+            section_stream.feed(token)
+            for token in ["The answer\n", "Quo", "te: A quote"]
+        ]
+        self.assertEqual(streamed, ["The answer", "", ""])
+        self.assertTrue(section_stream.finished)
+
+        section_stream = SectionEndStream(end_patterns=["\nQuote:"])
+        streamed = [section_stream.feed(token) for token in ["Line\nQu", "ick\nQ"]]
+        self.assertEqual(streamed, ["Line", "\nQuick"])
+        self.assertFalse(section_stream.finished)
+        self.assertEqual(section_stream.flush(), "\nQ")
+
+    def test_citations(self) -> None:
+        links: list[str | None] = ["link_1", None, "link_3"]
+
+        def _replace_citations(tokens: list[str]) -> str:
+            citation_stream = CitationStream(links)
+            return (
+                "".join(citation_stream.feed(token) for token in tokens)
+                + citation_stream.flush()
+            )
+
+        self.assertEqual(
+            _replace_citations(["See ", "[", "1", "][", "3", "]."]),
+            "See [[1]](link_1)[[3]](link_3).",
+        )
+        # No link or out of range
+        self.assertEqual(_replace_citations(["[2] [4] [0]"]), "[2] [4] [0]")
+        # Not citations
+        self.assertEqual(_replace_citations(["a[] [x] [1"]), "a[] [x] [1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import threading
+import time
+import unittest
+from collections.abc import Callable
+from typing import Any
+from unittest.mock import patch
+
+from model_server import encoders
+
+
+def _slow_batcher(**kwargs: Any) -> object:
+    # Gives the other threads time to get past the first None check
+    time.sleep(0.05)
+    return object()
+
+
+class TestBatcherSingletons(unittest.TestCase):
+    def _assert_created_once(self, get_batcher: Callable[[], Any]) -> None:
+        num_threads = 8
+        all_started = threading.Barrier(num_threads)
+        batchers: list[Any] = []
+
+        def _get() -> None:
+            all_started.wait(timeout=5)
+            batchers.append(get_batcher())
+
+        with patch.object(
+            encoders, "MicroBatcher", side_effect=_slow_batcher
+        ) as batcher_cls:
+            threads = [threading.Thread(target=_get) for _ in range(num_threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(batcher_cls.call_count, 1)
+        self.assertEqual(len(batchers), num_threads)
+        self.assertTrue(all(batcher is batchers[0] for batcher in batchers))
+
+    def test_embed_batcher_created_once(self) -> None:
+        self.enterContext(patch.object(encoders, "_EMBED_BATCHER", None))
+        self._assert_created_once(encoders.get_embed_batcher)
+
+    def test_rerank_batcher_created_once(self) -> None:
+        self.enterContext(patch.object(encoders, "_RERANK_BATCHER", None))
+        self._assert_created_once(encoders.get_rerank_batcher)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from model_server.micro_batching import BatchQueueFullError
+from model_server.micro_batching import MicroBatcher
+
+
+class _RecordingProcess:
+    """Answers every item with its own result and records the batches it was called with"""
+
+    def __init__(self) -> None:
+        self.batches: list[list[str]] = []
+
+    def __call__(self, items: list[str]) -> list[str]:
+        self.batches.append(list(items))
+        return [f"result for {item}" for item in items]
+
+
+def _submit_concurrently(
+    batcher: MicroBatcher[str, str], requests: list[list[str]]
+) -> list[list[str]]:
+    start = threading.Barrier(len(requests))
+
+    def _submit(items: list[str]) -> list[str]:
+        start.wait(timeout=5)
+        return batcher.submit(items)
+
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        return list(executor.map(_submit, requests))
+
+
+class TestMicroBatcher(unittest.TestCase):
+    def test_concurrent_callers_get_their_own_rows(self) -> None:
+        process = _RecordingProcess()
+        batcher: MicroBatcher[str, str] = MicroBatcher(
+            name="test",
+            process_batch=process,
+            max_batch_size=16,
+            max_wait_ms=50,
+            max_queue_size=100,
+        )
+        requests = [
+            [
+                f"request {request_ind} item {item_ind}"
+                for item_ind in range(1 + request_ind % 5)
+            ]
+            for request_ind in range(30)
+        ]
+        results = _submit_concurrently(batcher, requests)
+
+        self.assertEqual(
+            results,
+            [[f"result for {item}" for item in items] for items in requests],
+        )
+        # Requests were actually coalesced, without going over the batch size
+        self.assertLess(len(process.batches), len(requests))
+        self.assertTrue(all(len(batch) <= 16 for batch in process.batches))
+        self.assertEqual(
+            sorted(item for batch in process.batches for item in batch),
+            sorted(item for items in requests for item in items),
+        )
+
+    def test_flushes_once_the_batch_is_full(self) -> None:
+        process = _RecordingProcess()
+        batcher: MicroBatcher[str, str] = MicroBatcher(
+            name="test",
+            process_batch=process,
+            max_batch_size=4,
+            max_wait_ms=10_000,
+            max_queue_size=100,
+        )
+        start = time.monotonic()
+        _submit_concurrently(batcher, [[f"item {ind}"] for ind in range(4)])
+        # Does not wait out max_wait_ms
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual([len(batch) for batch in process.batches], [4])
+
+    def test_flushes_after_max_wait(self) -> None:
+        process = _RecordingProcess()
+        batcher: MicroBatcher[str, str] = MicroBatcher(
+            name="test",
+            process_batch=process,
+            max_batch_size=100,
+            max_wait_ms=200,
+            max_queue_size=100,
+        )
+        start = time.monotonic()
+        self.assertEqual(batcher.submit(["item"]), ["result for item"])
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+        self.assertEqual(process.batches, [["item"]])
+
+    def test_requests_are_not_split(self) -> None:
+        process = _RecordingProcess()
+        batcher: MicroBatcher[str, str] = MicroBatcher(
+            name="test",
+            process_batch=process,
+            max_batch_size=4,
+            max_wait_ms=200,
+            max_queue_size=100,
+        )
+        # Does not fit next to the first request, goes into the next batch
+        first_request = threading.Thread(
+            target=batcher.submit, args=(["a1", "a2", "a3"],)
+        )
+        first_request.start()
+        time.sleep(0.05)
+        self.assertEqual(
+            batcher.submit(["b1", "b2"]), ["result for b1", "result for b2"]
+        )
+        first_request.join()
+
+        # Larger than the batch size, run on its own
+        self.assertEqual(len(batcher.submit([f"c{ind}" for ind in range(6)])), 6)
+        self.assertEqual(
+            [len(batch) for batch in process.batches],
+            [3, 2, 6],
+        )
+
+    def test_failures_reach_every_caller_of_the_batch(self) -> None:
+        def _process(items: list[str]) -> list[str]:
+            if "bad" in items:
+                raise ValueError("Model failed")
+            # One result short
+            return items[1:]
+
+        batcher: MicroBatcher[str, str] = MicroBatcher(
+            name="test",
+            process_batch=_process,
+            max_batch_size=2,
+            max_wait_ms=10_000,
+            max_queue_size=100,
+        )
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                executor.submit(batcher.submit, [item]) for item in ["ok", "bad"]
+            ]
+            for future in futures:
+                with self.assertRaisesRegex(ValueError, "Model failed"):
+                    future.result()
+
+        with self.assertRaisesRegex(RuntimeError, "returned 1 results for 2 items"):
+            batcher.submit(["a", "b"])
+
+    def test_queue_full(self) -> None:
+        release = threading.Event()
+
+        def _blocking_process(items: list[str]) -> list[str]:
+            release.wait(timeout=5)
+            return items
+
+        batcher: MicroBatcher[str, str] = MicroBatcher(
+            name="test",
+            process_batch=_blocking_process,
+            max_batch_size=1,
+            max_wait_ms=0,
+            max_queue_size=1,
+        )
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            # One request being processed, one waiting in the queue
+            processing = executor.submit(batcher.submit, ["a"])
+            time.sleep(0.1)
+            queued = executor.submit(batcher.submit, ["b"])
+            time.sleep(0.1)
+            with self.assertRaises(BatchQueueFullError):
+                batcher.submit(["c"])
+            release.set()
+            self.assertEqual(processing.result(), ["a"])
+            self.assertEqual(queued.result(), ["b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
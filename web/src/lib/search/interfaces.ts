@@ -42,7 +42,7 @@ export interface DanswerDocument {
   semantic_identifier: string | null;
   boost: number;
   hidden: boolean;
-  score: number;
+  score: number | null;
   match_highlights: string[];
   updated_at: string | null;
 }
@@ -55,6 +55,11 @@ export interface DocumentInfoPacket {
   favor_recent: boolean;
 }
 
+export interface DocumentReorderPacket {
+  reordered_indices: number[];
+  scores: (number | null)[];
+}
+
 export interface LLMRelevanceFilterPacket {
   relevant_chunk_indices: number[];
 }
@@ -2,6 +2,7 @@ import {
   AnswerPiecePacket,
   DanswerDocument,
   DocumentInfoPacket,
+  DocumentReorderPacket,
   ErrorMessagePacket,
   LLMRelevanceFilterPacket,
   QueryEventIdPacket,
@@ -42,6 +43,7 @@ export const searchRequestStreamed = async ({
         filters,
         enable_auto_detect_filters: false,
         offset: offset,
+        progressive_results: true,
       }),
       headers: {
         "Content-Type": "application/json",
@@ -67,6 +69,7 @@ export const searchRequestStreamed = async ({
         | ErrorMessagePacket
         | QuotesInfoPacket
         | DocumentInfoPacket
+        | DocumentReorderPacket
         | LLMRelevanceFilterPacket
         | QueryEventIdPacket
       >(decoder.decode(value, { stream: true }), previousPartialChunk);
@@ -123,6 +126,20 @@ export const searchRequestStreamed = async ({
           return;
         }
 
+        // Documents were sent in retrieval order, this is the final order
+        if (Object.hasOwn(chunk, "reordered_indices")) {
+          const { reordered_indices, scores } = chunk as DocumentReorderPacket;
+          if (relevantDocuments) {
+            const retrievedDocuments: DanswerDocument[] = relevantDocuments;
+            relevantDocuments = reordered_indices.map((docIndex, index) => ({
+              ...retrievedDocuments[docIndex],
+              score: scores[index],
+            }));
+            updateDocs(relevantDocuments);
+          }
+          return;
+        }
+
         if (Object.hasOwn(chunk, "relevant_chunk_indices")) {
           const relevantChunkIndices = (chunk as LLMRelevanceFilterPacket)
             .relevant_chunk_indices;